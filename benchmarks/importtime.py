@@ -0,0 +1,77 @@
+""" Startup benchmark, based on `python -X importtime`.
+
+Imports each target in a fresh interpreter a few times and reports the median cumulative import
+time, along with the heavy dependencies it loaded. Those are expected to be imported lazily,
+so the script fails if any of them is loaded, or if a target takes longer than `--max-ms`.
+
+    python benchmarks/importtime.py
+    python benchmarks/importtime.py --runs 10 --max-ms 100 juryou juryou.cli
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+TARGETS = ('juryou', 'juryou.backend', 'juryou.cli')
+HEAVY_MODULES = ('weasyprint', 'jinja2', 'py3afipws', 'cryptography', 'aiohttp', 'asyncio')
+
+parser = argparse.ArgumentParser(description='Measure the import time of juryou modules')
+parser.add_argument('targets', nargs='*', default=TARGETS, help='modules to import')
+parser.add_argument('--runs', type=int, default=5, help='imports measured per target')
+parser.add_argument('--max-ms', type=float, help='fail if a target takes longer than this')
+
+
+def measure(target: str) -> Tuple[float, List[str]]:
+    """ Import `target` in a new interpreter, returning its cumulative import time in
+    milliseconds and the heavy modules it imported.
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {target}'],
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    cumulative: Dict[str, int] = {}
+
+    # lines look like "import time:   self [us] | cumulative | imported package"
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or line.endswith('imported package'):
+            continue
+
+        _, total, name = line[len('import time:'):].split('|')
+        cumulative[name.strip()] = int(total)
+
+    heavy = [name for name in HEAVY_MODULES if name in cumulative]
+
+    return cumulative[target] / 1000, heavy
+
+
+def main() -> int:
+    args = parser.parse_args()
+    failed = False
+
+    for target in args.targets:
+        times = []
+        heavy: List[str] = []
+
+        for _ in range(args.runs):
+            elapsed, heavy = measure(target)
+            times.append(elapsed)
+
+        median = statistics.median(times)
+        print(f'{target:<20} {median:8.1f} ms  (min {min(times):.1f}, max {max(times):.1f})')
+
+        if heavy:
+            print(f'  imports {", ".join(heavy)}')
+            failed = True
+
+        if args.max_ms is not None and median > args.max_ms:
+            print(f'  slower than {args.max_ms:g} ms')
+            failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
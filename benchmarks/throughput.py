@@ -0,0 +1,347 @@
+""" Throughput benchmark, against a local stand-in for the AFIP web services.
+
+Starts `juryou.fake_afip.FakeAFIP` and times the backend operations making real SOAP requests to
+it, then printing receipts. Reports the receipts handled per second by each operation, along with
+the median (p50) and p99 latency of its calls.
+
+Results can be saved and used as the baseline of a later run, which fails if any operation got
+slower than the baseline by more than `--tolerance`:
+
+    python benchmarks/throughput.py --save baseline.json
+    python benchmarks/throughput.py --baseline baseline.json --tolerance 0.2
+    python benchmarks/throughput.py --backend async --receipts 1000 --latency 0.05
+
+With `--metrics`, the time spent in each phase (login, connect, every request, render, layout...)
+is also printed, in the Prometheus text format.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Awaitable, Callable, Dict, List
+
+import httplib2
+
+import juryou
+from juryou import metrics
+from juryou.backend import MemoryCredentialStore, WSDLCache
+from juryou.fake_afip import FakeAFIP
+from juryou.printer import Printer
+
+SYNC_BACKEND = 'sync'
+ASYNC_BACKEND = 'async'
+POINT_OF_SALE = 1
+CUIT = '20111111112'
+FETCH_LAST_COUNT = 10
+
+parser = argparse.ArgumentParser(description='Measure the throughput of juryou against a fake AFIP')
+parser.add_argument('--backend', choices=(SYNC_BACKEND, ASYNC_BACKEND), default=SYNC_BACKEND)
+parser.add_argument('--receipts', type=int, default=200, help='receipts committed and fetched')
+parser.add_argument('--chunk-size', type=int, default=50, help='receipts per commit_many call')
+parser.add_argument('--logins', type=int, default=20, help='authentications measured')
+parser.add_argument('--prints', type=int, default=20, help='receipts printed')
+parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+parser.add_argument('--fault-rate', type=float, default=0.0, help='fraction of requests faulted')
+parser.add_argument('--drop-rate', type=float, default=0.0, help='fraction of responses dropped')
+parser.add_argument('--seed', type=int, default=0, help='seed for the random failures')
+parser.add_argument('--save', help='write the results as json to this file')
+parser.add_argument('--baseline', help='compare against results saved with --save')
+parser.add_argument('--tolerance', type=float, default=0.2, help='allowed throughput loss')
+parser.add_argument('--metrics', action='store_true', help='print the time spent in each phase')
+
+
+class Measurement:
+    """ Latencies of the calls made to an operation, and how many receipts they handled. """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.latencies: List[float] = []
+        self.receipts = 0
+
+    def add(self, latency: float, receipts: int = 1) -> None:
+        self.latencies.append(latency)
+        self.receipts += receipts
+
+    @property
+    def rate(self) -> float:
+        elapsed = sum(self.latencies)
+
+        return self.receipts / elapsed if elapsed else math.inf
+
+    def percentile(self, percent: float) -> float:
+        """ Nearest-rank percentile of the latencies, in seconds. """
+        latencies = sorted(self.latencies)
+        rank = math.ceil(percent / 100 * len(latencies))
+
+        return latencies[max(rank, 1) - 1]
+
+    def as_dict(self) -> dict:
+        return {
+            'calls': len(self.latencies),
+            'receipts': self.receipts,
+            'rate': self.rate,
+            'p50': self.percentile(50),
+            'p99': self.percentile(99),
+        }
+
+
+def timed(measurement: Measurement, function: Callable, receipts: int = 1):
+    start = time.perf_counter()
+    result = function()
+    measurement.add(time.perf_counter() - start, receipts)
+
+    return result
+
+
+async def timed_async(
+    measurement: Measurement,
+    function: Callable[[], Awaitable],
+    receipts: int = 1,
+):
+    start = time.perf_counter()
+    result = await function()
+    measurement.add(time.perf_counter() - start, receipts)
+
+    return result
+
+
+def create_credentials():
+    """ A throwaway certificate and key, the fake WSAA doesn't check the signature. """
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    from cryptography.x509.oid import NameOID
+
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'juryou')])
+    certificate = x509.CertificateBuilder().subject_name(
+        name,
+    ).issuer_name(
+        name,
+    ).public_key(
+        private_key.public_key(),
+    ).serial_number(
+        x509.random_serial_number(),
+    ).not_valid_before(
+        datetime.utcnow(),
+    ).not_valid_after(
+        datetime.utcnow() + timedelta(days=1),
+    ).sign(private_key, hashes.SHA256())
+
+    return (
+        certificate.public_bytes(serialization.Encoding.PEM).decode('latin1'),
+        private_key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.TraditionalOpenSSL,
+            serialization.NoEncryption(),
+        ).decode('latin1'),
+    )
+
+
+def create_receipts(backend, count: int) -> List[juryou.Receipt]:
+    company = juryou.Company(
+        'Benchmark',
+        'Fake address 123',
+        CUIT,
+        'Exento',
+        'Sujeto IVA Exento',
+        datetime(2020, 1, 1),
+    )
+    receipts = []
+
+    for index in range(count):
+        customer = juryou.Customer(str(30000000 + index), f'Customer {index}')
+        receipt = juryou.Receipt(company, customer, POINT_OF_SALE, backend)
+        receipt.add_item('Item', 1 + index % 3, Decimal('100.50'))
+        receipts.append(receipt)
+
+    return receipts
+
+
+def identifier(receipt: juryou.Receipt) -> str:
+    return f'{receipt.point_of_sale}:{receipt.type}:{receipt.number}'
+
+
+def run_sync(server: FakeAFIP, args, wsdl_cache: str) -> List[Measurement]:
+    certificate, private_key = create_credentials()
+    backend = juryou.AFIPBackend(
+        certificate,
+        private_key,
+        CUIT,
+        cache=WSDLCache(wsdl_cache),
+        credential_store=MemoryCredentialStore(),
+        refresh_credentials=False,
+    )
+    backend.wsaa_url = server.wsaa_wsdl_url
+    backend.wsfev1_url = server.wsfev1_wsdl_url
+    authenticate = Measurement('authenticate')
+    commit = Measurement('commit')
+    commit_many = Measurement('commit_many')
+    fetch = Measurement('fetch')
+    fetch_last = Measurement('fetch_last')
+
+    # the first login also downloads and parses the service descriptions
+    backend._get_client()
+
+    for _ in range(args.logins):
+        backend.credentials = {}
+        timed(authenticate, backend._authenticate)
+
+    receipts = create_receipts(backend, args.receipts)
+
+    for receipt in receipts:
+        timed(commit, lambda: backend.commit(receipt))
+
+    for chunk_start in range(0, args.receipts, args.chunk_size):
+        chunk = create_receipts(backend, min(args.chunk_size, args.receipts - chunk_start))
+        timed(commit_many, lambda: backend.commit_many(chunk), len(chunk))
+
+    for receipt in receipts:
+        timed(fetch, lambda: backend.fetch(identifier(receipt)))
+
+    for _ in range(max(args.receipts // FETCH_LAST_COUNT, 1)):
+        timed(
+            fetch_last,
+            lambda: backend.fetch_last(f'{POINT_OF_SALE}:{receipts[0].type}', FETCH_LAST_COUNT),
+            FETCH_LAST_COUNT,
+        )
+
+    return [authenticate, commit, commit_many, fetch, fetch_last]
+
+
+async def run_async(server: FakeAFIP, args) -> List[Measurement]:
+    from juryou.backend.afip_async import AsyncAFIPBackend
+
+    certificate, private_key = create_credentials()
+    authenticate = Measurement('authenticate')
+    commit = Measurement('commit')
+    commit_many = Measurement('commit_many')
+    fetch = Measurement('fetch')
+    fetch_last = Measurement('fetch_last')
+
+    async with AsyncAFIPBackend(
+        certificate,
+        private_key,
+        CUIT,
+        credential_store=MemoryCredentialStore(),
+    ) as backend:
+        backend.wsaa_url = server.wsaa_url
+        backend.wsfev1_url = server.wsfev1_url
+
+        for _ in range(args.logins):
+            backend.credentials = {}
+            await timed_async(authenticate, backend.authenticate)
+
+        receipts = create_receipts(backend, args.receipts)
+
+        for receipt in receipts:
+            await timed_async(commit, lambda: backend.commit(receipt))
+
+        for chunk_start in range(0, args.receipts, args.chunk_size):
+            chunk = create_receipts(backend, min(args.chunk_size, args.receipts - chunk_start))
+            await timed_async(commit_many, lambda: backend.commit_many(chunk), len(chunk))
+
+        for receipt in receipts:
+            await timed_async(fetch, lambda: backend.fetch(identifier(receipt)))
+
+        for _ in range(max(args.receipts // FETCH_LAST_COUNT, 1)):
+            await timed_async(
+                fetch_last,
+                lambda: backend.fetch_last(
+                    f'{POINT_OF_SALE}:{receipts[0].type}',
+                    FETCH_LAST_COUNT,
+                ),
+                FETCH_LAST_COUNT,
+            )
+
+    return [authenticate, commit, commit_many, fetch, fetch_last]
+
+
+def run_print(args) -> Measurement:
+    printer = Printer()
+    measurement = Measurement('print')
+    receipts = create_receipts(None, args.prints)
+
+    for number, receipt in enumerate(receipts, 1):
+        receipt.number = number
+        receipt.cae = str(71000000000000 + number)
+        receipt.cae_expiration = datetime.now() + timedelta(days=10)
+
+    # the first receipt loads the templates and fonts
+    printer.print(receipts[0])
+
+    for receipt in receipts:
+        timed(measurement, lambda: printer.print(receipt))
+
+    return measurement
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) -> List[str]:
+    """ The operations whose throughput is below the baseline's by more than `tolerance`. """
+    return [
+        name
+        for name, result in results.items()
+        if name in baseline and result['rate'] < baseline[name]['rate'] * (1 - tolerance)
+    ]
+
+
+def main() -> int:
+    args = parser.parse_args()
+    # py3afipws logs every request and response as a warning
+    logging.disable(logging.WARNING)
+    collector = metrics.PrometheusCollector() if args.metrics else None
+    metrics.set_collector(collector)
+
+    with FakeAFIP(args.latency, args.fault_rate, args.drop_rate, args.seed) as server:
+        if args.backend == SYNC_BACKEND:
+            # py3simplesoap verifies certificates against httplib2's bundle, whatever it's told
+            httplib2.CA_CERTS = server.certificate_path
+
+            with tempfile.TemporaryDirectory() as wsdl_cache:
+                measurements = run_sync(server, args, wsdl_cache)
+        else:
+            measurements = asyncio.get_event_loop().run_until_complete(run_async(server, args))
+
+        requests = dict(server.requests)
+
+    measurements.append(run_print(args))
+    results = {measurement.name: measurement.as_dict() for measurement in measurements}
+
+    print(f'{"operation":<14} {"receipts/s":>12} {"p50 ms":>10} {"p99 ms":>10}')
+
+    for name, result in results.items():
+        print(
+            f'{name:<14} {result["rate"]:12.1f} '
+            f'{result["p50"] * 1000:10.2f} {result["p99"] * 1000:10.2f}',
+        )
+
+    print('requests: ' + ', '.join(f'{name} {count}' for name, count in sorted(requests.items())))
+
+    if collector is not None:
+        print(collector.expose(), end='')
+
+    if args.save:
+        with open(args.save, 'w') as results_file:
+            json.dump(results, results_file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, 'r') as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.tolerance)
+
+        for name in regressions:
+            print(f'  {name} is more than {args.tolerance:.0%} slower than the baseline')
+
+        if regressions:
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,6 +1,36 @@
-from .receipt import Receipt
-from .company import Company
-from .customer import Customer
-from .backend import AFIPBackend
+""" Public names are imported on first use (PEP 562), so importing a single one, like
+`AFIPBackend`, doesn't load the rest of the package.
+"""
+import importlib
+from typing import TYPE_CHECKING, Any, List
 
-__all__ = ['Receipt', 'Company', 'Customer', 'AFIPBackend']
+if TYPE_CHECKING:
+    from .receipt import Receipt
+    from .company import Company
+    from .customer import Customer
+    from .batch import ReceiptBatch
+    from .backend import AFIPBackend
+
+EXPORTS = {
+    'Receipt': 'receipt',
+    'Company': 'company',
+    'Customer': 'customer',
+    'ReceiptBatch': 'batch',
+    'AFIPBackend': 'backend',
+}
+
+__all__ = ['Receipt', 'Company', 'Customer', 'ReceiptBatch', 'AFIPBackend']
+
+
+def __getattr__(name: str) -> Any:
+    if name not in EXPORTS:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+    value = getattr(importlib.import_module(f'.{EXPORTS[name]}', __name__), name)
+    globals()[name] = value
+
+    return value
+
+
+def __dir__() -> List[str]:
+    return sorted(set(globals()) | set(__all__))
@@ -1,4 +1,38 @@
 from .base import BaseBackend
 from .afip import AFIPBackend
+from .caea import CAEABackend, CAEAJournal, CAEAReporter
+from .cache import BaseReceiptCache, MemoryReceiptCache, SQLiteReceiptCache
+from .credentials import (
+    BaseCredentialStore,
+    MemoryCredentialStore,
+    FileCredentialStore,
+    SQLiteCredentialStore,
+)
+from .outbox import Outbox, BaseOutboxStore, MemoryOutboxStore, SQLiteOutboxStore
+from .registry import BackendRegistry
+from .sequencer import BaseSequencer, MemorySequencer, FileSequencer
+from .wsdl import WSDLCache
 
-__all__ = ['BaseBackend', 'AFIPBackend']
+__all__ = [
+    'BaseBackend',
+    'AFIPBackend',
+    'CAEABackend',
+    'CAEAJournal',
+    'CAEAReporter',
+    'BaseReceiptCache',
+    'MemoryReceiptCache',
+    'SQLiteReceiptCache',
+    'BaseCredentialStore',
+    'MemoryCredentialStore',
+    'FileCredentialStore',
+    'SQLiteCredentialStore',
+    'Outbox',
+    'BaseOutboxStore',
+    'MemoryOutboxStore',
+    'SQLiteOutboxStore',
+    'BackendRegistry',
+    'BaseSequencer',
+    'MemorySequencer',
+    'FileSequencer',
+    'WSDLCache',
+]
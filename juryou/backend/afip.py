@@ -1,10 +1,38 @@
-from typing import Optional
+import functools
+import logging
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 from datetime import datetime, timezone
-from py3afipws import wsaa, wsfev1
-from juryou import receipt, company, customer, utils
+from decimal import Decimal
+from juryou import metrics, receipt, company, customer, utils
+from . import soap
 from .base import BaseBackend
-
+from .cache import BaseReceiptCache
+from .credentials import (
+    BaseCredentialStore,
+    CredentialsKey,
+    Ticket,
+    default_store as default_credential_store,
+)
+from .pool import ClientPool
+from .resilience import CircuitBreaker, RetryPolicy, call, guard
+from .sequencer import BaseSequencer, MemorySequencer, Sequence
+from .signer import TRASigner
+from .wsdl import WSDLCache
+
+logger = logging.getLogger(__name__)
+
+# py3afipws pulls in its SOAP and crypto stack, it's only imported once a request is made
+wsaa = utils.lazy_import('py3afipws.wsaa')
+wsfev1 = utils.lazy_import('py3afipws.wsfev1')
+httplib2 = utils.lazy_import('httplib2')
+
+WSAA_TESTING_URL = 'https://wsaahomo.afip.gov.ar/ws/services/LoginCms?wsdl'
 WSAA_PRODUCTION_URL = 'https://wsaa.afip.gov.ar/ws/services/LoginCms?wsdl'
+WSFEV1_TESTING_URL = 'https://wswhomo.afip.gov.ar/wsfev1/service.asmx?WSDL'
 WSFEV1_PRODUCTION_URL = 'https://servicios1.afip.gov.ar/wsfev1/service.asmx?WSDL'
 
 
@@ -20,13 +48,64 @@ class WrongIdentifier(Exception):
     pass
 
 
-class AFIPBackend(BaseBackend):
+class AFIPServiceError(Exception):
+    def __init__(self, errors: List[str]):
+        super().__init__('; '.join(errors))
+        self.errors = errors
+
+
+class ReceiptNotFoundError(AFIPServiceError):
+    pass
+
+
+class AmbiguousCommitError(Exception):
+    """ A request for a CAE failed in a way that AFIP may have authorized it, and whether it did
+    couldn't be checked. The receipt's number may be taken, so its sequence is reloaded from AFIP
+    and the receipt should be looked up (`fetch`) before committing it again.
+    """
+
+    def __init__(self, receipt: 'receipt.Receipt', invoice_number: int):
+        super().__init__(
+            f'Could not tell whether invoice {receipt.point_of_sale}:{receipt.type}:'
+            f'{invoice_number} was authorized',
+        )
+        self.receipt = receipt
+        self.invoice_number = invoice_number
+
+
+class NumberTakenError(AmbiguousCommitError):
+    """ AFIP confirmed the number a request was made with belongs to another receipt, so the
+    request didn't authorize this one.
+    """
+
+    pass
+
+
+class BaseAFIPBackend(BaseBackend):
+    """ State and helpers shared by the blocking and the asyncio WSFEv1 backends. """
+
+    SERVICE = 'wsfe'
     TRA_TTL = 36000
     TOKEN_CACHE_KEY = 'TOKEN'
     SIGN_CACHE_KEY = 'SIGN'
     EXPIRATION_CACHE_KEY = 'EXPIRATION'
     EXPIRATION_DATE_FORMAT = '%Y-%m-%dT%H:%M:%S.%f%z'
     WSFEV1_DATE_FORMAT = '%Y%m%d'
+    MAX_RECEIPTS_PER_REQUEST = 250
+    APPROVED_RESULT = 'A'
+    REJECTED_RESULT = 'R'
+    OUT_OF_SEQUENCE_ERROR = '10016'
+    NOT_FOUND_ERROR = '602'
+    FETCH_WORKERS = 8
+    FETCHED_FIELDS = (
+        'nro_doc',
+        'fecha_cbte',
+        'tipo_cbte',
+        'concepto',
+        'imp_total',
+        'cae',
+        'fch_venc_cae',
+    )
 
     def __init__(
         self,
@@ -35,14 +114,31 @@ class AFIPBackend(BaseBackend):
         cuit: str,
         credentials: Optional[dict] = None,
         production: bool = False,
-        cache: Optional[str] = None,
+        sequencer: Optional[BaseSequencer] = None,
+        receipt_cache: Optional[BaseReceiptCache] = None,
+        credential_store: Optional[BaseCredentialStore] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        circuit_breaker: Optional[CircuitBreaker] = None,
     ):
         self.certificate = certificate
         self.private_key = private_key
         self.cuit = cuit
-        self.credentials = {**credentials} if credentials is not None else {}
         self.production = production
-        self.cache = cache
+        self.sequencer = sequencer if sequencer is not None else MemorySequencer()
+        self.receipt_cache = receipt_cache
+        self.credential_store = (
+            credential_store if credential_store is not None else default_credential_store
+        )
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.circuit_breaker = (
+            circuit_breaker if circuit_breaker is not None else CircuitBreaker()
+        )
+        self._ticket: Optional[Ticket] = None
+        self._signer: Optional[TRASigner] = None
+        self._signer_lock = threading.Lock()
+
+        if credentials:
+            self.credentials = credentials
 
     def validate_receipt(self, receipt: 'receipt.Receipt') -> None:
         if not receipt.customer.name or not receipt.customer.identity_document:
@@ -51,39 +147,51 @@ class AFIPBackend(BaseBackend):
         if not receipt.total:
             raise EmptyInvoiceError()
 
-    def commit(self, receipt: 'receipt.Receipt') -> 'receipt.Receipt':
-        self.validate_receipt(receipt)
-        client = self._get_client()
-        invoice_number = int(client.CompUltimoAutorizado(
-            receipt.type,
-            receipt.point_of_sale,
-        )) + 1
+    def _is_out_of_sequence(self, errors: List[str]) -> bool:
+        return self._has_error(errors, self.OUT_OF_SEQUENCE_ERROR)
 
-        formatted_invoice_date = receipt.date.strftime(self.WSFEV1_DATE_FORMAT)
-        formatted_total = str(utils.quantize_decimal(receipt.total))
+    def _has_error(self, errors: List[str], code: str) -> bool:
+        return any(error.split(':')[0].strip() == code for error in errors)
 
-        client.CrearFactura(
-            concepto=receipt.concept,
-            tipo_doc=receipt.customer.identity_document_type,
-            nro_doc=receipt.customer.identity_document,
-            tipo_cbte=receipt.type,
-            punto_vta=receipt.point_of_sale,
-            cbt_desde=invoice_number,
-            cbt_hasta=invoice_number,
-            imp_total=formatted_total,
-            imp_neto=formatted_total,
-            fecha_cbte=formatted_invoice_date,
-        )
-        client.CAESolicitar()
+    def _service_error(self, errors: List[str]) -> AFIPServiceError:
+        if self._has_error(errors, self.NOT_FOUND_ERROR):
+            return ReceiptNotFoundError(errors)
 
-        receipt.number = invoice_number
-        receipt.cae = client.CAE
-        receipt.cae_expiration = datetime.strptime(
-            client.Vencimiento,
-            self.WSFEV1_DATE_FORMAT,
+        return AFIPServiceError(errors)
+
+    def _count_errors(self, operation: str, errors: List[str]) -> None:
+        for error in errors:
+            metrics.count('afip.errors', operation=operation, code=error.split(':')[0].strip())
+
+    def _count_result(self, receipt: 'receipt.Receipt') -> None:
+        metrics.count('afip.receipts', result='rejected' if receipt.errors else 'authorized')
+
+    def _matches(self, receipt: 'receipt.Receipt', receipt_data: dict) -> bool:
+        """ Whether the fetched `receipt_data` is the one requested for `receipt`. """
+        return (
+            int(receipt_data['nro_doc']) == int(receipt.customer.identity_document)
+            and Decimal(str(receipt_data['imp_total'])) == utils.quantize_decimal(receipt.total)
         )
 
-        return receipt
+    def _invoice_detail(self, receipt: 'receipt.Receipt', invoice_number: int) -> dict:
+        formatted_total = str(utils.quantize_decimal(receipt.total))
+
+        return {
+            'Concepto': receipt.concept,
+            'DocTipo': receipt.customer.identity_document_type,
+            'DocNro': receipt.customer.identity_document,
+            'CbteDesde': invoice_number,
+            'CbteHasta': invoice_number,
+            'CbteFch': receipt.date.strftime(self.WSFEV1_DATE_FORMAT),
+            'ImpTotal': formatted_total,
+            'ImpTotConc': '0.00',
+            'ImpNeto': formatted_total,
+            'ImpOpEx': '0.00',
+            'ImpTrib': '0.00',
+            'ImpIVA': '0.00',
+            'MonId': 'PES',
+            'MonCotiz': '1.000',
+        }
 
     def _parse_identifier(self, identifier: str):
         try:
@@ -93,82 +201,756 @@ class AFIPBackend(BaseBackend):
         except ValueError:
             raise WrongIdentifier(identifier)
 
-    def fetch(self, identifier: str):
-        (point_of_sale, invoice_type, invoice_number) = self._parse_identifier(identifier)
-
-        client = self._get_client()
-        client.CompConsultar(invoice_type, point_of_sale, invoice_number)
-
+    def _build_receipt(
+        self,
+        point_of_sale: int,
+        invoice_number: int,
+        receipt_data: dict,
+    ) -> 'receipt.Receipt':
         receipt_company = company.DummyCompany()
-        receipt_customer = customer.Customer(client.factura['nro_doc'], '')
+        receipt_customer = customer.Customer(receipt_data['nro_doc'], '')
         fetched_receipt = receipt.Receipt(
             receipt_company,
             receipt_customer,
             point_of_sale,
             self,
-            datetime.strptime(client.factura['fecha_cbte'], self.WSFEV1_DATE_FORMAT),
-            client.factura['tipo_cbte'],
-            client.factura['concepto'],
+            datetime.strptime(receipt_data['fecha_cbte'], self.WSFEV1_DATE_FORMAT),
+            receipt_data['tipo_cbte'],
+            receipt_data['concepto'],
         )
-        fetched_receipt.add_item('Item', 1, client.factura['imp_total'])
+        fetched_receipt.add_item('Item', 1, Decimal(str(receipt_data['imp_total'])))
         fetched_receipt.number = invoice_number
-        fetched_receipt.cae = client.factura['cae']
+        fetched_receipt.cae = receipt_data['cae']
         fetched_receipt.cae_expiration = datetime.strptime(
-            client.factura['fch_venc_cae'],
+            receipt_data['fch_venc_cae'],
             self.WSFEV1_DATE_FORMAT,
         )
 
         return fetched_receipt
 
-    def fetch_last(self, identifier: str, count: int = 1):
-        (point_of_sale, invoice_type, _) = self._parse_identifier(identifier + ':0')
+    @property
+    def credentials_key(self) -> CredentialsKey:
+        return self.cuit, self.SERVICE, self.production
+
+    @property
+    def credentials(self) -> dict:
+        return self.credential_store.get(self.credentials_key) or {}
+
+    @credentials.setter
+    def credentials(self, credentials: dict) -> None:
+        self.credential_store.set(self.credentials_key, credentials)
+        self._ticket = None
+
+    @property
+    def signer(self) -> TRASigner:
+        with self._signer_lock:
+            if self._signer is None:
+                self._signer = TRASigner(self.certificate, self.private_key)
+
+        return self._signer
+
+    def _parse_ticket(self, credentials: dict) -> Optional[Ticket]:
+        if self.TOKEN_CACHE_KEY not in credentials or self.SIGN_CACHE_KEY not in credentials:
+            return None
+
+        expiration = None
+
+        if self.EXPIRATION_CACHE_KEY in credentials:
+            expiration = datetime.strptime(
+                credentials[self.EXPIRATION_CACHE_KEY],
+                self.EXPIRATION_DATE_FORMAT,
+            )
+
+        return Ticket(
+            credentials[self.TOKEN_CACHE_KEY],
+            credentials[self.SIGN_CACHE_KEY],
+            expiration,
+        )
+
+
+class AFIPBackend(BaseAFIPBackend):
+    """ WSFEv1 backend built on py3afipws.
+
+    Every request is made with a `timeout` and through `circuit_breaker`, transient failures
+    are retried as `retry_policy` says. Requests for a CAE aren't blindly retried though, AFIP
+    may have authorized them before failing: the invoice number is looked up first, and only
+    requested again if it wasn't taken.
+
+    With `refresh_credentials`, the WSAA ticket is renewed from a background timer as soon as
+    it expires, until the backend is closed or garbage collected.
+    """
+
+    REFRESH_DELAY = 1
+    TIMEOUT = 30
+
+    def __init__(
+        self,
+        certificate: str,
+        private_key: str,
+        cuit: str,
+        credentials: Optional[dict] = None,
+        production: bool = False,
+        cache: Union[WSDLCache, str, None] = None,
+        sequencer: Optional[BaseSequencer] = None,
+        receipt_cache: Optional[BaseReceiptCache] = None,
+        credential_store: Optional[BaseCredentialStore] = None,
+        refresh_credentials: bool = False,
+        timeout: float = TIMEOUT,
+        retry_policy: Optional[RetryPolicy] = None,
+        circuit_breaker: Optional[CircuitBreaker] = None,
+    ):
+        self.cache = cache if isinstance(cache, WSDLCache) else WSDLCache(cache)
+        self.timeout = timeout
+        self.refresh_credentials = refresh_credentials
+        self._refresh_lock = threading.Lock()
+        self._refresh_timer: Optional[threading.Timer] = None
+        self._refresh_finalizer: Optional[weakref.finalize] = None
+        self._refresh_expiration: Optional[datetime] = None
+        self._closed = False
+        self._clients = ClientPool(self._connect)
+        # clients are kept per thread, so fetches run on the same threads every time
+        self._executors: Dict[int, ThreadPoolExecutor] = {}
+        self._executors_lock = threading.Lock()
+        super().__init__(
+            certificate,
+            private_key,
+            cuit,
+            credentials,
+            production,
+            sequencer,
+            receipt_cache,
+            credential_store,
+            retry_policy,
+            circuit_breaker,
+        )
+        self.wsaa_url = WSAA_PRODUCTION_URL if self.production else WSAA_TESTING_URL
+        self.wsfev1_url = WSFEV1_PRODUCTION_URL if self.production else WSFEV1_TESTING_URL
+
+    def commit(
+        self,
+        receipt: 'receipt.Receipt',
+        on_number: Optional[Callable[[int], None]] = None,
+    ) -> 'receipt.Receipt':
+        """ Request a CAE for `receipt`, `on_number` is called with the invoice number before
+        each request, to record which number the receipt may have been authorized with.
+        """
+        self.validate_receipt(receipt)
         client = self._get_client()
-        last_invoice_number = int(client.CompUltimoAutorizado(invoice_type, point_of_sale))
-        receipts = []
 
-        for i in range(0, count):
-            invoice_id = f'{identifier}:{last_invoice_number - i}'
-            receipt = self.fetch(invoice_id)
+        with self._reserve(client, receipt.point_of_sale, receipt.type) as sequence:
+            errors = self._request_cae(client, receipt, sequence.next, on_number)
 
-            receipts.append(receipt)
+            if self._is_out_of_sequence(errors):
+                sequence.resync()
+                errors = self._request_cae(client, receipt, sequence.next, on_number)
+
+            receipt.errors = errors
+            self._count_result(receipt)
+
+            if errors:
+                return receipt
+
+            sequence.advance()
+            receipt.number = sequence.last
 
         return receipt
 
-    def _authenticate(self):
-        if self.EXPIRATION_CACHE_KEY in self.credentials and (
-            datetime.strptime(
-                self.credentials[self.EXPIRATION_CACHE_KEY],
-                self.EXPIRATION_DATE_FORMAT,
-            ) < datetime.now(timezone.utc)
-        ):
-            self.credentials = {}
-
-        if self.TOKEN_CACHE_KEY not in self.credentials \
-                or self.SIGN_CACHE_KEY not in self.credentials:
-            wsdl = WSAA_PRODUCTION_URL if self.production else None
-            wsaa_client = wsaa.WSAA()
-
-            tra = wsaa_client.CreateTRA('wsfe', ttl=self.TRA_TTL)
-            cms = wsaa_client.SignTRA(tra, self.certificate, self.private_key)
-
-            wsaa_client.Conectar(wsdl=wsdl, cache=self.cache)
-            wsaa_client.LoginCMS(cms)
-            self.credentials[self.TOKEN_CACHE_KEY] = wsaa_client.Token
-            self.credentials[self.SIGN_CACHE_KEY] = wsaa_client.Sign
-            self.credentials[self.EXPIRATION_CACHE_KEY] = wsaa_client.ObtenerTagXml(
-                'expirationTime',
+    def commit_many(
+        self,
+        receipts: Iterable['receipt.Receipt'],
+        on_number: Optional[Callable[['receipt.Receipt', int], None]] = None,
+    ) -> List['receipt.Receipt']:
+        """ Request a CAE for each of `receipts`, in as few requests as possible. `on_number` is
+        called with each receipt and its invoice number before every request, as in `commit`.
+        """
+        receipts = list(receipts)
+
+        for pending_receipt in receipts:
+            self.validate_receipt(pending_receipt)
+
+        groups: Dict[Tuple[int, int], List['receipt.Receipt']] = {}
+
+        for pending_receipt in receipts:
+            key = (pending_receipt.point_of_sale, pending_receipt.type)
+            groups.setdefault(key, []).append(pending_receipt)
+
+        client = self._get_client()
+
+        for (point_of_sale, invoice_type), group in groups.items():
+            with self._reserve(client, point_of_sale, invoice_type) as sequence:
+                for chunk in utils.chunks(group, self.MAX_RECEIPTS_PER_REQUEST):
+                    self._commit_chunk(client, chunk, sequence, on_number)
+
+        for committed_receipt in receipts:
+            self._count_result(committed_receipt)
+
+        return receipts
+
+    def recover(self, receipt: 'receipt.Receipt', invoice_number: int) -> bool:
+        """ Check whether a request of unknown outcome authorized `receipt` with
+        `invoice_number`, setting its number and CAE if it did.
+
+        Raises `NumberTakenError` if the number was authorized for another receipt, and
+        `AmbiguousCommitError` if AFIP couldn't tell.
+        """
+        if not self._recover(self._get_client(), receipt, invoice_number):
+            return False
+
+        receipt.number = invoice_number
+        receipt.errors = []
+
+        return True
+
+    def _reserve(self, client, point_of_sale: int, invoice_type: int):
+        return self.sequencer.reserve(
+            (self.cuit, point_of_sale, invoice_type),
+            lambda: self._last_authorized(client, point_of_sale, invoice_type),
+        )
+
+    def _request_cae(
+        self,
+        client,
+        receipt: 'receipt.Receipt',
+        invoice_number: int,
+        on_number: Optional[Callable[[int], None]] = None,
+    ) -> List[str]:
+        attempt = 1
+
+        if on_number is not None:
+            on_number(invoice_number)
+
+        while True:
+            self._create_invoice(client, receipt, invoice_number)
+
+            try:
+                guard(
+                    self._reveal_fault(client, self._timed('FECAESolicitar', client.CAESolicitar)),
+                    self.circuit_breaker,
+                    self._is_lost_request,
+                )
+                break
+            except Exception as error:
+                if not self._is_lost_request(error):
+                    raise
+
+                if self._recover(client, receipt, invoice_number):
+                    return []
+
+                if attempt >= self.retry_policy.attempts:
+                    raise
+
+            time.sleep(self.retry_policy.delay(attempt))
+            attempt += 1
+
+        if client.Resultado == self.REJECTED_RESULT:
+            errors = list(client.Errores) + list(client.Observaciones)
+            self._count_errors('FECAESolicitar', errors)
+
+            return errors
+
+        receipt.cae = client.CAE
+        receipt.cae_expiration = datetime.strptime(
+            client.Vencimiento,
+            self.WSFEV1_DATE_FORMAT,
+        )
+
+        return []
+
+    def _recover(self, client, receipt: 'receipt.Receipt', invoice_number: int) -> bool:
+        """ Check whether a failed request authorized `receipt` with `invoice_number`, keeping
+        its CAE if it did.
+        """
+        try:
+            self._request(
+                'FECompConsultar',
+                client.CompConsultar,
+                receipt.type,
+                receipt.point_of_sale,
+                invoice_number,
             )
+        except Exception as error:
+            raise AmbiguousCommitError(receipt, invoice_number) from error
+
+        errors = list(client.Errores)
+
+        if self._has_error(errors, self.NOT_FOUND_ERROR):
+            return False
+
+        if errors:
+            raise AmbiguousCommitError(receipt, invoice_number)
+
+        receipt_data = {field: client.factura[field] for field in self.FETCHED_FIELDS}
 
-        return self.credentials[self.TOKEN_CACHE_KEY], self.credentials[self.SIGN_CACHE_KEY]
+        # the number was taken by another receipt, the local sequence can't be trusted
+        if not self._matches(receipt, receipt_data):
+            raise NumberTakenError(receipt, invoice_number)
+
+        logger.info('Recovered the CAE of invoice %s after a failed request', invoice_number)
+        receipt.cae = receipt_data['cae']
+        receipt.cae_expiration = datetime.strptime(
+            receipt_data['fch_venc_cae'],
+            self.WSFEV1_DATE_FORMAT,
+        )
+
+        return True
+
+    def _recover_chunk(
+        self,
+        client,
+        chunk: List['receipt.Receipt'],
+        sequence: Sequence,
+    ) -> List['receipt.Receipt']:
+        """ Recover the receipts of a failed request, in order, returning those which weren't
+        authorized.
+        """
+        for offset, pending_receipt in enumerate(chunk):
+            if not self._recover(client, pending_receipt, sequence.next):
+                return chunk[offset:]
+
+            sequence.advance()
+            pending_receipt.number = sequence.last
+            pending_receipt.errors = []
+
+        return []
+
+    def _commit_chunk(
+        self,
+        client,
+        chunk: List['receipt.Receipt'],
+        sequence: Sequence,
+        on_number: Optional[Callable[['receipt.Receipt', int], None]] = None,
+    ) -> None:
+        pending = chunk
+        resynced = False
+        attempt = 1
+
+        while pending:
+            client.IniciarFacturasX()
+
+            for offset, pending_receipt in enumerate(pending):
+                if on_number is not None:
+                    on_number(pending_receipt, sequence.next + offset)
+
+                self._create_invoice(client, pending_receipt, sequence.next + offset)
+                client.AgregarFacturaX()
+
+            try:
+                guard(
+                    self._timed('FECAESolicitar', client.CAESolicitarX),
+                    self.circuit_breaker,
+                    self._is_transient,
+                )
+            except Exception as error:
+                if not self._is_transient(error):
+                    raise
+
+                pending = self._recover_chunk(client, pending, sequence)
+
+                if pending and attempt >= self.retry_policy.attempts:
+                    raise
+
+                time.sleep(self.retry_policy.delay(attempt))
+                attempt += 1
+                continue
+
+            out_of_sequence = []
+
+            for pending_receipt, invoice in zip(pending, client.facturas):
+                if invoice.get('resultado') == self.APPROVED_RESULT:
+                    pending_receipt.number = invoice['cbt_desde']
+                    pending_receipt.cae = invoice['cae']
+                    pending_receipt.cae_expiration = datetime.strptime(
+                        invoice['fch_venc_cae'],
+                        self.WSFEV1_DATE_FORMAT,
+                    )
+                    pending_receipt.errors = []
+                    sequence.last = pending_receipt.number
+                else:
+                    pending_receipt.errors = [
+                        f'{observation["code"]}: {observation["msg"]}'
+                        for observation in invoice.get('obs', [])
+                    ] + list(client.Errores)
+                    self._count_errors('FECAESolicitar', pending_receipt.errors)
+
+                    if self._is_out_of_sequence(pending_receipt.errors):
+                        out_of_sequence.append(pending_receipt)
+
+            # numbers after a rejected receipt are out of sequence, those are sent again unless the
+            # whole request was, in which case the local sequence is resynced once first
+            if len(out_of_sequence) == len(pending):
+                if resynced:
+                    break
+
+                sequence.resync()
+                resynced = True
+
+            pending = out_of_sequence
+
+    def _create_invoice(self, client, receipt: 'receipt.Receipt', invoice_number: int) -> None:
+        formatted_invoice_date = receipt.date.strftime(self.WSFEV1_DATE_FORMAT)
+        formatted_total = str(utils.quantize_decimal(receipt.total))
+
+        client.CrearFactura(
+            concepto=receipt.concept,
+            tipo_doc=receipt.customer.identity_document_type,
+            # py3afipws compares it with the DocNro AFIP answers once authorized
+            nro_doc=int(receipt.customer.identity_document),
+            tipo_cbte=receipt.type,
+            punto_vta=receipt.point_of_sale,
+            cbt_desde=invoice_number,
+            cbt_hasta=invoice_number,
+            imp_total=formatted_total,
+            imp_neto=formatted_total,
+            fecha_cbte=formatted_invoice_date,
+        )
+
+    def fetch(self, identifier: str):
+        (point_of_sale, invoice_type, invoice_number) = self._parse_identifier(identifier)
+        receipt_data = self._fetch_data(point_of_sale, invoice_type, invoice_number)
+
+        return self._build_receipt(point_of_sale, invoice_number, receipt_data)
+
+    def _fetch_data(self, point_of_sale: int, invoice_type: int, invoice_number: int) -> dict:
+        key = (self.cuit, point_of_sale, invoice_type, invoice_number)
+
+        if self.receipt_cache is not None:
+            receipt_data = self.receipt_cache.get(key)
+
+            if receipt_data is not None:
+                return receipt_data
+
+        client = self._get_client()
+        self._request(
+            'FECompConsultar',
+            client.CompConsultar,
+            invoice_type,
+            point_of_sale,
+            invoice_number,
+        )
+        errors = list(client.Errores)
+
+        # py3afipws keeps the previously fetched receipt in `factura` when the lookup fails
+        if errors:
+            raise self._service_error(errors)
+
+        receipt_data = {field: client.factura[field] for field in self.FETCHED_FIELDS}
+
+        if self.receipt_cache is not None and receipt_data['cae']:
+            self.receipt_cache.set(key, receipt_data)
+
+        return receipt_data
+
+    def fetch_many(
+        self,
+        identifiers: Iterable[str],
+        workers: Optional[int] = None,
+    ) -> List['receipt.Receipt']:
+        """ Fetch the receipts for all the given identifiers concurrently, keeping their order. """
+        workers = workers or self.FETCH_WORKERS
+
+        return list(utils.map_ordered(
+            self.fetch,
+            identifiers,
+            workers,
+            self._get_executor(workers),
+        ))
+
+    def fetch_range(
+        self,
+        identifier: str,
+        start: int,
+        end: int,
+        workers: Optional[int] = None,
+    ) -> List['receipt.Receipt']:
+        """ Fetch the receipts numbered from `start` to `end` (inclusive) for the given
+        "point_of_sale:type" identifier.
+        """
+        self._parse_identifier(f'{identifier}:0')
+
+        return self.fetch_many(
+            (f'{identifier}:{invoice_number}' for invoice_number in range(start, end + 1)),
+            workers,
+        )
+
+    def fetch_last(self, identifier: str, count: int = 1) -> List['receipt.Receipt']:
+        return list(self.iter_last(identifier, count))
+
+    def iter_last(
+        self,
+        identifier: str,
+        count: int = 1,
+        workers: Optional[int] = None,
+    ) -> Iterator['receipt.Receipt']:
+        """ Fetch the last `count` receipts concurrently, yielding them from the newest one. """
+        (point_of_sale, invoice_type, _) = self._parse_identifier(identifier + ':0')
+        client = self._get_client()
+        last_invoice_number = self._last_authorized(client, point_of_sale, invoice_type)
+        invoice_numbers = range(last_invoice_number, max(last_invoice_number - count, 0), -1)
+        workers = workers or self.FETCH_WORKERS
+
+        return utils.map_ordered(
+            lambda invoice_number: self.fetch(f'{identifier}:{invoice_number}'),
+            invoice_numbers,
+            workers,
+            self._get_executor(workers),
+        )
+
+    def _authenticate(self) -> Tuple[str, str]:
+        ticket = self._ticket
+
+        if ticket is None or not ticket.is_valid():
+            ticket = self._load_ticket()
+
+        return ticket.token, ticket.sign
+
+    def _load_ticket(self) -> Ticket:
+        ticket = self._parse_ticket(self.credentials)
+
+        if ticket is None or not ticket.is_valid():
+            with self.credential_store.lock(self.credentials_key):
+                # another thread or process may have logged in while waiting for the lock
+                ticket = self._parse_ticket(self.credentials)
+
+                if ticket is None or not ticket.is_valid():
+                    with metrics.timer('afip.login'):
+                        credentials = self._login()
+
+                    self.credentials = credentials
+                    ticket = self._parse_ticket(credentials)
+
+        self._ticket = ticket
+
+        if self.refresh_credentials and ticket.expiration != self._refresh_expiration:
+            self._schedule_refresh(ticket)
+
+        return ticket
+
+    def _login(self) -> dict:
+        wsaa_client = wsaa.WSAA()
+
+        tra = wsaa_client.CreateTRA(self.SERVICE, ttl=self.TRA_TTL)
+
+        with metrics.timer('afip.sign'):
+            cms = self.signer.sign(tra)
+
+        with metrics.timer('afip.connect', service='wsaa'):
+            self._call(self.cache.connect, wsaa_client, self.wsaa_url, timeout=self.timeout)
+
+        call(
+            functools.partial(
+                self._reveal_fault(wsaa_client, self._timed('loginCms', wsaa_client.LoginCMS)),
+                cms,
+            ),
+            self.retry_policy,
+            self.circuit_breaker,
+            self._is_lost_request,
+        )
+
+        return {
+            self.TOKEN_CACHE_KEY: wsaa_client.Token,
+            self.SIGN_CACHE_KEY: wsaa_client.Sign,
+            self.EXPIRATION_CACHE_KEY: wsaa_client.ObtenerTagXml('expirationTime'),
+        }
+
+    def _schedule_refresh(self, ticket: Ticket) -> None:
+        # WSAA refuses to issue a new ticket while the current one is valid, so the refresh is
+        # scheduled right after the expiration time instead of when the first call needs it
+        if ticket.expiration is None:
+            return
+
+        delay = (ticket.expiration - datetime.now(timezone.utc)).total_seconds()
+
+        with self._refresh_lock:
+            # a closed backend may still be used by some thread, but never refreshes again
+            if self._closed:
+                return
+
+            self._cancel_refresh()
+            self._refresh_expiration = ticket.expiration
+            # the timer only holds a weak reference, so it doesn't keep the backend alive
+            self._refresh_timer = threading.Timer(
+                max(delay, 0) + self.REFRESH_DELAY,
+                _refresh_backend,
+                (weakref.ref(self),),
+            )
+            self._refresh_timer.daemon = True
+            self._refresh_timer.start()
+            self._refresh_finalizer = weakref.finalize(self, self._refresh_timer.cancel)
+
+    def close(self) -> None:
+        """ Stop refreshing the credentials for good, shut the fetching threads down and drop
+        the pooled clients.
+        """
+        with self._refresh_lock:
+            self._cancel_refresh()
+            self._refresh_expiration = None
+            self._closed = True
+
+        with self._executors_lock:
+            executors = list(self._executors.values())
+            self._executors.clear()
+
+        for executor in executors:
+            executor.shutdown(wait=False)
+
+        self._clients.clear()
+
+    def _get_executor(self, workers: int) -> ThreadPoolExecutor:
+        with self._executors_lock:
+            if workers not in self._executors:
+                self._executors[workers] = ThreadPoolExecutor(
+                    max_workers=workers,
+                    thread_name_prefix='juryou-fetch',
+                )
+
+            return self._executors[workers]
+
+    def _cancel_refresh(self) -> None:
+        """ Must be called holding the refresh lock. """
+        if self._refresh_timer is not None:
+            self._refresh_timer.cancel()
+            self._refresh_finalizer.detach()
+
+        self._refresh_timer = None
+        self._refresh_finalizer = None
+
+    def _refresh(self) -> None:
+        try:
+            self._authenticate()
+        except Exception:
+            logger.exception('Could not refresh the WSAA credentials for %s', self.cuit)
 
     def _get_client(self):
-        wsdl = WSFEV1_PRODUCTION_URL if self.production else None
         token, sign = self._authenticate()
 
+        return self._clients.get(token, sign)
+
+    def _connect(self, token: str, sign: str):
         wsfev1_client = wsfev1.WSFEv1()
         wsfev1_client.Token = token.encode('utf-8')
         wsfev1_client.Sign = sign.encode('utf-8')
         wsfev1_client.Cuit = self.cuit
-        wsfev1_client.Conectar(wsdl=wsdl, cache=self.cache)
+
+        with metrics.timer('afip.connect', service='wsfev1'):
+            self._call(self.cache.connect, wsfev1_client, self.wsfev1_url, timeout=self.timeout)
 
         return wsfev1_client
+
+    def _last_authorized(self, client, point_of_sale: int, invoice_type: int) -> int:
+        return int(self._request(
+            'FECompUltimoAutorizado',
+            client.CompUltimoAutorizado,
+            invoice_type,
+            point_of_sale,
+        ))
+
+    def _call(self, function, *args, **kwargs):
+        """ Make a request which can be safely repeated, retrying it on transient errors. """
+        return call(
+            functools.partial(function, *args, **kwargs),
+            self.retry_policy,
+            self.circuit_breaker,
+            self._is_transient,
+        )
+
+    def _request(self, operation: str, function: Callable, *args):
+        """ `_call` an AFIP `operation`, measuring each attempt. """
+        return self._call(self._timed(operation, function), *args)
+
+    def _timed(self, operation: str, function: Callable) -> Callable:
+        """ Measure the calls to a py3afipws `function` as requests for `operation`, with the
+        size of the exchanged XML.
+        """
+        if not metrics.enabled():
+            return function
+
+        @functools.wraps(function)
+        def request(*args, **kwargs):
+            with metrics.timer('afip.request', operation=operation):
+                result = function(*args, **kwargs)
+
+            soap_client = getattr(getattr(function, '__self__', None), 'client', None)
+
+            for direction in ('request', 'response'):
+                payload = getattr(soap_client, f'xml_{direction}', None)
+
+                if isinstance(payload, (bytes, str)):
+                    metrics.size(
+                        'afip.payload',
+                        len(payload),
+                        operation=operation,
+                        direction=direction,
+                    )
+
+            return result
+
+        return request
+
+    def _is_transient(self, error: Optional[BaseException]) -> bool:
+        # timeouts and connection errors are raised as OSError, unreachable servers by httplib2.
+        # py3simplesoap handles them checking for an exception httplib2 no longer has though, so
+        # they surface as the AttributeError raised while handling them
+        while isinstance(error, AttributeError):
+            error = error.__context__
+
+        return isinstance(error, (OSError, httplib2.HttpLib2Error))
+
+    def _is_lost_request(self, error: BaseException) -> bool:
+        """ Like `_is_transient`, for `CAESolicitar` and `LoginCMS`. """
+        # py3afipws swallows the errors of those requests, failing afterwards to read the response
+        # it didn't get. Faults are told apart by `_reveal_fault`
+        return self._is_transient(error) or isinstance(error, UnboundLocalError)
+
+    def _reveal_fault(self, client, function: Callable) -> Callable:
+        """ Raise the SOAP fault a py3afipws request swallowed as an `AFIPServiceError`.
+
+        `CAESolicitar` and `LoginCMS` fail with an `UnboundLocalError` whether the request was
+        lost or AFIP answered with a fault, and that's all `Excepcion` and `Traceback` hold. The
+        response py3simplesoap got is still there though.
+        """
+        @functools.wraps(function)
+        def request(*args, **kwargs):
+            soap_client = getattr(client, 'client', None)
+
+            if soap_client is not None:
+                # py3simplesoap only sets it once a response arrives
+                soap_client.xml_response = ''
+
+            try:
+                return function(*args, **kwargs)
+            except UnboundLocalError:
+                response = getattr(soap_client, 'xml_response', '')
+                fault = soap.parse_fault(response) if response else None
+
+                if fault is None:
+                    raise
+
+                raise AFIPServiceError([str(fault)]) from None
+
+        return request
+
+
+def _refresh_backend(reference: 'weakref.ref[AFIPBackend]') -> None:
+    backend = reference()
+
+    if backend is not None:
+        backend._refresh()
+
+
+def prewarm_wsdl_cache(cache: Optional[WSDLCache] = None, production: bool = False) -> WSDLCache:
+    """ Download and parse the WSAA and WSFEv1 service descriptions into `cache`, so backends
+    sharing it connect without fetching them.
+    """
+    cache = cache if cache is not None else WSDLCache()
+    cache.connect(
+        wsaa.WSAA(),
+        WSAA_PRODUCTION_URL if production else WSAA_TESTING_URL,
+        refresh=True,
+    )
+    cache.connect(
+        wsfev1.WSFEv1(),
+        WSFEV1_PRODUCTION_URL if production else WSFEV1_TESTING_URL,
+        refresh=True,
+    )
+
+    return cache
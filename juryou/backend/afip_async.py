@@ -0,0 +1,476 @@
+""" WSFEv1 backend for asyncio applications.
+
+Requires the `async` extra (aiohttp). Every request goes through a single pooled HTTP session,
+so `close` (or `async with`) should be used once the backend isn't needed anymore.
+"""
+import asyncio
+import aiohttp
+import contextlib
+import sys
+import weakref
+from datetime import datetime
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Tuple
+from juryou import metrics, receipt
+from . import soap
+# AFIPServiceError is raised by the backend
+from .afip import (  # noqa: F401
+    AFIPServiceError,
+    AmbiguousCommitError,
+    BaseAFIPBackend,
+    NumberTakenError,
+    ReceiptNotFoundError,
+    wsaa,
+)
+from .cache import BaseReceiptCache
+from .credentials import BaseCredentialStore, Ticket
+from .resilience import CircuitBreaker, RetryPolicy, call_async, guard_async
+from .sequencer import BaseSequencer, Sequence, SequenceKey
+
+WSAA_TESTING_URL = 'https://wsaahomo.afip.gov.ar/ws/services/LoginCms'
+WSAA_PRODUCTION_URL = 'https://wsaa.afip.gov.ar/ws/services/LoginCms'
+WSFEV1_TESTING_URL = 'https://wswhomo.afip.gov.ar/wsfev1/service.asmx'
+WSFEV1_PRODUCTION_URL = 'https://servicios1.afip.gov.ar/wsfev1/service.asmx'
+
+# per loop, so every backend sharing a sequencer queues its coroutines on the same lock
+_sequence_locks: 'weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict]' = (
+    weakref.WeakKeyDictionary()
+)
+
+
+class AsyncAFIPBackend(BaseAFIPBackend):
+    """ Same contract as `AFIPBackend`, with `commit`, `commit_many`, `fetch`, `fetch_many`,
+    `fetch_last` and `authenticate` as coroutines. Failed requests are retried and recovered
+    in the same way.
+    """
+
+    ALREADY_AUTHENTICATED_FAULT = 'alreadyAuthenticated'
+    MAX_CONNECTIONS = 100
+    TIMEOUT = 60
+
+    def __init__(
+        self,
+        certificate: str,
+        private_key: str,
+        cuit: str,
+        credentials: Optional[dict] = None,
+        production: bool = False,
+        sequencer: Optional[BaseSequencer] = None,
+        receipt_cache: Optional[BaseReceiptCache] = None,
+        credential_store: Optional[BaseCredentialStore] = None,
+        max_connections: int = MAX_CONNECTIONS,
+        timeout: float = TIMEOUT,
+        retry_policy: Optional[RetryPolicy] = None,
+        circuit_breaker: Optional[CircuitBreaker] = None,
+    ):
+        super().__init__(
+            certificate,
+            private_key,
+            cuit,
+            credentials,
+            production,
+            sequencer,
+            receipt_cache,
+            credential_store,
+            retry_policy,
+            circuit_breaker,
+        )
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.wsaa_url = WSAA_PRODUCTION_URL if self.production else WSAA_TESTING_URL
+        self.wsfev1_url = WSFEV1_PRODUCTION_URL if self.production else WSFEV1_TESTING_URL
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._auth_lock: Optional[asyncio.Lock] = None
+
+    async def __aenter__(self) -> 'AsyncAFIPBackend':
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def commit(self, receipt: 'receipt.Receipt') -> 'receipt.Receipt':
+        self.validate_receipt(receipt)
+        key = (self.cuit, receipt.point_of_sale, receipt.type)
+
+        async with self._get_sequence_lock(key), self._reserve(key) as sequence:
+            if sequence.last is None:
+                sequence.last = await self._last_authorized(receipt.point_of_sale, receipt.type)
+
+            detail, errors = await self._request_cae(receipt, sequence.next)
+
+            if self._is_out_of_sequence(errors):
+                sequence.last = await self._last_authorized(receipt.point_of_sale, receipt.type)
+                detail, errors = await self._request_cae(receipt, sequence.next)
+
+            receipt.errors = errors
+            self._count_result(receipt)
+
+            if errors:
+                return receipt
+
+            sequence.advance()
+            receipt.number = sequence.last
+
+        receipt.cae = detail['CAE']
+        receipt.cae_expiration = datetime.strptime(detail['CAEFchVto'], self.WSFEV1_DATE_FORMAT)
+
+        return receipt
+
+    async def commit_many(
+        self,
+        receipts: Iterable['receipt.Receipt'],
+    ) -> List['receipt.Receipt']:
+        """ Commit the given receipts, concurrently for different points of sale and types.
+
+        AFIP only accepts consecutive numbers, so receipts sharing a point of sale and type are
+        still sent one after the other.
+        """
+        receipts = list(receipts)
+
+        for pending_receipt in receipts:
+            self.validate_receipt(pending_receipt)
+
+        groups: Dict[Tuple[int, int], List['receipt.Receipt']] = {}
+
+        for pending_receipt in receipts:
+            key = (pending_receipt.point_of_sale, pending_receipt.type)
+            groups.setdefault(key, []).append(pending_receipt)
+
+        async def commit_group(group: List['receipt.Receipt']) -> None:
+            for pending_receipt in group:
+                await self.commit(pending_receipt)
+
+        await asyncio.gather(*(commit_group(group) for group in groups.values()))
+
+        return receipts
+
+    async def fetch(self, identifier: str) -> 'receipt.Receipt':
+        (point_of_sale, invoice_type, invoice_number) = self._parse_identifier(identifier)
+        receipt_data = await self._fetch_data(point_of_sale, invoice_type, invoice_number)
+
+        return self._build_receipt(point_of_sale, invoice_number, receipt_data)
+
+    async def fetch_many(
+        self,
+        identifiers: Iterable[str],
+        concurrency: Optional[int] = None,
+    ) -> List['receipt.Receipt']:
+        """ Fetch the receipts for all the given identifiers concurrently, keeping their order. """
+        semaphore = asyncio.Semaphore(concurrency or self.FETCH_WORKERS)
+
+        async def fetch(identifier: str) -> 'receipt.Receipt':
+            async with semaphore:
+                return await self.fetch(identifier)
+
+        return list(await asyncio.gather(*(fetch(identifier) for identifier in identifiers)))
+
+    async def fetch_last(self, identifier: str, count: int = 1) -> List['receipt.Receipt']:
+        (point_of_sale, invoice_type, _) = self._parse_identifier(identifier + ':0')
+        last_invoice_number = await self._last_authorized(point_of_sale, invoice_type)
+        invoice_numbers = range(last_invoice_number, max(last_invoice_number - count, 0), -1)
+
+        return await self.fetch_many(
+            f'{identifier}:{invoice_number}' for invoice_number in invoice_numbers
+        )
+
+    async def authenticate(self) -> Tuple[str, str]:
+        """ Return the token and sign to use, logging into WSAA only when needed.
+
+        Concurrent calls wait for a single login instead of each requesting a ticket.
+        """
+        ticket = self._ticket
+
+        if ticket is None or not ticket.is_valid():
+            async with self._get_auth_lock():
+                ticket = self._ticket
+
+                if ticket is None or not ticket.is_valid():
+                    ticket = await self._load_ticket()
+                    self._ticket = ticket
+
+        return ticket.token, ticket.sign
+
+    async def _load_ticket(self) -> Ticket:
+        ticket = self._parse_ticket(self.credentials)
+
+        if ticket is not None and ticket.is_valid():
+            return ticket
+
+        try:
+            with metrics.timer('afip.login'):
+                credentials = await self._login()
+        except soap.SoapFault as error:
+            # another process sharing the credential store may have logged in already
+            ticket = self._parse_ticket(self.credentials)
+
+            if self.ALREADY_AUTHENTICATED_FAULT not in error.code or ticket is None:
+                raise
+
+            return ticket
+
+        self.credentials = credentials
+
+        return self._parse_ticket(credentials)
+
+    async def _login(self) -> dict:
+        with metrics.timer('afip.sign'):
+            cms = self.signer.sign(wsaa.create_tra(self.SERVICE, self.TRA_TTL))
+
+        response = await call_async(
+            lambda: self._call(self.wsaa_url, soap.WSAA_NAMESPACE, 'loginCms', {'in0': cms}, ''),
+            self.retry_policy,
+            self.circuit_breaker,
+            self._is_transient,
+        )
+        ticket = soap.parse_xml(response['loginCmsReturn'])['loginTicketResponse']
+
+        return {
+            self.TOKEN_CACHE_KEY: ticket['credentials']['token'],
+            self.SIGN_CACHE_KEY: ticket['credentials']['sign'],
+            self.EXPIRATION_CACHE_KEY: ticket['header']['expirationTime'],
+        }
+
+    async def _last_authorized(self, point_of_sale: int, invoice_type: int) -> int:
+        result = await self._call_wsfev1(
+            'FECompUltimoAutorizado',
+            PtoVta=point_of_sale,
+            CbteTipo=invoice_type,
+        )
+        self._raise_errors(result)
+
+        return int(result['CbteNro'])
+
+    async def _request_cae(
+        self,
+        receipt: 'receipt.Receipt',
+        invoice_number: int,
+    ) -> Tuple[Optional[dict], List[str]]:
+        attempt = 1
+
+        while True:
+            try:
+                result = await self._call_wsfev1(
+                    'FECAESolicitar',
+                    idempotent=False,
+                    FeCAEReq={
+                        'FeCabReq': {
+                            'CantReg': 1,
+                            'PtoVta': receipt.point_of_sale,
+                            'CbteTipo': receipt.type,
+                        },
+                        'FeDetReq': {
+                            'FECAEDetRequest': self._invoice_detail(receipt, invoice_number),
+                        },
+                    },
+                )
+                break
+            except Exception as error:
+                if not self._is_transient(error):
+                    raise
+
+                # AFIP may have authorized the request before it failed
+                receipt_data = await self._recover(receipt, invoice_number)
+
+                if receipt_data is not None:
+                    detail = {'CAE': receipt_data['cae'], 'CAEFchVto': receipt_data['fch_venc_cae']}
+
+                    return detail, []
+
+                if attempt >= self.retry_policy.attempts:
+                    raise
+
+            await asyncio.sleep(self.retry_policy.delay(attempt))
+            attempt += 1
+
+        errors = self._errors(result)
+        details = soap.as_list((result.get('FeDetResp') or {}).get('FECAEDetResponse'))
+
+        if not details:
+            self._count_errors('FECAESolicitar', errors)
+
+            return None, errors
+
+        detail = details[0]
+
+        if detail.get('Resultado') == self.APPROVED_RESULT:
+            return detail, []
+
+        observations = soap.as_list((detail.get('Observaciones') or {}).get('Obs'))
+        errors = [
+            f'{observation["Code"]}: {observation["Msg"]}' for observation in observations
+        ] + errors
+        self._count_errors('FECAESolicitar', errors)
+
+        return detail, errors
+
+    async def _recover(self, receipt: 'receipt.Receipt', invoice_number: int) -> Optional[dict]:
+        """ The data of `invoice_number` if a failed request authorized it for `receipt`. """
+        try:
+            receipt_data = await self._fetch_data(
+                receipt.point_of_sale,
+                receipt.type,
+                invoice_number,
+            )
+        except ReceiptNotFoundError:
+            return None
+        except Exception as error:
+            raise AmbiguousCommitError(receipt, invoice_number) from error
+
+        # the number was taken by another receipt, the local sequence can't be trusted
+        if not self._matches(receipt, receipt_data):
+            raise NumberTakenError(receipt, invoice_number)
+
+        return receipt_data
+
+    async def _fetch_data(self, point_of_sale: int, invoice_type: int, invoice_number: int) -> dict:
+        key = (self.cuit, point_of_sale, invoice_type, invoice_number)
+
+        if self.receipt_cache is not None:
+            receipt_data = self.receipt_cache.get(key)
+
+            if receipt_data is not None:
+                return receipt_data
+
+        result = await self._call_wsfev1(
+            'FECompConsultar',
+            FeCompConsReq={
+                'CbteTipo': invoice_type,
+                'CbteNro': invoice_number,
+                'PtoVta': point_of_sale,
+            },
+        )
+        self._raise_errors(result)
+        found = result['ResultGet']
+        receipt_data = {
+            'nro_doc': int(found['DocNro']),
+            'fecha_cbte': found['CbteFch'],
+            'tipo_cbte': int(found['CbteTipo']),
+            'concepto': int(found['Concepto']),
+            'imp_total': found['ImpTotal'],
+            'cae': found['CodAutorizacion'],
+            'fch_venc_cae': found['FchVto'],
+        }
+
+        if self.receipt_cache is not None and receipt_data['cae']:
+            self.receipt_cache.set(key, receipt_data)
+
+        return receipt_data
+
+    def _errors(self, result: dict) -> List[str]:
+        return [
+            f'{error["Code"]}: {error["Msg"]}'
+            for error in soap.as_list((result.get('Errors') or {}).get('Err'))
+        ]
+
+    def _raise_errors(self, result: dict) -> None:
+        errors = self._errors(result)
+
+        if errors:
+            raise self._service_error(errors)
+
+    async def _call_wsfev1(self, operation: str, idempotent: bool = True, **arguments) -> dict:
+        """ Call a WSFEv1 operation, retrying it on transient errors if it's `idempotent`. """
+        token, sign = await self.authenticate()
+
+        def request():
+            return self._call(
+                self.wsfev1_url,
+                soap.WSFEV1_NAMESPACE,
+                operation,
+                {'Auth': {'Token': token, 'Sign': sign, 'Cuit': self.cuit}, **arguments},
+                soap.WSFEV1_NAMESPACE + operation,
+            )
+
+        if idempotent:
+            response = await call_async(
+                request,
+                self.retry_policy,
+                self.circuit_breaker,
+                self._is_transient,
+            )
+        else:
+            response = await guard_async(request, self.circuit_breaker, self._is_transient)
+
+        return response[f'{operation}Result']
+
+    def _is_transient(self, error: BaseException) -> bool:
+        return isinstance(error, (OSError, asyncio.TimeoutError, aiohttp.ClientError))
+
+    async def _call(
+        self,
+        url: str,
+        namespace: str,
+        operation: str,
+        arguments: dict,
+        action: str,
+    ) -> dict:
+        headers = {'Content-Type': 'text/xml; charset=utf-8', 'SOAPAction': f'"{action}"'}
+        body = soap.build_envelope(namespace, operation, arguments)
+
+        # faults are sent with an error status, so the status isn't checked before parsing
+        with metrics.timer('afip.request', operation=operation):
+            async with self._get_session().post(url, data=body, headers=headers) as response:
+                content = await response.read()
+
+        metrics.size('afip.payload', len(body), operation=operation, direction='request')
+        metrics.size('afip.payload', len(content), operation=operation, direction='response')
+
+        return soap.parse_envelope(content)[f'{operation}Response']
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+
+        return self._session
+
+    def _get_auth_lock(self) -> asyncio.Lock:
+        if self._auth_lock is None:
+            self._auth_lock = asyncio.Lock()
+
+        return self._auth_lock
+
+    def _get_sequence_lock(self, key: SequenceKey) -> asyncio.Lock:
+        locks = _sequence_locks.setdefault(asyncio.get_event_loop(), {})
+
+        return locks.setdefault((self.sequencer, key), asyncio.Lock())
+
+    @contextlib.asynccontextmanager
+    async def _reserve(self, key: SequenceKey) -> AsyncIterator[Sequence]:
+        """ Reserve the key in the sequencer from the executor, as its lock blocks the thread.
+
+        Only one coroutine per loop should wait for a key (see `_get_sequence_lock`), so the
+        executor always has a thread left to release it.
+        """
+        loop = asyncio.get_event_loop()
+        reservation = self.sequencer.reserve(key)
+        entering = loop.run_in_executor(None, reservation.__enter__)
+
+        try:
+            sequence = await asyncio.shield(entering)
+        except asyncio.CancelledError:
+            # the key is still reserved once the executor gets it, so release it right after
+            entering.add_done_callback(
+                lambda future: future.exception() or loop.run_in_executor(
+                    None,
+                    reservation.__exit__,
+                    None,
+                    None,
+                    None,
+                ),
+            )
+            raise
+
+        try:
+            yield sequence
+        except BaseException:
+            await loop.run_in_executor(None, reservation.__exit__, *sys.exc_info())
+            raise
+
+        await loop.run_in_executor(None, reservation.__exit__, None, None, None)
@@ -1,5 +1,5 @@
 import abc
-from typing import List
+from typing import Iterable, List
 from juryou import receipt
 
 
@@ -13,6 +13,14 @@ class BaseBackend(abc.ABC):
         """
         pass
 
+    def commit_many(self, receipts: Iterable['receipt.Receipt']) -> List['receipt.Receipt']:
+        """ Commit all the given receipts to the backend.
+
+        Backends able to authorize several receipts in a single request should override this, by
+        default receipts are commited one by one.
+        """
+        return [self.commit(pending_receipt) for pending_receipt in receipts]
+
     @abc.abstractclassmethod
     def fetch(self, identifier: str) -> 'receipt.Receipt':
         """ Fetch a receipt by the identifier used by the backend. """
@@ -0,0 +1,68 @@
+import abc
+import json
+import sqlite3
+import threading
+from typing import Dict, Optional, Tuple
+
+ReceiptKey = Tuple[str, int, int, int]
+
+
+class BaseReceiptCache(abc.ABC):
+    """ Stores the data of already authorized receipts, keyed by cuit, point of sale, type and
+    number. Authorized receipts can't change, so cached entries never expire.
+    """
+
+    @abc.abstractmethod
+    def get(self, key: ReceiptKey) -> Optional[dict]:
+        pass
+
+    @abc.abstractmethod
+    def set(self, key: ReceiptKey, data: dict) -> None:
+        pass
+
+
+class MemoryReceiptCache(BaseReceiptCache):
+    def __init__(self):
+        self._receipts: Dict[ReceiptKey, dict] = {}
+
+    def get(self, key: ReceiptKey) -> Optional[dict]:
+        return self._receipts.get(key)
+
+    def set(self, key: ReceiptKey, data: dict) -> None:
+        self._receipts[key] = data
+
+
+class SQLiteReceiptCache(BaseReceiptCache):
+    """ Persists the cache in an SQLite database, which can be shared between processes. """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+
+        with self._lock, self._connection:
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS receipts ('
+                'cuit TEXT, point_of_sale INTEGER, type INTEGER, number INTEGER, data TEXT, '
+                'PRIMARY KEY (cuit, point_of_sale, type, number))',
+            )
+
+    def get(self, key: ReceiptKey) -> Optional[dict]:
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT data FROM receipts '
+                'WHERE cuit = ? AND point_of_sale = ? AND type = ? AND number = ?',
+                key,
+            ).fetchone()
+
+        return json.loads(row[0]) if row is not None else None
+
+    def set(self, key: ReceiptKey, data: dict) -> None:
+        with self._lock, self._connection:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO receipts VALUES (?, ?, ?, ?, ?)',
+                (*key, json.dumps(data, default=str)),
+            )
+
+    def close(self) -> None:
+        self._connection.close()
@@ -0,0 +1,794 @@
+""" Receipts authorized with an anticipated CAE (CAEA).
+
+AFIP grants a CAEA for each fortnight, which authorizes every receipt dated within it. Receipts
+are numbered and authorized locally with it, without any request, and reported to AFIP afterwards
+(before the CAEA's deadline) in batches. Points of sale that didn't issue any receipt with a
+CAEA are reported as such once its fortnight ends.
+
+Issued receipts are recorded in a `CAEAJournal` until they're reported, so they must survive
+crashes and restarts: the journal is an SQLite database, written synchronously.
+"""
+import functools
+import itertools
+import json
+import logging
+import sqlite3
+import threading
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from juryou import metrics, receipt, utils
+from juryou.receipt import CAEA_AUTHORIZATION_TYPE
+from .afip import AFIPBackend, NumberTakenError
+from .resilience import guard
+
+logger = logging.getLogger(__name__)
+
+JournalKey = Tuple[str, bool]
+Fortnight = Tuple[int, int]
+
+PENDING_STATUS = 'pending'
+REPORTED_STATUS = 'reported'
+REJECTED_STATUS = 'rejected'
+
+
+class CAEAUnavailableError(Exception):
+    pass
+
+
+def fortnight(day: date) -> Fortnight:
+    """ The period (yyyymm) and order (1 for the first half of the month, 2 for the second one)
+    of the fortnight including `day`.
+    """
+    return day.year * 100 + day.month, 1 if day.day <= 15 else 2
+
+
+def next_fortnight(current: Fortnight) -> Fortnight:
+    period, order = current
+
+    if order == 1:
+        return period, 2
+
+    year, month = divmod(period, 100)
+
+    return (year + 1) * 100 + 1 if month == 12 else period + 1, 1
+
+
+def fortnight_start(current: Fortnight) -> date:
+    period, order = current
+
+    return date(period // 100, period % 100, 1 if order == 1 else 16)
+
+
+class CAEA:
+    """ An anticipated CAE, authorizing the receipts dated from `valid_from` to `valid_to`,
+    which must be reported until `report_deadline`.
+    """
+
+    def __init__(
+        self,
+        code: str,
+        period: int,
+        order: int,
+        valid_from: datetime,
+        valid_to: datetime,
+        report_deadline: datetime,
+    ):
+        self.code = code
+        self.period = period
+        self.order = order
+        self.valid_from = valid_from
+        self.valid_to = valid_to
+        self.report_deadline = report_deadline
+
+
+class JournalEntry:
+    """ A receipt issued with a CAEA, with the detail reported for it to AFIP. """
+
+    __slots__ = (
+        'point_of_sale',
+        'type',
+        'number',
+        'caea',
+        'expiration',
+        'detail',
+        'status',
+        'errors',
+    )
+
+    def __init__(
+        self,
+        point_of_sale: int,
+        type: int,
+        number: int,
+        caea: str,
+        expiration: str,
+        detail: dict,
+        status: str = PENDING_STATUS,
+        errors: Optional[List[str]] = None,
+    ):
+        self.point_of_sale = point_of_sale
+        self.type = type
+        self.number = number
+        self.caea = caea
+        self.expiration = expiration
+        self.detail = detail
+        self.status = status
+        self.errors = errors or []
+
+
+class CAEAJournal:
+    """ Records CAEAs and the receipts issued with them in an SQLite database, which can be
+    shared between processes and companies (entries are kept by cuit and environment).
+
+    Receipts are numbered as they're recorded, within a single transaction, so numbers are never
+    repeated nor skipped.
+    """
+
+    DATE_FORMAT = '%Y%m%d'
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.RLock()
+        self._connection = sqlite3.connect(
+            path,
+            timeout=60,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+
+        with self._lock:
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('PRAGMA synchronous=FULL')
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS caeas ('
+                'cuit TEXT, production INTEGER, period INTEGER, orden INTEGER, code TEXT, '
+                'valid_from TEXT, valid_to TEXT, report_deadline TEXT, closed INTEGER DEFAULT 0, '
+                'PRIMARY KEY (cuit, production, period, orden))',
+            )
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS sequences ('
+                'cuit TEXT, production INTEGER, point_of_sale INTEGER, type INTEGER, '
+                'last INTEGER, PRIMARY KEY (cuit, production, point_of_sale, type))',
+            )
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS receipts ('
+                'cuit TEXT, production INTEGER, point_of_sale INTEGER, type INTEGER, '
+                'number INTEGER, caea TEXT, expiration TEXT, detail TEXT, status TEXT, '
+                'errors TEXT, PRIMARY KEY (cuit, production, point_of_sale, type, number))',
+            )
+            self._connection.execute(
+                'CREATE INDEX IF NOT EXISTS receipts_status ON receipts (cuit, production, status)',
+            )
+
+    def get_caea(self, key: JournalKey, period: int, order: int) -> Optional[CAEA]:
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT code, period, orden, valid_from, valid_to, report_deadline FROM caeas '
+                'WHERE cuit = ? AND production = ? AND period = ? AND orden = ?',
+                (*key, period, order),
+            ).fetchone()
+
+        return self._caea(row) if row is not None else None
+
+    def add_caea(self, key: JournalKey, caea: CAEA) -> None:
+        with self._lock:
+            self._connection.execute(
+                'INSERT OR IGNORE INTO caeas VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0)',
+                (
+                    *key,
+                    caea.period,
+                    caea.order,
+                    caea.code,
+                    caea.valid_from.strftime(self.DATE_FORMAT),
+                    caea.valid_to.strftime(self.DATE_FORMAT),
+                    caea.report_deadline.strftime(self.DATE_FORMAT),
+                ),
+            )
+
+    def finished_caeas(self, key: JournalKey, day: date) -> List[CAEA]:
+        """ The CAEAs which stopped being valid before `day` and weren't closed yet. """
+        with self._lock:
+            rows = self._connection.execute(
+                'SELECT code, period, orden, valid_from, valid_to, report_deadline FROM caeas '
+                'WHERE cuit = ? AND production = ? AND closed = 0 AND valid_to < ? '
+                'ORDER BY period, orden',
+                (*key, day.strftime(self.DATE_FORMAT)),
+            ).fetchall()
+
+        return [self._caea(row) for row in rows]
+
+    def close_caea(self, key: JournalKey, caea: CAEA) -> None:
+        with self._lock:
+            self._connection.execute(
+                'UPDATE caeas SET closed = 1 '
+                'WHERE cuit = ? AND production = ? AND period = ? AND orden = ?',
+                (*key, caea.period, caea.order),
+            )
+
+    def last_number(self, key: JournalKey, point_of_sale: int, invoice_type: int) -> Optional[int]:
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT last FROM sequences '
+                'WHERE cuit = ? AND production = ? AND point_of_sale = ? AND type = ?',
+                (*key, point_of_sale, invoice_type),
+            ).fetchone()
+
+        return row[0] if row is not None else None
+
+    def seed(self, key: JournalKey, point_of_sale: int, invoice_type: int, last: int) -> None:
+        """ Number receipts after `last`, unless they're being numbered already. """
+        with self._lock:
+            self._connection.execute(
+                'INSERT OR IGNORE INTO sequences VALUES (?, ?, ?, ?, ?)',
+                (*key, point_of_sale, invoice_type, last),
+            )
+
+    def append(
+        self,
+        key: JournalKey,
+        point_of_sale: int,
+        invoice_type: int,
+        caea: CAEA,
+        build_detail: Callable[[int], dict],
+    ) -> JournalEntry:
+        """ Record a receipt with the number following the last one, `build_detail` is given the
+        number and returns the detail to report.
+        """
+        with self._lock:
+            self._connection.execute('BEGIN IMMEDIATE')
+
+            try:
+                row = self._connection.execute(
+                    'SELECT last FROM sequences '
+                    'WHERE cuit = ? AND production = ? AND point_of_sale = ? AND type = ?',
+                    (*key, point_of_sale, invoice_type),
+                ).fetchone()
+                number = (row[0] if row is not None else 0) + 1
+                entry = JournalEntry(
+                    point_of_sale,
+                    invoice_type,
+                    number,
+                    caea.code,
+                    caea.valid_to.strftime(self.DATE_FORMAT),
+                    build_detail(number),
+                )
+                self._connection.execute(
+                    'INSERT OR REPLACE INTO sequences VALUES (?, ?, ?, ?, ?)',
+                    (*key, point_of_sale, invoice_type, number),
+                )
+                self._connection.execute(
+                    'INSERT INTO receipts VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (
+                        *key,
+                        point_of_sale,
+                        invoice_type,
+                        number,
+                        entry.caea,
+                        entry.expiration,
+                        json.dumps(entry.detail, default=str),
+                        entry.status,
+                        json.dumps(entry.errors),
+                    ),
+                )
+            except BaseException:
+                self._connection.execute('ROLLBACK')
+                raise
+
+            self._connection.execute('COMMIT')
+
+        return entry
+
+    def get(
+        self,
+        key: JournalKey,
+        point_of_sale: int,
+        invoice_type: int,
+        number: int,
+    ) -> Optional[JournalEntry]:
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT point_of_sale, type, number, caea, expiration, detail, status, errors '
+                'FROM receipts WHERE cuit = ? AND production = ? AND point_of_sale = ? '
+                'AND type = ? AND number = ?',
+                (*key, point_of_sale, invoice_type, number),
+            ).fetchone()
+
+        return self._entry(row) if row is not None else None
+
+    def entries(self, key: JournalKey, status: str = PENDING_STATUS) -> List[JournalEntry]:
+        """ The receipts in the given status, by point of sale, type and number. """
+        with self._lock:
+            rows = self._connection.execute(
+                'SELECT point_of_sale, type, number, caea, expiration, detail, status, errors '
+                'FROM receipts WHERE cuit = ? AND production = ? AND status = ? '
+                'ORDER BY point_of_sale, type, number',
+                (*key, status),
+            ).fetchall()
+
+        return [self._entry(row) for row in rows]
+
+    def has_entries(
+        self,
+        key: JournalKey,
+        caea: CAEA,
+        point_of_sale: Optional[int] = None,
+        status: Optional[str] = None,
+    ) -> bool:
+        query = 'SELECT 1 FROM receipts WHERE cuit = ? AND production = ? AND caea = ?'
+        parameters = [*key, caea.code]
+
+        if point_of_sale is not None:
+            query += ' AND point_of_sale = ?'
+            parameters.append(point_of_sale)
+
+        if status is not None:
+            query += ' AND status = ?'
+            parameters.append(status)
+
+        with self._lock:
+            return self._connection.execute(query + ' LIMIT 1', parameters).fetchone() is not None
+
+    def set_status(
+        self,
+        key: JournalKey,
+        entry: JournalEntry,
+        status: str,
+        errors: Iterable[str] = (),
+    ) -> None:
+        entry.status = status
+        entry.errors = list(errors)
+
+        with self._lock:
+            self._connection.execute(
+                'UPDATE receipts SET status = ?, errors = ? WHERE cuit = ? AND production = ? '
+                'AND point_of_sale = ? AND type = ? AND number = ?',
+                (
+                    status,
+                    json.dumps(entry.errors),
+                    *key,
+                    entry.point_of_sale,
+                    entry.type,
+                    entry.number,
+                ),
+            )
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def _caea(self, row: tuple) -> CAEA:
+        code, period, order, valid_from, valid_to, report_deadline = row
+
+        return CAEA(
+            code,
+            period,
+            order,
+            datetime.strptime(valid_from, self.DATE_FORMAT),
+            datetime.strptime(valid_to, self.DATE_FORMAT),
+            datetime.strptime(report_deadline, self.DATE_FORMAT),
+        )
+
+    def _entry(self, row: tuple) -> JournalEntry:
+        point_of_sale, invoice_type, number, caea, expiration, detail, status, errors = row
+
+        return JournalEntry(
+            point_of_sale,
+            invoice_type,
+            number,
+            caea,
+            expiration,
+            json.loads(detail),
+            status,
+            json.loads(errors),
+        )
+
+
+class CAEABackend(AFIPBackend):
+    """ Authorizes receipts with the CAEA of their fortnight, recording them in `journal` instead
+    of requesting a CAE for each one, so `commit` doesn't wait for AFIP.
+
+    `report`, usually called from a `CAEAReporter`, sends the recorded receipts to AFIP and, once
+    a CAEA expires, informs the `points_of_sale` which didn't use it.
+
+    CAEAs are requested (or looked up, if another process got them first) when the first receipt
+    of their fortnight is issued, unless `prepare` got them ahead of time. The numbers of a point
+    of sale and type follow the last receipt AFIP has, asked the first time they're used. Every
+    other option is passed to `AFIPBackend`.
+    """
+
+    CAEA_REQUEST_DAYS = 5
+
+    def __init__(
+        self,
+        certificate: str,
+        private_key: str,
+        cuit: str,
+        journal: CAEAJournal,
+        points_of_sale: Iterable[int] = (),
+        **options: Any,
+    ):
+        super().__init__(certificate, private_key, cuit, **options)
+        self.journal = journal
+        self.points_of_sale = list(points_of_sale)
+        self._caeas: Dict[Fortnight, CAEA] = {}
+        self._caea_lock = threading.Lock()
+        self._report_lock = threading.Lock()
+
+    @property
+    def journal_key(self) -> JournalKey:
+        return self.cuit, self.production
+
+    def commit(
+        self,
+        receipt: 'receipt.Receipt',
+        on_number: Optional[Callable[[int], None]] = None,
+    ) -> 'receipt.Receipt':
+        """ Issue `receipt` with the CAEA of its date, `on_number` is called with its number
+        before it's recorded in the journal.
+        """
+        self.validate_receipt(receipt)
+        caea = self.caea_for(receipt.date)
+
+        if self.journal.last_number(self.journal_key, receipt.point_of_sale, receipt.type) is None:
+            self.journal.seed(
+                self.journal_key,
+                receipt.point_of_sale,
+                receipt.type,
+                self._last_authorized(self._get_client(), receipt.point_of_sale, receipt.type),
+            )
+
+        entry = self.journal.append(
+            self.journal_key,
+            receipt.point_of_sale,
+            receipt.type,
+            caea,
+            functools.partial(self._build_detail, receipt, on_number),
+        )
+        receipt.number = entry.number
+        receipt.cae = caea.code
+        receipt.cae_expiration = caea.valid_to
+        receipt.authorization_type = CAEA_AUTHORIZATION_TYPE
+        receipt.errors = []
+        metrics.count('caea.receipts', result='issued')
+
+        return receipt
+
+    def commit_many(
+        self,
+        receipts: Iterable['receipt.Receipt'],
+        on_number: Optional[Callable[['receipt.Receipt', int], None]] = None,
+    ) -> List['receipt.Receipt']:
+        receipts = list(receipts)
+
+        for pending_receipt in receipts:
+            self.validate_receipt(pending_receipt)
+
+        return [
+            self.commit(
+                pending_receipt,
+                functools.partial(on_number, pending_receipt) if on_number is not None else None,
+            )
+            for pending_receipt in receipts
+        ]
+
+    def recover(self, receipt: 'receipt.Receipt', invoice_number: int) -> bool:
+        """ Check whether `receipt` was recorded in the journal with `invoice_number`, setting
+        its number and CAEA if it was.
+
+        Raises `NumberTakenError` if the number was issued for another receipt.
+        """
+        entry = self.journal.get(
+            self.journal_key,
+            receipt.point_of_sale,
+            receipt.type,
+            invoice_number,
+        )
+
+        if entry is None:
+            return False
+
+        if not self._matches(receipt, self._entry_data(entry)):
+            raise NumberTakenError(receipt, invoice_number)
+
+        receipt.number = invoice_number
+        receipt.cae = entry.caea
+        receipt.cae_expiration = datetime.strptime(entry.expiration, self.WSFEV1_DATE_FORMAT)
+        receipt.authorization_type = CAEA_AUTHORIZATION_TYPE
+        receipt.errors = []
+
+        return True
+
+    def fetch(self, identifier: str) -> 'receipt.Receipt':
+        """ Fetch a receipt from the journal, or from AFIP if it wasn't issued here. """
+        (point_of_sale, invoice_type, invoice_number) = self._parse_identifier(identifier)
+        entry = self.journal.get(self.journal_key, point_of_sale, invoice_type, invoice_number)
+
+        if entry is None:
+            return super().fetch(identifier)
+
+        fetched_receipt = self._build_receipt(
+            point_of_sale,
+            invoice_number,
+            self._entry_data(entry),
+        )
+        fetched_receipt.authorization_type = CAEA_AUTHORIZATION_TYPE
+
+        return fetched_receipt
+
+    def caea_for(self, day: date) -> CAEA:
+        """ The CAEA of the fortnight including `day`. """
+        current = fortnight(day)
+        caea = self._caeas.get(current)
+
+        if caea is not None:
+            return caea
+
+        with self._caea_lock:
+            caea = self._caeas.get(current) or self.journal.get_caea(self.journal_key, *current)
+
+            if caea is None:
+                self.journal.add_caea(self.journal_key, self._obtain_caea(current))
+                # another process may have recorded it first
+                caea = self.journal.get_caea(self.journal_key, *current)
+
+            self._caeas[current] = caea
+
+        return caea
+
+    def prepare(self, day: Optional[date] = None) -> CAEA:
+        """ Get the CAEA of `day` (today by default) and, if it can already be requested, the
+        one of the next fortnight, so receipts never wait for them.
+        """
+        day = day if day is not None else date.today()
+        caea = self.caea_for(day)
+        upcoming = fortnight_start(next_fortnight(fortnight(day)))
+
+        if upcoming - day <= timedelta(days=self.CAEA_REQUEST_DAYS):
+            self.caea_for(upcoming)
+
+        return caea
+
+    def report(self, day: Optional[date] = None) -> None:
+        """ Report the pending receipts, in batches by point of sale and type, then inform the
+        points of sale without receipts for the CAEAs which expired before `day` (today by
+        default).
+
+        Receipts rejected by AFIP are kept in the journal along with their errors, the ones whose
+        request failed are reported again on the next call.
+        """
+        with self._report_lock:
+            client = self._get_client()
+            entries = self.journal.entries(self.journal_key)
+
+            groups = itertools.groupby(entries, lambda entry: (entry.point_of_sale, entry.type))
+
+            for _, group in groups:
+                for chunk in utils.chunks(list(group), self.MAX_RECEIPTS_PER_REQUEST):
+                    self._report_chunk(client, chunk)
+
+            self._close_caeas(client, day if day is not None else date.today())
+
+    def _build_detail(
+        self,
+        receipt: 'receipt.Receipt',
+        on_number: Optional[Callable[[int], None]],
+        invoice_number: int,
+    ) -> dict:
+        if on_number is not None:
+            on_number(invoice_number)
+
+        return self._invoice_detail(receipt, invoice_number)
+
+    def _entry_data(self, entry: JournalEntry) -> dict:
+        return {
+            'nro_doc': entry.detail['DocNro'],
+            'fecha_cbte': entry.detail['CbteFch'],
+            'tipo_cbte': entry.type,
+            'concepto': entry.detail['Concepto'],
+            'imp_total': entry.detail['ImpTotal'],
+            'cae': entry.caea,
+            'fch_venc_cae': entry.expiration,
+        }
+
+    def _obtain_caea(self, current: Fortnight) -> CAEA:
+        client = self._get_client()
+        period, order = current
+        code = self._request('FECAEAConsultar', client.CAEAConsultar, period, order)
+
+        if not code:
+            code = self._request('FECAEASolicitar', client.CAEASolicitar, period, order)
+
+        if not code:
+            errors = list(client.Errores) or [str(client.Excepcion)]
+
+            raise CAEAUnavailableError(
+                f'Could not get the CAEA for {period}/{order}: ' + '; '.join(errors),
+            )
+
+        return CAEA(
+            str(code),
+            period,
+            order,
+            datetime.strptime(str(client.FchVigDesde), self.WSFEV1_DATE_FORMAT),
+            datetime.strptime(str(client.FchVigHasta), self.WSFEV1_DATE_FORMAT),
+            datetime.strptime(str(client.FchTopeInf), self.WSFEV1_DATE_FORMAT),
+        )
+
+    def _report_chunk(self, client, chunk: List[JournalEntry]) -> None:
+        # py3afipws only reports a receipt per request, so the request is made by hand
+        request = {
+            'FeCabReq': {
+                'CantReg': len(chunk),
+                'PtoVta': chunk[0].point_of_sale,
+                'CbteTipo': chunk[0].type,
+            },
+            'FeDetReq': [
+                {'FECAEADetRequest': {**entry.detail, 'CAEA': entry.caea}} for entry in chunk
+            ],
+        }
+        auth = {
+            'Token': client.Token.decode('utf-8'),
+            'Sign': client.Sign.decode('utf-8'),
+            'Cuit': client.Cuit,
+        }
+
+        try:
+            response = guard(
+                lambda: self._timed(
+                    'FECAEARegInformativo',
+                    client.client.FECAEARegInformativo,
+                )(Auth=auth, FeCAEARegInfReq=request),
+                self.circuit_breaker,
+                self._is_transient,
+            )
+        except Exception as error:
+            if not self._is_transient(error):
+                raise
+
+            # AFIP may have registered them before failing, the rest are sent again next time
+            logger.warning('Reporting %s receipts failed, checking which AFIP got', len(chunk))
+
+            for entry in chunk:
+                self._check_reported(client, entry)
+
+            return
+
+        result = response['FECAEARegInformativoResult']
+        errors = [
+            f'{error["Err"]["Code"]}: {error["Err"]["Msg"]}'
+            for error in result.get('Errors') or []
+        ]
+        details = {
+            int(detail['FECAEADetResponse']['CbteDesde']): detail['FECAEADetResponse']
+            for detail in result.get('FeDetResp') or []
+        }
+
+        if not details:
+            logger.warning('Could not report %s receipts: %s', len(chunk), '; '.join(errors))
+
+        for entry in chunk:
+            detail = details.get(entry.number)
+
+            if detail is None:
+                continue
+
+            if detail.get('Resultado') == self.APPROVED_RESULT:
+                self.journal.set_status(self.journal_key, entry, REPORTED_STATUS)
+                metrics.count('caea.receipts', result='reported')
+            elif not self._check_reported(client, entry):
+                # an earlier request may have registered it
+                observations = [
+                    f'{observation["Obs"]["Code"]}: {observation["Obs"]["Msg"]}'
+                    for observation in detail.get('Observaciones') or []
+                ]
+                self.journal.set_status(
+                    self.journal_key,
+                    entry,
+                    REJECTED_STATUS,
+                    observations + errors,
+                )
+                self._count_errors('FECAEARegInformativo', entry.errors)
+                metrics.count('caea.receipts', result='rejected')
+                logger.error(
+                    'AFIP rejected receipt %s:%s:%s issued with CAEA %s: %s',
+                    entry.point_of_sale,
+                    entry.type,
+                    entry.number,
+                    entry.caea,
+                    '; '.join(entry.errors),
+                )
+
+    def _check_reported(self, client, entry: JournalEntry) -> bool:
+        """ Mark `entry` as reported if AFIP has it, registered with its CAEA. """
+        self._request(
+            'FECompConsultar',
+            client.CompConsultar,
+            entry.type,
+            entry.point_of_sale,
+            entry.number,
+        )
+
+        if client.EmisionTipo != 'CAEA' or str(client.factura.get('cae')) != entry.caea:
+            return False
+
+        self.journal.set_status(self.journal_key, entry, REPORTED_STATUS)
+        metrics.count('caea.receipts', result='reported')
+
+        return True
+
+    def _close_caeas(self, client, day: date) -> None:
+        for caea in self.journal.finished_caeas(self.journal_key, day):
+            if self.journal.has_entries(self.journal_key, caea, status=PENDING_STATUS):
+                continue
+
+            informed = True
+
+            for point_of_sale in self.points_of_sale:
+                if self.journal.has_entries(self.journal_key, caea, point_of_sale):
+                    continue
+
+                result = self._request(
+                    'FECAEASinMovimientoInformar',
+                    client.CAEASinMovimientoInformar,
+                    point_of_sale,
+                    caea.code,
+                )
+
+                if result != self.APPROVED_RESULT:
+                    informed = False
+                    logger.warning(
+                        'Could not inform point of sale %s had no receipts with CAEA %s: %s',
+                        point_of_sale,
+                        caea.code,
+                        '; '.join(client.Errores),
+                    )
+
+            if informed:
+                self.journal.close_caea(self.journal_key, caea)
+
+
+class CAEAReporter:
+    """ Calls `prepare` and `report` on a `CAEABackend` from a background thread, right away and
+    then every `interval` seconds, until stopped.
+    """
+
+    INTERVAL = 60.0
+
+    def __init__(self, backend: CAEABackend, interval: float = INTERVAL):
+        self.backend = backend
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def __enter__(self) -> 'CAEAReporter':
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def start(self) -> 'CAEAReporter':
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+        return self
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """ Stop reporting, waiting for a report in progress to finish. """
+        self._stopped.set()
+
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def run_once(self) -> None:
+        for step in (self.backend.prepare, self.backend.report):
+            try:
+                step()
+            except Exception:
+                logger.exception('CAEA %s failed for %s', step.__name__, self.backend.cuit)
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            self.run_once()
+            self._stopped.wait(self.interval)
@@ -0,0 +1,180 @@
+import abc
+import contextlib
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterator, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+CredentialsKey = Tuple[str, str, bool]
+
+
+def format_key(key: CredentialsKey) -> str:
+    cuit, service, production = key
+
+    return f'{cuit}:{service}:{"production" if production else "testing"}'
+
+
+class Ticket:
+    """ An access ticket ready to be used, checking its validity against the monotonic clock. """
+
+    def __init__(self, token: str, sign: str, expiration: Optional[datetime] = None):
+        self.token = token
+        self.sign = sign
+        self.expiration = expiration
+        self._deadline = math.inf
+
+        if expiration is not None:
+            remaining = (expiration - datetime.now(timezone.utc)).total_seconds()
+            self._deadline = time.monotonic() + remaining
+
+    def is_valid(self) -> bool:
+        return time.monotonic() < self._deadline
+
+
+class BaseCredentialStore(abc.ABC):
+    """ Keeps WSAA access tickets, keyed by cuit, service and environment.
+
+    A key must be locked while a new ticket is requested so that only one of the processes or
+    threads sharing the store logs into WSAA, the rest reuse the ticket it stores.
+    """
+
+    @abc.abstractmethod
+    def get(self, key: CredentialsKey) -> Optional[dict]:
+        pass
+
+    @abc.abstractmethod
+    def set(self, key: CredentialsKey, credentials: dict) -> None:
+        pass
+
+    @abc.abstractmethod
+    def lock(self, key: CredentialsKey) -> contextlib.AbstractContextManager:
+        pass
+
+
+class MemoryCredentialStore(BaseCredentialStore):
+    """ Shares tickets between the threads of a single process. """
+
+    def __init__(self):
+        self._credentials: Dict[CredentialsKey, dict] = {}
+        self._locks: Dict[CredentialsKey, threading.RLock] = {}
+        self._locks_lock = threading.Lock()
+
+    def get(self, key: CredentialsKey) -> Optional[dict]:
+        credentials = self._credentials.get(key)
+
+        return {**credentials} if credentials is not None else None
+
+    def set(self, key: CredentialsKey, credentials: dict) -> None:
+        self._credentials[key] = {**credentials}
+
+    def lock(self, key: CredentialsKey) -> contextlib.AbstractContextManager:
+        with self._locks_lock:
+            return self._locks.setdefault(key, threading.RLock())
+
+
+class FileCredentialStore(MemoryCredentialStore):
+    """ Keeps tickets in a JSON file, locking it so it can be shared between processes.
+
+    Locking it needs `fcntl`, which Windows doesn't have, an `SQLiteCredentialStore` must be used
+    there instead.
+    """
+
+    def __init__(self, path: str):
+        if fcntl is None:
+            raise NotImplementedError(
+                'FileCredentialStore needs fcntl, use an SQLiteCredentialStore instead',
+            )
+
+        super().__init__()
+        self.path = path
+
+    def _read(self) -> Dict[str, dict]:
+        try:
+            with open(self.path, 'r') as credentials_file:
+                data = json.load(credentials_file)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+        return {key: value for key, value in data.items() if isinstance(value, dict)}
+
+    def get(self, key: CredentialsKey) -> Optional[dict]:
+        return self._read().get(format_key(key))
+
+    def set(self, key: CredentialsKey, credentials: dict) -> None:
+        data = self._read()
+        data[format_key(key)] = credentials
+
+        with open(self.path + '.tmp', 'w') as credentials_file:
+            json.dump(data, credentials_file)
+
+        os.replace(self.path + '.tmp', self.path)
+
+    @contextlib.contextmanager
+    def lock(self, key: CredentialsKey) -> Iterator[None]:
+        with super().lock(key), open(self.path + '.lock', 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class SQLiteCredentialStore(BaseCredentialStore):
+    """ Keeps tickets in an SQLite database, which can be shared between processes. """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.RLock()
+        self._connection = sqlite3.connect(
+            path,
+            timeout=60,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS credentials (key TEXT PRIMARY KEY, data TEXT)',
+        )
+
+    def get(self, key: CredentialsKey) -> Optional[dict]:
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT data FROM credentials WHERE key = ?',
+                (format_key(key),),
+            ).fetchone()
+
+        return json.loads(row[0]) if row is not None else None
+
+    def set(self, key: CredentialsKey, credentials: dict) -> None:
+        with self._lock:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO credentials VALUES (?, ?)',
+                (format_key(key), json.dumps(credentials)),
+            )
+
+    @contextlib.contextmanager
+    def lock(self, key: CredentialsKey) -> Iterator[None]:
+        # the write lock is taken for the whole database, tickets are requested rarely enough
+        # for that not to matter
+        with self._lock:
+            self._connection.execute('BEGIN IMMEDIATE')
+
+            try:
+                yield
+            finally:
+                self._connection.execute('COMMIT')
+
+    def close(self) -> None:
+        self._connection.close()
+
+
+default_store = MemoryCredentialStore()
@@ -0,0 +1,457 @@
+""" Durable, asynchronous commits.
+
+`Outbox.enqueue` records a receipt in a store and returns right away, a pool of worker threads
+commits it afterwards. Entries go from `pending` to `numbered` when a request for their CAE is
+about to be made, and then to `authorized` or `rejected`, each step being written before moving
+on. A process dying mid-request leaves its entry `numbered`, and the next outbox started on the
+store looks it up (`CompConsultar`) before committing it again, so authorized numbers are never
+lost nor requested twice.
+"""
+import abc
+import concurrent.futures
+import itertools
+import json
+import logging
+import queue
+import sqlite3
+import threading
+from datetime import datetime
+from decimal import Decimal
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+from juryou import receipt
+from juryou.company import Company
+from juryou.customer import Customer
+from .afip import AFIPBackend, NumberTakenError
+
+logger = logging.getLogger(__name__)
+
+PENDING_STATE = 'pending'
+NUMBERED_STATE = 'numbered'
+AUTHORIZED_STATE = 'authorized'
+REJECTED_STATE = 'rejected'
+UNFINISHED_STATES = (PENDING_STATE, NUMBERED_STATE)
+
+
+def dump_receipt(committed_receipt: 'receipt.Receipt') -> dict:
+    """ The data of a receipt as JSON serializable values, its backend and printer aside. """
+    company = committed_receipt.company
+
+    return {
+        'company': {
+            'name': company.name,
+            'short_name': company.short_name,
+            'address': company.address,
+            'cuit': company.cuit,
+            'brute_income': company.brute_income,
+            'iva': company.iva,
+            'start_of_operations': company.start_of_operations.isoformat(),
+        },
+        'customer': {
+            'identity_document': committed_receipt.customer.identity_document,
+            'name': committed_receipt.customer.name,
+        },
+        'point_of_sale': committed_receipt.point_of_sale,
+        'date': committed_receipt.date.isoformat(),
+        'type': committed_receipt.type,
+        'concept': committed_receipt.concept,
+        'items': [[item.name, item.amount, str(item.price)] for item in committed_receipt.items],
+        'number': committed_receipt.number,
+        'cae': committed_receipt.cae,
+        'cae_expiration': (
+            committed_receipt.cae_expiration.isoformat()
+            if committed_receipt.cae_expiration is not None
+            else None
+        ),
+        'errors': committed_receipt.errors,
+    }
+
+
+def load_receipt(data: dict, backend: AFIPBackend) -> 'receipt.Receipt':
+    company_data = data['company']
+    loaded_receipt = receipt.Receipt(
+        Company(
+            company_data['name'],
+            company_data['address'],
+            company_data['cuit'],
+            company_data['brute_income'],
+            company_data['iva'],
+            datetime.fromisoformat(company_data['start_of_operations']),
+            company_data['short_name'],
+        ),
+        Customer(data['customer']['identity_document'], data['customer']['name']),
+        data['point_of_sale'],
+        backend,
+        datetime.fromisoformat(data['date']),
+        data['type'],
+        data['concept'],
+    )
+
+    for name, amount, price in data['items']:
+        loaded_receipt.add_item(name, amount, Decimal(price))
+
+    loaded_receipt.number = data['number']
+    loaded_receipt.cae = data['cae']
+    loaded_receipt.cae_expiration = (
+        datetime.fromisoformat(data['cae_expiration'])
+        if data['cae_expiration'] is not None
+        else None
+    )
+    loaded_receipt.errors = data['errors']
+
+    return loaded_receipt
+
+
+class OutboxEntry:
+    """ A receipt in the outbox, `number` is the one it's being (or was) requested with. """
+
+    __slots__ = ('id', 'state', 'number', 'receipt')
+
+    def __init__(
+        self,
+        id: int,
+        state: str,
+        receipt: dict,
+        number: Optional[int] = None,
+    ):
+        self.id = id
+        self.state = state
+        self.receipt = receipt
+        self.number = number
+
+
+class BaseOutboxStore(abc.ABC):
+    """ Persists the outbox entries. Writes must be durable once they return. """
+
+    @abc.abstractmethod
+    def add(self, data: dict) -> OutboxEntry:
+        pass
+
+    @abc.abstractmethod
+    def update(self, entry: OutboxEntry) -> None:
+        pass
+
+    @abc.abstractmethod
+    def get(self, entry_id: int) -> Optional[OutboxEntry]:
+        pass
+
+    @abc.abstractmethod
+    def unfinished(self) -> List[OutboxEntry]:
+        """ The pending and numbered entries, in the order they were added. """
+        pass
+
+    @abc.abstractmethod
+    def remove(self, entry_id: int) -> None:
+        pass
+
+
+class MemoryOutboxStore(BaseOutboxStore):
+    """ Keeps entries in memory, so nothing survives the process. """
+
+    def __init__(self):
+        self._entries: Dict[int, OutboxEntry] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def add(self, data: dict) -> OutboxEntry:
+        with self._lock:
+            entry = OutboxEntry(next(self._ids), PENDING_STATE, data)
+            self._entries[entry.id] = self._copy(entry)
+
+        return entry
+
+    def update(self, entry: OutboxEntry) -> None:
+        with self._lock:
+            self._entries[entry.id] = self._copy(entry)
+
+    def get(self, entry_id: int) -> Optional[OutboxEntry]:
+        with self._lock:
+            entry = self._entries.get(entry_id)
+
+        return self._copy(entry) if entry is not None else None
+
+    def unfinished(self) -> List[OutboxEntry]:
+        with self._lock:
+            return [
+                self._copy(entry)
+                for entry in self._entries.values()
+                if entry.state in UNFINISHED_STATES
+            ]
+
+    def remove(self, entry_id: int) -> None:
+        with self._lock:
+            self._entries.pop(entry_id, None)
+
+    def _copy(self, entry: OutboxEntry) -> OutboxEntry:
+        return OutboxEntry(entry.id, entry.state, entry.receipt, entry.number)
+
+
+class SQLiteOutboxStore(BaseOutboxStore):
+    """ Keeps entries in an SQLite database, written synchronously. """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.RLock()
+        self._connection = sqlite3.connect(
+            path,
+            timeout=60,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+
+        with self._lock:
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('PRAGMA synchronous=FULL')
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS outbox ('
+                'id INTEGER PRIMARY KEY AUTOINCREMENT, state TEXT, number INTEGER, receipt TEXT)',
+            )
+            self._connection.execute(
+                'CREATE INDEX IF NOT EXISTS outbox_state ON outbox (state)',
+            )
+
+    def add(self, data: dict) -> OutboxEntry:
+        with self._lock:
+            cursor = self._connection.execute(
+                'INSERT INTO outbox (state, receipt) VALUES (?, ?)',
+                (PENDING_STATE, json.dumps(data)),
+            )
+
+        return OutboxEntry(cursor.lastrowid, PENDING_STATE, data)
+
+    def update(self, entry: OutboxEntry) -> None:
+        with self._lock:
+            self._connection.execute(
+                'UPDATE outbox SET state = ?, number = ?, receipt = ? WHERE id = ?',
+                (entry.state, entry.number, json.dumps(entry.receipt), entry.id),
+            )
+
+    def get(self, entry_id: int) -> Optional[OutboxEntry]:
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT id, state, receipt, number FROM outbox WHERE id = ?',
+                (entry_id,),
+            ).fetchone()
+
+        return self._entry(row) if row is not None else None
+
+    def unfinished(self) -> List[OutboxEntry]:
+        with self._lock:
+            rows = self._connection.execute(
+                'SELECT id, state, receipt, number FROM outbox WHERE state IN (?, ?) ORDER BY id',
+                UNFINISHED_STATES,
+            ).fetchall()
+
+        return [self._entry(row) for row in rows]
+
+    def remove(self, entry_id: int) -> None:
+        with self._lock:
+            self._connection.execute('DELETE FROM outbox WHERE id = ?', (entry_id,))
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def _entry(self, row: tuple) -> OutboxEntry:
+        entry_id, state, data, number = row
+
+        return OutboxEntry(entry_id, state, json.loads(data), number)
+
+
+class OutboxFuture(concurrent.futures.Future):
+    """ Resolves to the committed receipt, check its `errors` to tell whether it was rejected. """
+
+    def __init__(self, entry_id: int):
+        super().__init__()
+        self.entry_id = entry_id
+
+
+class Outbox:
+    """ Commits receipts from `workers` background threads, recording them in `store` (an
+    `SQLiteOutboxStore` when given a path) first.
+
+    Receipts are validated when enqueued. Requests that fail, because AFIP is down or the circuit
+    breaker is open, are tried again every `retry_delay` seconds until they succeed.
+
+    `start` resumes the entries left unfinished in the store, `callback` is called with the
+    future of every entry, resumed ones included. A store must only be used by an outbox at a
+    time, so processes sharing a backend need a store each.
+    """
+
+    WORKERS = 4
+    RETRY_DELAY = 30.0
+
+    def __init__(
+        self,
+        backend: AFIPBackend,
+        store: Union[BaseOutboxStore, str],
+        workers: int = WORKERS,
+        retry_delay: float = RETRY_DELAY,
+        callback: Optional[Callable[[OutboxFuture], None]] = None,
+    ):
+        self.backend = backend
+        self.store = store if isinstance(store, BaseOutboxStore) else SQLiteOutboxStore(store)
+        self.workers = workers
+        self.retry_delay = retry_delay
+        self.callback = callback
+        self._jobs: Dict[int, Tuple[OutboxEntry, 'receipt.Receipt', OutboxFuture]] = {}
+        self._queue: 'queue.Queue[Optional[int]]' = queue.Queue()
+        self._threads: List[threading.Thread] = []
+        self._timers: Dict[int, threading.Timer] = {}
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> 'Outbox':
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def start(self) -> 'Outbox':
+        for entry in self.store.unfinished():
+            # entries enqueued before starting are already there
+            if entry.id in self._jobs:
+                continue
+
+            future = self._add_job(entry, load_receipt(entry.receipt, self.backend))
+
+            # a numbered receipt may be authorized already, it can't be cancelled
+            if entry.state == NUMBERED_STATE:
+                future.set_running_or_notify_cancel()
+
+        self._threads = [
+            threading.Thread(target=self._work, daemon=True) for _ in range(self.workers)
+        ]
+
+        for thread in self._threads:
+            thread.start()
+
+        return self
+
+    def enqueue(self, pending_receipt: 'receipt.Receipt') -> OutboxFuture:
+        """ Record `pending_receipt` and return a future resolving to it once committed. The
+        future can be cancelled until a request is made for the receipt.
+        """
+        self.backend.validate_receipt(pending_receipt)
+        entry = self.store.add(dump_receipt(pending_receipt))
+
+        return self._add_job(entry, pending_receipt)
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """ Stop the workers once they finish their current receipt. Entries still queued are
+        kept in the store, for the next outbox to resume.
+        """
+        with self._lock:
+            timers = list(self._timers.values())
+            self._timers.clear()
+
+        for timer in timers:
+            timer.cancel()
+
+        for _ in self._threads:
+            self._queue.put(None)
+
+        for thread in self._threads:
+            thread.join(timeout)
+
+        self._threads = []
+
+    def _add_job(self, entry: OutboxEntry, pending_receipt: 'receipt.Receipt') -> OutboxFuture:
+        future = OutboxFuture(entry.id)
+
+        if self.callback is not None:
+            future.add_done_callback(self.callback)
+
+        with self._lock:
+            self._jobs[entry.id] = (entry, pending_receipt, future)
+
+        self._queue.put(entry.id)
+
+        return future
+
+    def _work(self) -> None:
+        while True:
+            entry_id = self._queue.get()
+
+            if entry_id is None:
+                return
+
+            self._process(entry_id)
+
+    def _process(self, entry_id: int) -> None:
+        entry, pending_receipt, future = self._jobs[entry_id]
+
+        if not future.running() and not future.set_running_or_notify_cancel():
+            self.store.remove(entry_id)
+            self._finish(entry_id)
+
+            return
+
+        try:
+            if entry.state == NUMBERED_STATE and self._recover(entry, pending_receipt):
+                logger.info('Recovered the CAE of outbox entry %s', entry_id)
+            else:
+                self.backend.commit(
+                    pending_receipt,
+                    lambda invoice_number: self._update(entry, NUMBERED_STATE, invoice_number),
+                )
+        except Exception:
+            logger.exception(
+                'Could not commit outbox entry %s, retrying in %s seconds',
+                entry_id,
+                self.retry_delay,
+            )
+            self._retry(entry_id)
+
+            return
+
+        entry.receipt = dump_receipt(pending_receipt)
+        self._update(
+            entry,
+            REJECTED_STATE if pending_receipt.errors else AUTHORIZED_STATE,
+            pending_receipt.number if not pending_receipt.errors else entry.number,
+        )
+        self._finish(entry_id)
+        future.set_result(pending_receipt)
+
+    def _recover(self, entry: OutboxEntry, pending_receipt: 'receipt.Receipt') -> bool:
+        """ Look up a receipt which may have been authorized with its entry's number, moving the
+        entry back to pending if it wasn't. Any other failure leaves the entry numbered, the
+        receipt may still be authorized.
+        """
+        try:
+            if self.backend.recover(pending_receipt, entry.number):
+                return True
+        except NumberTakenError:
+            logger.warning(
+                'Invoice %s of outbox entry %s was authorized for another receipt',
+                entry.number,
+                entry.id,
+            )
+
+        self._update(entry, PENDING_STATE)
+
+        return False
+
+    def _update(self, entry: OutboxEntry, state: str, number: Optional[int] = None) -> None:
+        entry.state = state
+        entry.number = number
+        self.store.update(entry)
+
+    def _retry(self, entry_id: int) -> None:
+        timer = threading.Timer(self.retry_delay, self._requeue, (entry_id,))
+        timer.daemon = True
+
+        with self._lock:
+            self._timers[entry_id] = timer
+
+        timer.start()
+
+    def _requeue(self, entry_id: int) -> None:
+        with self._lock:
+            if self._timers.pop(entry_id, None) is None:
+                return
+
+        self._queue.put(entry_id)
+
+    def _finish(self, entry_id: int) -> None:
+        with self._lock:
+            self._jobs.pop(entry_id, None)
@@ -0,0 +1,34 @@
+import threading
+from typing import Any, Callable, Tuple
+
+
+class ClientPool:
+    """ Keeps connected SOAP clients alive for as long as the pool lives.
+
+    py3afipws clients hold per-request state (the invoice being built, the last result), so they
+    can't be shared between threads. Instead, each thread gets its own client, which is reused
+    on every call until the credentials it was built with change or the pool is cleared.
+    """
+
+    def __init__(self, factory: Callable[[str, str], Any]):
+        self.factory = factory
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._generation = 0
+
+    def _key(self, token: str, sign: str) -> Tuple[int, str, str]:
+        return self._generation, token, sign
+
+    def get(self, token: str, sign: str) -> Any:
+        key = self._key(token, sign)
+
+        if getattr(self._local, 'key', None) != key:
+            self._local.client = self.factory(token, sign)
+            self._local.key = key
+
+        return self._local.client
+
+    def clear(self) -> None:
+        """ Drop every pooled client, forcing each thread to reconnect on its next call. """
+        with self._lock:
+            self._generation += 1
@@ -0,0 +1,166 @@
+import collections
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .afip import AFIPBackend
+from .wsdl import WSDLCache
+
+RegistryKey = Tuple[str, bool, str]
+KeyLoader = Callable[[str, bool], Tuple[str, str]]
+
+
+class UnknownServiceError(Exception):
+    pass
+
+
+class RegistryEntry:
+    __slots__ = ('backend', 'used_at')
+
+    def __init__(self, backend: AFIPBackend, used_at: float):
+        self.backend = backend
+        self.used_at = used_at
+
+
+class BackendRegistry:
+    """ Keeps a backend for each company (cuit, environment and service) a process invoices for,
+    along with its WSAA ticket, parsed private key and connected clients.
+
+    Certificates and private keys are only read, through `loader`, when a company's backend is
+    first needed. Up to `max_size` backends are kept, dropping the least recently used ones, and
+    those left unused for `ttl` seconds. Dropped backends aren't closed, as other threads may
+    still be using them, they stop refreshing their ticket once garbage collected instead.
+    Tickets outlive them in their credential store, so getting them back doesn't log into WSAA
+    again.
+
+    `options` are passed to every backend (a `credential_store`, a `receipt_cache`...), they
+    also share a single `WSDLCache` unless given one. Safe to share between threads.
+    """
+
+    MAX_SIZE = 128
+    TTL = 3600.0
+
+    def __init__(
+        self,
+        loader: KeyLoader,
+        max_size: int = MAX_SIZE,
+        ttl: float = TTL,
+        backends: Optional[Dict[str, Callable[..., AFIPBackend]]] = None,
+        clock: Callable[[], float] = time.monotonic,
+        **options: Any,
+    ):
+        self.loader = loader
+        self.max_size = max_size
+        self.ttl = ttl
+        self.backends = backends if backends is not None else {AFIPBackend.SERVICE: AFIPBackend}
+        self.clock = clock
+        self.options = options
+        self.options.setdefault('cache', WSDLCache())
+        self._entries: 'collections.OrderedDict[RegistryKey, RegistryEntry]' = (
+            collections.OrderedDict()
+        )
+        self._creation_locks: Dict[RegistryKey, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def get(
+        self,
+        cuit: str,
+        production: bool = False,
+        service: str = AFIPBackend.SERVICE,
+    ) -> AFIPBackend:
+        if service not in self.backends:
+            raise UnknownServiceError(service)
+
+        key = (cuit, production, service)
+        backend = self._lookup(key)
+
+        if backend is not None:
+            return backend
+
+        with self._lock:
+            creation_lock = self._creation_locks.setdefault(key, threading.Lock())
+
+        # the lock is only held by the threads waiting for this company's backend
+        with creation_lock:
+            backend = self._lookup(key)
+
+            if backend is not None:
+                return backend
+
+            certificate, private_key = self.loader(cuit, production)
+            backend = self.backends[service](
+                certificate,
+                private_key,
+                cuit,
+                production=production,
+                **self.options,
+            )
+
+            with self._lock:
+                self._entries.pop(key, None)
+                self._entries[key] = RegistryEntry(backend, self.clock())
+                self._evict()
+
+        return backend
+
+    def remove(
+        self,
+        cuit: str,
+        production: bool = False,
+        service: str = AFIPBackend.SERVICE,
+    ) -> None:
+        """ Drop and close the backend of a company, so its certificate and key are read again.
+        It must not be in use anymore.
+        """
+        with self._lock:
+            entry = self._entries.pop((cuit, production, service), None)
+            self._creation_locks.pop((cuit, production, service), None)
+
+        if entry is not None:
+            self._close([entry.backend])
+
+    def clear(self) -> None:
+        """ Drop and close every backend, none of them must be in use anymore. """
+        with self._lock:
+            dropped = [entry.backend for entry in self._entries.values()]
+            self._entries.clear()
+            self._creation_locks.clear()
+
+        self._close(dropped)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: RegistryKey) -> bool:
+        return key in self._entries
+
+    def _lookup(self, key: RegistryKey) -> Optional[AFIPBackend]:
+        with self._lock:
+            self._evict()
+            entry = self._entries.get(key)
+
+            if entry is None:
+                return None
+
+            entry.used_at = self.clock()
+            self._entries.move_to_end(key)
+
+            return entry.backend
+
+    def _evict(self) -> None:
+        """ Remove the expired entries and the least recently used ones over `max_size`. Must
+        be called holding the lock.
+        """
+        limit = self.clock() - self.ttl
+
+        # entries are kept from the least to the most recently used
+        for key, entry in list(self._entries.items()):
+            if entry.used_at > limit and len(self._entries) <= self.max_size:
+                break
+
+            del self._entries[key]
+            self._creation_locks.pop(key, None)
+
+    def _close(self, backends: List[AFIPBackend]) -> None:
+        for backend in backends:
+            backend.close()
@@ -0,0 +1,231 @@
+""" Retries and circuit breaking for the calls made to AFIP.
+
+Only transient errors (timeouts, dropped connections, unreachable servers) are retried, a
+service answering with an error is working as intended. Which errors are transient depends on
+the HTTP library of each backend, so it's given as a predicate.
+"""
+import logging
+import random
+import sys
+import threading
+import time
+from typing import Awaitable, Callable, Optional, TypeVar
+
+from juryou import utils
+
+asyncio = utils.lazy_import('asyncio')
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+Predicate = Callable[[BaseException], bool]
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class RetryPolicy:
+    """ How many times a call failing with a transient error is attempted, and how long to wait
+    in between.
+
+    Delays grow exponentially from `base_delay` up to `max_delay`, each one picked at random
+    below that cap ("full jitter"), so clients which failed together don't retry together.
+    """
+
+    ATTEMPTS = 3
+    BASE_DELAY = 0.5
+    MAX_DELAY = 10.0
+
+    def __init__(
+        self,
+        attempts: int = ATTEMPTS,
+        base_delay: float = BASE_DELAY,
+        max_delay: float = MAX_DELAY,
+    ):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int) -> float:
+        """ Seconds to wait after the given (1 based) failed attempt. """
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+class CircuitBreaker:
+    """ Stops calling a service after `threshold` consecutive transient failures.
+
+    While open, calls fail right away with `CircuitOpenError` instead of piling up on a service
+    which is down. After `reset_timeout` seconds a single trial call is let through: the circuit
+    closes if it succeeds and opens again otherwise. Safe to share between threads.
+    """
+
+    THRESHOLD = 5
+    RESET_TIMEOUT = 30.0
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(
+        self,
+        threshold: int = THRESHOLD,
+        reset_timeout: float = RESET_TIMEOUT,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return self.CLOSED
+
+            if self._trial or self.clock() - self._opened_at < self.reset_timeout:
+                return self.OPEN
+
+            return self.HALF_OPEN
+
+    def before_call(self) -> None:
+        """ Raise `CircuitOpenError` unless the call can go through. """
+        with self._lock:
+            if self._opened_at is None:
+                return
+
+            remaining = self._opened_at + self.reset_timeout - self.clock()
+
+            if self._trial or remaining > 0:
+                raise CircuitOpenError(
+                    f'Too many failed calls, not retrying for {max(remaining, 0):.1f} seconds',
+                )
+
+            self._trial = True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial = False
+
+    def release(self) -> None:
+        """ Let another trial call through when the current one ended without an outcome. """
+        with self._lock:
+            self._trial = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+
+            if self._trial or self._failures >= self.threshold:
+                self._opened_at = self.clock()
+
+            self._trial = False
+
+
+def guard(
+    function: Callable[[], T],
+    breaker: Optional[CircuitBreaker],
+    is_transient: Predicate,
+) -> T:
+    """ Call `function` once through `breaker`. """
+    if breaker is None:
+        return function()
+
+    breaker.before_call()
+
+    try:
+        result = function()
+    except BaseException as error:
+        _record(breaker, is_transient, error)
+        raise
+
+    breaker.record_success()
+
+    return result
+
+
+def call(
+    function: Callable[[], T],
+    policy: RetryPolicy,
+    breaker: Optional[CircuitBreaker],
+    is_transient: Predicate,
+) -> T:
+    """ Call `function` through `breaker`, retrying it as `policy` says on transient errors. """
+    attempt = 1
+
+    while True:
+        try:
+            return guard(function, breaker, is_transient)
+        except Exception as error:
+            if not is_transient(error) or attempt >= policy.attempts:
+                raise
+
+            delay = policy.delay(attempt)
+            logger.warning('Attempt %s failed with %r, retrying in %.2fs', attempt, error, delay)
+            time.sleep(delay)
+            attempt += 1
+
+
+async def guard_async(
+    function: Callable[[], Awaitable[T]],
+    breaker: Optional[CircuitBreaker],
+    is_transient: Predicate,
+) -> T:
+    """ Like `guard`, for coroutine functions. """
+    if breaker is None:
+        return await function()
+
+    breaker.before_call()
+
+    try:
+        result = await function()
+    except BaseException as error:
+        _record(breaker, is_transient, error)
+        raise
+
+    breaker.record_success()
+
+    return result
+
+
+async def call_async(
+    function: Callable[[], Awaitable[T]],
+    policy: RetryPolicy,
+    breaker: Optional[CircuitBreaker],
+    is_transient: Predicate,
+) -> T:
+    """ Like `call`, for coroutine functions. """
+    attempt = 1
+
+    while True:
+        try:
+            return await guard_async(function, breaker, is_transient)
+        except Exception as error:
+            if not is_transient(error) or attempt >= policy.attempts:
+                raise
+
+            delay = policy.delay(attempt)
+            logger.warning('Attempt %s failed with %r, retrying in %.2fs', attempt, error, delay)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+
+def _record(breaker: CircuitBreaker, is_transient: Predicate, error: BaseException) -> None:
+    if is_transient(error):
+        breaker.record_failure()
+    elif _is_cancellation(error) or not isinstance(error, Exception):
+        breaker.release()
+    else:
+        # the service answered, so it's up even if the call failed
+        breaker.record_success()
+
+
+def _is_cancellation(error: BaseException) -> bool:
+    # a cancelled task means asyncio is loaded already, synchronous calls shouldn't load it
+    return 'asyncio' in sys.modules and isinstance(error, asyncio.CancelledError)
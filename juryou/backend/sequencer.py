@@ -0,0 +1,156 @@
+import abc
+import contextlib
+import json
+import os
+import threading
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+SequenceKey = Tuple[str, int, int]
+
+
+class Sequence:
+    """ Numbering state of a (cuit, point of sale, type) key while it's reserved. """
+
+    def __init__(self, last: Optional[int], seed: Optional[Callable[[], int]] = None):
+        self.last = last
+        self.seed = seed
+
+    @property
+    def next(self) -> int:
+        return self.last + 1
+
+    def advance(self, count: int = 1) -> None:
+        self.last += count
+
+    def resync(self) -> None:
+        """ Discard the local state and reload the last authorized number from the backend. """
+        self.last = self.seed()
+
+
+class BaseSequencer(abc.ABC):
+    """ Hands out invoice numbers without asking AFIP for the last authorized one every time.
+
+    AFIP only accepts the number following the last authorized one, so a key stays reserved (and
+    locked) until the receipts using its numbers have been authorized or rejected.
+    """
+
+    @contextlib.contextmanager
+    def reserve(
+        self,
+        key: SequenceKey,
+        seed: Optional[Callable[[], int]] = None,
+    ) -> Iterator[Sequence]:
+        """ Lock the given key and yield its sequence.
+
+        `seed` returns the last authorized number and is only called when the sequencer has no
+        state for the key. Without a seed, `last` is `None` for unknown keys and must be set by
+        the caller. Whatever the sequence holds when the block exits is persisted.
+        """
+        with self._lock(key):
+            last = self._load(key)
+
+            if last is None and seed is not None:
+                last = seed()
+
+            sequence = Sequence(last, seed)
+
+            try:
+                yield sequence
+            except BaseException:
+                self._forget(key)
+                raise
+
+            if sequence.last is not None:
+                self._store(key, sequence.last)
+
+    @abc.abstractmethod
+    def _lock(self, key: SequenceKey) -> contextlib.AbstractContextManager:
+        pass
+
+    @abc.abstractmethod
+    def _load(self, key: SequenceKey) -> Optional[int]:
+        pass
+
+    @abc.abstractmethod
+    def _store(self, key: SequenceKey, last: int) -> None:
+        pass
+
+    @abc.abstractmethod
+    def _forget(self, key: SequenceKey) -> None:
+        pass
+
+
+class MemorySequencer(BaseSequencer):
+    """ Keeps the sequences in memory, shared between the threads of a single process. """
+
+    def __init__(self):
+        self._sequences: Dict[SequenceKey, int] = {}
+        self._locks: Dict[SequenceKey, threading.Lock] = {}
+        self._locks_lock = threading.Lock()
+
+    def _lock(self, key: SequenceKey) -> contextlib.AbstractContextManager:
+        with self._locks_lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def _load(self, key: SequenceKey) -> Optional[int]:
+        return self._sequences.get(key)
+
+    def _store(self, key: SequenceKey, last: int) -> None:
+        self._sequences[key] = last
+
+    def _forget(self, key: SequenceKey) -> None:
+        self._sequences.pop(key, None)
+
+
+class FileSequencer(MemorySequencer):
+    """ Keeps each sequence in its own file inside `directory`.
+
+    Files are locked while the key is reserved, so numbers are handed out atomically across
+    every process sharing the directory. Locking them needs `fcntl`, which Windows doesn't have,
+    a `MemorySequencer` must be used there instead.
+    """
+
+    def __init__(self, directory: str):
+        if fcntl is None:
+            raise NotImplementedError('FileSequencer needs fcntl, use a MemorySequencer instead')
+
+        super().__init__()
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: SequenceKey) -> str:
+        return os.path.join(self.directory, '{}-{}-{}.json'.format(*key))
+
+    @contextlib.contextmanager
+    def _lock(self, key: SequenceKey) -> Iterator[None]:
+        with super()._lock(key), open(self._path(key) + '.lock', 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _load(self, key: SequenceKey) -> Optional[int]:
+        try:
+            with open(self._path(key), 'r') as sequence_file:
+                return json.load(sequence_file)['last']
+        except (FileNotFoundError, ValueError, KeyError):
+            return None
+
+    def _store(self, key: SequenceKey, last: int) -> None:
+        path = self._path(key)
+
+        with open(path + '.tmp', 'w') as sequence_file:
+            json.dump({'last': last}, sequence_file)
+
+        os.replace(path + '.tmp', path)
+
+    def _forget(self, key: SequenceKey) -> None:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self._path(key))
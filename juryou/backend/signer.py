@@ -0,0 +1,33 @@
+from base64 import b64encode
+
+from juryou import utils
+
+x509 = utils.lazy_import('cryptography.x509')
+hashes = utils.lazy_import('cryptography.hazmat.primitives.hashes')
+serialization = utils.lazy_import('cryptography.hazmat.primitives.serialization')
+pkcs7 = utils.lazy_import('cryptography.hazmat.primitives.serialization.pkcs7')
+
+
+class TRASigner:
+    """ Signs WSAA access requests (TRA) as CMS, loading the certificate and key only once. """
+
+    def __init__(self, certificate: str, private_key: str):
+        self.certificate = x509.load_pem_x509_certificate(certificate.encode('latin1'))
+        self.private_key = serialization.load_pem_private_key(
+            private_key.encode('latin1'),
+            password=None,
+        )
+
+    def sign(self, tra: str) -> str:
+        cms = pkcs7.PKCS7SignatureBuilder().set_data(
+            tra.encode('utf-8'),
+        ).add_signer(
+            self.certificate,
+            self.private_key,
+            hashes.SHA256(),
+        ).sign(
+            serialization.Encoding.DER,
+            [pkcs7.PKCS7Options.Binary],
+        )
+
+        return b64encode(cms).decode('latin1')
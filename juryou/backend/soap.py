@@ -0,0 +1,126 @@
+""" Minimal SOAP 1.1 serialization for the AFIP web services.
+
+py3afipws builds its requests from the parsed WSDL on every connection, which is only needed
+for its generic clients. The few operations juryou talks to directly are encoded here from plain
+dicts: a dict becomes a sequence of child elements, a list repeats the element for each value and
+`None` values are left out. Parsed responses follow the same rules, with every leaf as a string.
+"""
+from typing import Any, Dict, List, Optional, Union
+from xml.etree import ElementTree
+
+SOAP_ENVELOPE_NAMESPACE = 'http://schemas.xmlsoap.org/soap/envelope/'
+WSAA_NAMESPACE = 'http://wsaa.view.sua.dvadac.desein.afip.gov'
+WSFEV1_NAMESPACE = 'http://ar.gov.afip.dif.FEV1/'
+
+Value = Union[str, Dict[str, Any], List[Any]]
+
+
+class SoapFault(Exception):
+    def __init__(self, code: str, message: str):
+        super().__init__(f'{code}: {message}')
+        self.code = code
+        self.message = message
+
+
+def _local_name(tag: str) -> str:
+    return tag.rsplit('}', 1)[-1]
+
+
+def _append(parent: ElementTree.Element, namespace: str, values: Dict[str, Any]) -> None:
+    for name, value in values.items():
+        if value is None:
+            continue
+
+        for item in value if isinstance(value, list) else [value]:
+            element = ElementTree.SubElement(parent, f'{{{namespace}}}{name}')
+
+            if isinstance(item, dict):
+                _append(element, namespace, item)
+            else:
+                element.text = str(item)
+
+
+def _to_value(element: ElementTree.Element) -> Value:
+    children = list(element)
+
+    if not children:
+        return element.text or ''
+
+    values: Dict[str, Any] = {}
+
+    for child in children:
+        name = _local_name(child.tag)
+        value = _to_value(child)
+
+        if name not in values:
+            values[name] = value
+        elif isinstance(values[name], list):
+            values[name].append(value)
+        else:
+            values[name] = [values[name], value]
+
+    return values
+
+
+def as_list(value: Any) -> List[Any]:
+    """ Repeated elements are only parsed as lists when there's more than one of them. """
+    if value is None or value == '':
+        return []
+
+    return value if isinstance(value, list) else [value]
+
+
+def build_envelope(namespace: str, operation: str, arguments: Dict[str, Any]) -> bytes:
+    envelope = ElementTree.Element(f'{{{SOAP_ENVELOPE_NAMESPACE}}}Envelope')
+    body = ElementTree.SubElement(envelope, f'{{{SOAP_ENVELOPE_NAMESPACE}}}Body')
+    _append(body, namespace, {operation: arguments})
+
+    return ElementTree.tostring(envelope, encoding='utf-8')
+
+
+def build_fault(code: str, message: str) -> bytes:
+    envelope = ElementTree.Element(f'{{{SOAP_ENVELOPE_NAMESPACE}}}Envelope')
+    body = ElementTree.SubElement(envelope, f'{{{SOAP_ENVELOPE_NAMESPACE}}}Body')
+    fault = ElementTree.SubElement(body, f'{{{SOAP_ENVELOPE_NAMESPACE}}}Fault')
+    ElementTree.SubElement(fault, 'faultcode').text = code
+    ElementTree.SubElement(fault, 'faultstring').text = message
+
+    return ElementTree.tostring(envelope, encoding='utf-8')
+
+
+def parse_envelope(xml: bytes) -> Dict[str, Any]:
+    """ Parse a request or response envelope into a dict of the body contents, which has the
+    operation (or operation response) as its only key.
+    """
+    body = ElementTree.fromstring(xml).find(f'{{{SOAP_ENVELOPE_NAMESPACE}}}Body')
+
+    if body is None or not len(body):
+        raise SoapFault('Client', 'Missing SOAP body')
+
+    fault = body.find(f'{{{SOAP_ENVELOPE_NAMESPACE}}}Fault')
+
+    if fault is not None:
+        raise SoapFault(fault.findtext('faultcode', ''), fault.findtext('faultstring', ''))
+
+    return {_local_name(body[0].tag): _to_value(body[0])}
+
+
+def parse_fault(xml: Union[str, bytes]) -> Optional[SoapFault]:
+    """ Return the fault a response envelope holds, or `None` if it isn't one. """
+    try:
+        body = ElementTree.fromstring(xml).find(f'{{{SOAP_ENVELOPE_NAMESPACE}}}Body')
+    except ElementTree.ParseError:
+        return None
+
+    fault = body.find(f'{{{SOAP_ENVELOPE_NAMESPACE}}}Fault') if body is not None else None
+
+    if fault is None:
+        return None
+
+    return SoapFault(fault.findtext('faultcode', ''), fault.findtext('faultstring', ''))
+
+
+def parse_xml(xml: Union[str, bytes]) -> Dict[str, Any]:
+    root = ElementTree.fromstring(xml)
+
+    return {_local_name(root.tag): _to_value(root)}
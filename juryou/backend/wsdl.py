@@ -0,0 +1,164 @@
+import contextlib
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from datetime import timedelta
+from typing import Any, Iterator, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from juryou import utils
+
+client = utils.lazy_import('py3simplesoap.client')
+
+CACHE_DIR_ENVIRONMENT_VARIABLE = 'JURYOU_CACHE_DIR'
+WSDL_TTL = timedelta(days=7)
+VERSION_FILENAME = 'version.json'
+LOCK_FILENAME = '.lock'
+CACHED_EXTENSIONS = ('.xml', '.pkl')
+
+
+def default_cache_dir() -> str:
+    """ `$JURYOU_CACHE_DIR`, or a `juryou/wsdl` directory in the user's cache directory. """
+    directory = os.environ.get(CACHE_DIR_ENVIRONMENT_VARIABLE)
+
+    if directory:
+        return directory
+
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+
+    return os.path.join(cache_home, 'juryou', 'wsdl')
+
+
+class WSDLCache:
+    """ Directory where the SOAP clients keep the service descriptions they download.
+
+    pysimplesoap stores each downloaded document (`<md5 of the url>.xml`) along with the parsed
+    description (`.pkl`), so clients connecting later neither fetch nor parse it. It never
+    expires them though, so files older than `ttl` are removed before connecting, as is the
+    whole cache when it was written by another pysimplesoap or python version.
+
+    Connecting with a stale or missing description is done under a file lock, so only one
+    process downloads it and nobody reads a half written pickle.
+    """
+
+    def __init__(self, directory: Optional[str] = None, ttl: timedelta = WSDL_TTL):
+        self.directory = directory if directory is not None else default_cache_dir()
+        self.ttl = ttl
+        self._checked = False
+        self._lock = threading.Lock()
+
+    def connect(
+        self,
+        soap_client: Any,
+        wsdl: str,
+        refresh: bool = False,
+        **options: Any,
+    ) -> None:
+        """ Connect a py3afipws client to `wsdl` through the cache, passing it `options` (like
+        `timeout`). With `refresh`, the description is downloaded again even if it hasn't expired.
+        """
+        if not refresh and self._checked and self.is_fresh(wsdl):
+            soap_client.Conectar(wsdl=wsdl, cache=self.directory, **options)
+            return
+
+        with self._exclusive():
+            self._check_version()
+
+            if refresh or not self.is_fresh(wsdl):
+                self.expire()
+                self._remove(wsdl)
+
+            soap_client.Conectar(wsdl=wsdl, cache=self.directory, **options)
+
+    def is_fresh(self, url: str) -> bool:
+        try:
+            modified = os.path.getmtime(self._path(url, '.pkl'))
+        except OSError:
+            return False
+
+        return time.time() - modified < self.ttl.total_seconds()
+
+    def expire(self) -> None:
+        """ Remove the cached documents older than `ttl`. """
+        limit = time.time() - self.ttl.total_seconds()
+
+        for entry in self._entries():
+            with contextlib.suppress(FileNotFoundError):
+                if entry.stat().st_mtime < limit:
+                    os.remove(entry.path)
+
+    def clear(self) -> None:
+        for entry in self._entries():
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(entry.path)
+
+    def _path(self, url: str, extension: str) -> str:
+        return os.path.join(self.directory, hashlib.md5(url.encode('utf8')).hexdigest() + extension)
+
+    def _remove(self, url: str) -> None:
+        for extension in CACHED_EXTENSIONS:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(self._path(url, extension))
+
+    def _entries(self) -> Iterator[os.DirEntry]:
+        if not os.path.isdir(self.directory):
+            return iter(())
+
+        return (
+            entry
+            for entry in os.scandir(self.directory)
+            if entry.name.endswith(CACHED_EXTENSIONS)
+        )
+
+    def _version(self) -> dict:
+        return {
+            'pysimplesoap': client.__version__,
+            'python': '{}.{}'.format(*sys.version_info),
+        }
+
+    def _check_version(self) -> None:
+        if self._checked:
+            return
+
+        path = os.path.join(self.directory, VERSION_FILENAME)
+        version = self._version()
+
+        try:
+            with open(path, 'r') as version_file:
+                stored_version = json.load(version_file)
+        except (FileNotFoundError, ValueError):
+            stored_version = None
+
+        if stored_version != version:
+            self.clear()
+
+            with open(path + '.tmp', 'w') as version_file:
+                json.dump(version, version_file)
+
+            os.replace(path + '.tmp', path)
+
+        self._checked = True
+
+    @contextlib.contextmanager
+    def _exclusive(self) -> Iterator[None]:
+        os.makedirs(self.directory, exist_ok=True)
+
+        with self._lock, open(os.path.join(self.directory, LOCK_FILENAME), 'w') as lock_file:
+            # without fcntl, only the threads of this process are kept out
+            if fcntl is None:
+                yield
+                return
+
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
@@ -0,0 +1,177 @@
+from array import array
+from datetime import date as date_type, datetime, timezone
+from decimal import Decimal
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, Optional
+
+from . import utils
+from .company import Company
+from .customer import Customer
+from .receipt import Receipt, C_INVOICE_TYPE, PRODUCT_INVOICE_CONCEPT
+
+if TYPE_CHECKING:
+    from . import backend
+
+ITEM_NAME = 'Item'
+COMMIT_CHUNK_SIZE = 250
+
+
+def _date_to_int(value: date_type) -> int:
+    return value.year * 10000 + value.month * 100 + value.day
+
+
+def _int_to_date(value: int) -> datetime:
+    return datetime(value // 10000, value // 100 % 100, value % 100)
+
+
+class ReceiptBatch:
+    """ Many receipts of a single company and backend, stored by column.
+
+    Each receipt takes a few machine words in typed arrays instead of a set of objects, so
+    millions of them fit in memory for reconciliation. Receipts only keep their total, they are
+    materialized with a single item holding it. Numbers, CAEs and dates are stored as integers
+    (0 standing for a missing value), totals as cents and documents as the number AFIP receives,
+    so leading zeros aren't kept.
+
+    Backends and printers still work on `Receipt` objects, which are built from the columns only
+    while they're needed: `commit` builds a chunk at a time, and iterating the batch builds them
+    one by one, so `printer.print_many(batch)` only holds the receipts being printed.
+    """
+
+    __slots__ = (
+        'company',
+        'backend',
+        'points_of_sale',
+        'types',
+        'concepts',
+        'dates',
+        'totals',
+        'documents',
+        'names',
+        'numbers',
+        'caes',
+        'cae_expirations',
+        'errors',
+    )
+
+    def __init__(self, company: Company, backend: 'backend.BaseBackend'):
+        self.company = company
+        self.backend = backend
+        self.points_of_sale = array('i')
+        self.types = array('i')
+        self.concepts = array('i')
+        self.dates = array('i')
+        self.totals = array('q')
+        self.documents = array('q')
+        self.names: List[str] = []
+        self.numbers = array('q')
+        self.caes = array('q')
+        self.cae_expirations = array('i')
+        self.errors: Dict[int, List[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self.totals)
+
+    def __iter__(self) -> Iterator[Receipt]:
+        return (self.receipt(index) for index in range(len(self)))
+
+    def append(
+        self,
+        customer: Customer,
+        total: Decimal,
+        point_of_sale: int,
+        date: Optional[datetime] = None,
+        type: int = C_INVOICE_TYPE,
+        concept: int = PRODUCT_INVOICE_CONCEPT,
+        number: Optional[int] = None,
+        cae: Optional[str] = None,
+        cae_expiration: Optional[datetime] = None,
+    ) -> int:
+        """ Add a receipt to the batch, returning its index. """
+        self.points_of_sale.append(point_of_sale)
+        self.types.append(type)
+        self.concepts.append(concept)
+        self.dates.append(_date_to_int(date if date is not None else datetime.now(timezone.utc)))
+        self.totals.append(int(utils.quantize_decimal(Decimal(total)) * 100))
+        self.documents.append(int(customer.identity_document))
+        self.names.append(customer.name)
+        self.numbers.append(number or 0)
+        self.caes.append(int(cae) if cae else 0)
+        self.cae_expirations.append(_date_to_int(cae_expiration) if cae_expiration else 0)
+
+        return len(self) - 1
+
+    def add(self, receipt: Receipt) -> int:
+        index = self.append(
+            receipt.customer,
+            receipt.total,
+            receipt.point_of_sale,
+            receipt.date,
+            receipt.type,
+            receipt.concept,
+            receipt.number,
+            receipt.cae,
+            receipt.cae_expiration,
+        )
+
+        if receipt.errors:
+            self.errors[index] = list(receipt.errors)
+
+        return index
+
+    def extend(self, receipts: Iterable[Receipt]) -> None:
+        for receipt in receipts:
+            self.add(receipt)
+
+    def total(self, index: int) -> Decimal:
+        return Decimal(self.totals[index]) / 100
+
+    def receipt(self, index: int) -> Receipt:
+        """ Build the receipt stored at `index`. Changes to it aren't kept, see `store`. """
+        receipt = Receipt(
+            self.company,
+            Customer(str(self.documents[index]), self.names[index]),
+            self.points_of_sale[index],
+            self.backend,
+            _int_to_date(self.dates[index]),
+            self.types[index],
+            self.concepts[index],
+        )
+        receipt.add_item(ITEM_NAME, 1, self.total(index))
+        receipt.number = self.numbers[index] or None
+        receipt.cae = str(self.caes[index]) if self.caes[index] else None
+        receipt.errors = list(self.errors.get(index, []))
+
+        if self.cae_expirations[index]:
+            receipt.cae_expiration = _int_to_date(self.cae_expirations[index])
+
+        return receipt
+
+    def store(self, index: int, receipt: Receipt) -> None:
+        """ Keep the authorization data of a receipt built from this batch. """
+        self.numbers[index] = receipt.number or 0
+        self.caes[index] = int(receipt.cae) if receipt.cae else 0
+        self.cae_expirations[index] = (
+            _date_to_int(receipt.cae_expiration) if receipt.cae_expiration else 0
+        )
+
+        if receipt.errors:
+            self.errors[index] = list(receipt.errors)
+        else:
+            self.errors.pop(index, None)
+
+    def pending(self) -> Iterator[int]:
+        """ Indexes of the receipts without a CAE. """
+        return (index for index, cae in enumerate(self.caes) if not cae)
+
+    def commit(self, chunk_size: int = COMMIT_CHUNK_SIZE) -> None:
+        """ Commit the pending receipts through the backend, `chunk_size` of them at a time so
+        only that many receipt objects exist at once.
+        """
+        indexes = list(self.pending())
+
+        for chunk in utils.chunks(indexes, chunk_size):
+            receipts = [self.receipt(index) for index in chunk]
+            self.backend.commit_many(receipts)
+
+            for index, receipt in zip(chunk, receipts):
+                self.store(index, receipt)
@@ -0,0 +1,287 @@
+import collections
+import csv
+import functools
+import itertools
+import json
+import os
+import sys
+import threading
+from typing import (
+    IO,
+    AbstractSet,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Tuple,
+)
+
+import juryou
+from juryou import utils
+from juryou.backend.afip import EmptyInvoiceError, MissingCustomerDataError, NumberTakenError
+from juryou.printer import Printer, get_printer
+from .serialization import MissingCompanyError, receipt_from_data
+
+JSONL_FORMAT = 'jsonl'
+CSV_FORMAT = 'csv'
+FORMATS = (JSONL_FORMAT, CSV_FORMAT)
+CHUNK_SIZE = 250
+COMMIT_WORKERS = 4
+CAE_EXPIRATION_FORMAT = '%Y-%m-%d'
+INVALID_DATA_ERRORS = (
+    KeyError,
+    ValueError,
+    ArithmeticError,
+    MissingCompanyError,
+    MissingCustomerDataError,
+    EmptyInvoiceError,
+)
+
+# a receipt's reference in the input (its `reference` or line number) and its json data
+Record = Tuple[str, dict]
+# a committed receipt, or None if it couldn't be built, and its error
+Result = Tuple[str, Optional['juryou.Receipt'], Optional[str]]
+# the point of sale, type and invoice number a receipt was last requested with
+Checkpoint = Tuple[int, int, int]
+
+
+def read_jsonl(stream: IO[str]) -> Iterator[Record]:
+    """ One receipt per line, in the format read by `generate`. """
+    for line_number, line in enumerate(stream, 1):
+        if line.strip():
+            receipt_data = json.loads(line)
+
+            yield str(receipt_data.get('reference', line_number)), receipt_data
+
+
+def read_csv(stream: IO[str]) -> Iterator[Record]:
+    """ One item per row, with `point_of_sale`, `identity_document`, `name`, `item_name`,
+    `item_amount` and `item_price` columns. Consecutive rows sharing a `reference` are items of a
+    single receipt, rows without one are receipts on their own.
+    """
+    rows = csv.DictReader(stream)
+
+    def reference(row: dict) -> str:
+        return row.get('reference') or str(rows.line_num)
+
+    for row_reference, group in itertools.groupby(rows, key=reference):
+        group = list(group)
+
+        yield row_reference, {
+            'point_of_sale': group[0]['point_of_sale'],
+            'customer': {
+                'identity_document': group[0]['identity_document'],
+                'name': group[0]['name'],
+            },
+            'items': [
+                {'name': row['item_name'], 'amount': row['item_amount'], 'price': row['item_price']}
+                for row in group
+            ],
+        }
+
+
+READERS = {
+    JSONL_FORMAT: read_jsonl,
+    CSV_FORMAT: read_csv,
+}
+
+
+def load_manifest(path: str) -> Tuple[AbstractSet[str], Dict[str, Checkpoint]]:
+    """ References of the receipts already authorized according to the manifest at `path`, and
+    the last checkpoint of those which were requested but may not have finished.
+    """
+    completed = set()
+    numbered: Dict[str, Checkpoint] = {}
+
+    if not os.path.exists(path):
+        return completed, numbered
+
+    with open(path, 'r') as manifest_file:
+        for line in manifest_file:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # a line cut short by an interrupted run
+                continue
+
+            if 'number' in entry:
+                numbered[entry['reference']] = (
+                    entry['point_of_sale'],
+                    entry['type'],
+                    entry['number'],
+                )
+            elif entry.get('cae'):
+                completed.add(entry['reference'])
+                numbered.pop(entry['reference'], None)
+
+    return completed, numbered
+
+
+def open_manifest(path: str) -> IO[str]:
+    """ Open the manifest at `path` to append entries, after any written by a previous run. """
+    manifest = open(path, 'a+')
+    manifest.seek(0, os.SEEK_END)
+
+    if manifest.tell():
+        manifest.seek(manifest.tell() - 1)
+
+        if manifest.read(1) != '\n':
+            manifest.write('\n')
+
+    return manifest
+
+
+def run_batch(
+    backend: juryou.AFIPBackend,
+    records: Iterable[Record],
+    manifest: IO[str],
+    company: Optional[juryou.Company] = None,
+    completed: AbstractSet[str] = frozenset(),
+    output_dir: Optional[str] = None,
+    chunk_size: int = CHUNK_SIZE,
+    workers: int = COMMIT_WORKERS,
+    print_workers: Optional[int] = None,
+    printer: Optional[Printer] = None,
+    numbered: Optional[Mapping[str, Checkpoint]] = None,
+) -> int:
+    """ Commit the receipts in `records`, skipping the `completed` references, and return how
+    many of them failed.
+
+    Records are read lazily and committed in chunks of `chunk_size`, `workers` chunks at a time.
+    Before each request for a CAE, a checkpoint with the number the receipt is requested with is
+    appended to `manifest`, and an entry with the outcome once its chunk is committed. On resume,
+    the `numbered` receipts (see `load_manifest`) are looked up in AFIP with their checkpoint's
+    number, and only committed again if it wasn't authorized for them. Authorized receipts are
+    printed to `output_dir` while the next chunks are being committed.
+    """
+    failures = 0
+    lock = threading.Lock()
+    pending = (record for record in records if record[0] not in completed)
+
+    def write(entry: dict) -> None:
+        # checkpoints are written by the workers, while results are written here
+        with lock:
+            manifest.write(json.dumps(entry) + '\n')
+            manifest.flush()
+
+    results = utils.map_ordered(
+        functools.partial(_commit_chunk, backend, company, numbered or {}, write),
+        utils.batched(pending, chunk_size),
+        workers,
+    )
+
+    def authorized() -> Iterator['juryou.Receipt']:
+        nonlocal failures
+
+        for chunk in results:
+            for reference, receipt, error in chunk:
+                write(_manifest_entry(reference, receipt, error))
+
+                if error is not None:
+                    failures += 1
+                elif output_dir is not None:
+                    yield receipt
+
+    if output_dir is None:
+        collections.deque(authorized(), maxlen=0)
+    else:
+        printer = printer if printer is not None else get_printer()
+
+        for result in printer.print_many(authorized(), output_dir, workers=print_workers):
+            if not result.ok:
+                failures += 1
+                print(
+                    f'Could not print {_identifier(result.receipt)}: {result.error}',
+                    file=sys.stderr,
+                )
+
+    return failures
+
+
+def _commit_chunk(
+    backend: juryou.AFIPBackend,
+    company: Optional[juryou.Company],
+    numbered: Mapping[str, Checkpoint],
+    write: Callable[[dict], None],
+    chunk: List[Record],
+) -> List[Result]:
+    results: List[Result] = []
+    receipts = []
+
+    for reference, receipt_data in chunk:
+        try:
+            receipt = receipt_from_data(receipt_data, backend, company)
+            backend.validate_receipt(receipt)
+        except INVALID_DATA_ERRORS as error:
+            results.append((reference, None, f'Invalid receipt data: {error!r}'))
+            continue
+
+        if reference not in numbered:
+            receipts.append((reference, receipt))
+            continue
+
+        # a previous run may have had it authorized without getting to know
+        try:
+            recovered = backend.recover(receipt, numbered[reference][2])
+        except NumberTakenError:
+            recovered = False
+        except Exception as error:
+            results.append((reference, receipt, f'Recovery failed: {error!r}'))
+            continue
+
+        if recovered:
+            results.append((reference, receipt, None))
+        else:
+            receipts.append((reference, receipt))
+
+    references = {id(receipt): reference for reference, receipt in receipts}
+
+    def checkpoint(receipt: 'juryou.Receipt', number: int) -> None:
+        write({
+            'reference': references[id(receipt)],
+            'point_of_sale': receipt.point_of_sale,
+            'type': receipt.type,
+            'number': number,
+        })
+
+    commit_error = None
+
+    try:
+        backend.commit_many([receipt for _, receipt in receipts], checkpoint)
+    except Exception as error:
+        commit_error = f'Commit failed: {error!r}'
+
+    for reference, receipt in receipts:
+        error = None
+
+        if receipt.cae is None:
+            error = '; '.join(receipt.errors) or commit_error or 'Not authorized'
+
+        results.append((reference, receipt, error))
+
+    return results
+
+
+def _identifier(receipt: 'juryou.Receipt') -> str:
+    return f'{receipt.point_of_sale}:{receipt.type}:{receipt.number}'
+
+
+def _manifest_entry(
+    reference: str,
+    receipt: Optional['juryou.Receipt'],
+    error: Optional[str],
+) -> dict:
+    authorized = receipt is not None and receipt.cae is not None
+
+    return {
+        'reference': reference,
+        'identifier': _identifier(receipt) if authorized else None,
+        'cae': receipt.cae if authorized else None,
+        'cae_expiration': (
+            receipt.cae_expiration.strftime(CAE_EXPIRATION_FORMAT) if authorized else None
+        ),
+        'error': error,
+    }
@@ -1,11 +1,38 @@
 import argparse
 import os
 import json
+import sys
 import juryou
+from juryou.backend import (
+    BaseCredentialStore,
+    FileCredentialStore,
+    SQLiteCredentialStore,
+    WSDLCache,
+)
+from juryou.backend.afip import prewarm_wsdl_cache
+from . import batch
 from .generate import generate
 from .print_invoice import print_invoice
+from .serialization import company_from_data
 
-parser = argparse.ArgumentParser(description='Generate/Retrieve a receipt')
+service_parser = argparse.ArgumentParser(add_help=False)
+service_parser.add_argument('--production', action='store_true',
+                            help="indicates to use the production resource url")
+service_parser.add_argument('--wsdl-cache',
+                            help='directory where the AFIP service descriptions are cached')
+
+backend_parser = argparse.ArgumentParser(add_help=False, parents=[service_parser])
+backend_parser.add_argument('--certificate', required=True,
+                            help='AFIP certificate to use for the receipt generation')
+backend_parser.add_argument('--private-key', required=True,
+                            help='private key file path used for the recipt generation')
+backend_parser.add_argument('--cuit', required=True,
+                            help='cuit of the company used for the recipt generation')
+backend_parser.add_argument('--credentials', required=True,
+                            help='file containing the credentials/where to write the credentials')
+
+parser = argparse.ArgumentParser(description='Generate/Retrieve a receipt',
+                                 parents=[backend_parser])
 group = parser.add_mutually_exclusive_group(required=True)
 group.add_argument('--receipt-file',
                    help='path to the file containing json data to generate the receipt')
@@ -13,33 +40,78 @@ group.add_argument('--receipt-identifier',
                    help='identifier of a receipt to fetch')
 parser.add_argument('--output-file',
                     help='path for the output file (invoice pdf)')
-parser.add_argument('--certificate', required=True,
-                    help='AFIP certificate to use for the receipt generation')
-parser.add_argument('--private-key', required=True,
-                    help='private key file path used for the recipt generation')
-parser.add_argument('--cuit', required=True,
-                    help='cuit of the company used for the recipt generation')
-parser.add_argument('--credentials', required=True,
-                    help='file containing the credentials/where to write the credentials')
-parser.add_argument('--production', action='store_true',
-                    help="indicates to use the production resource url")
 
+batch_parser = argparse.ArgumentParser(prog='juryou batch',
+                                       description='Generate receipts in bulk',
+                                       parents=[backend_parser])
+batch_parser.add_argument('input', nargs='?', default='-',
+                          help='JSON Lines or CSV file with the receipts, stdin by default')
+batch_parser.add_argument('--format', choices=batch.FORMATS,
+                          help='input format, guessed from the file extension by default')
+batch_parser.add_argument('--manifest', required=True,
+                          help='file where results are written, resumed from if it exists')
+batch_parser.add_argument('--company-file',
+                          help='json file with the company for receipts not including one')
+batch_parser.add_argument('--output-dir',
+                          help='directory where the invoice pdfs are written')
+batch_parser.add_argument('--chunk-size', type=int, default=batch.CHUNK_SIZE,
+                          help='amount of receipts committed together')
+batch_parser.add_argument('--workers', type=int, default=batch.COMMIT_WORKERS,
+                          help='amount of chunks committed concurrently')
+batch_parser.add_argument('--print-workers', type=int,
+                          help='amount of processes printing invoices, one per cpu by default')
 
-def main():
-    args = parser.parse_args()
+prewarm_parser = argparse.ArgumentParser(prog='juryou prewarm',
+                                         description='Download the AFIP service descriptions',
+                                         parents=[service_parser])
+
+
+def create_credential_store(path: str) -> BaseCredentialStore:
+    try:
+        return FileCredentialStore(path)
+    except NotImplementedError:
+        # files can't be locked on Windows
+        return SQLiteCredentialStore(path + '.db')
 
+
+def create_backend(args: argparse.Namespace) -> juryou.AFIPBackend:
     with open(args.certificate, 'r') as certificate_file, \
             open(args.private_key, 'r') as private_key_file:
         certificate = certificate_file.read()
         private_key = private_key_file.read()
 
+    credentials = None
+
     if os.path.exists(args.credentials):
-        with open(args.credentials, 'r+') as credentials_file:
-            credentials = json.load(credentials_file)
-    else:
-        credentials = None
+        with open(args.credentials, 'r') as credentials_file:
+            stored_credentials = json.load(credentials_file)
+
+        # credentials files used to hold a single ticket, those are moved into the store
+        if juryou.AFIPBackend.TOKEN_CACHE_KEY in stored_credentials:
+            credentials = stored_credentials
+            os.remove(args.credentials)
+
+    return juryou.AFIPBackend(
+        certificate,
+        private_key,
+        args.cuit,
+        credentials,
+        args.production,
+        args.wsdl_cache,
+        credential_store=create_credential_store(args.credentials),
+        refresh_credentials=False,
+    )
+
 
-    backend = juryou.AFIPBackend(certificate, private_key, args.cuit, credentials, args.production)
+def main():
+    # subcommands are dispatched by hand so the original flags keep working without one
+    if sys.argv[1:2] == ['batch']:
+        return main_batch(sys.argv[2:])
+    elif sys.argv[1:2] == ['prewarm']:
+        return main_prewarm(sys.argv[2:])
+
+    args = parser.parse_args()
+    backend = create_backend(args)
 
     if args.receipt_file:
         if args.output_file is None:
@@ -51,5 +123,46 @@ def main():
     else:
         print('Provide either receipt and output file or a receipt identifier')
 
-    with open(args.credentials, '+w') as credentials_file:
-        json.dump(backend.credentials, credentials_file)
+
+def main_batch(argv):
+    args = batch_parser.parse_args(argv)
+    backend = create_backend(args)
+    company = None
+
+    if args.company_file:
+        with open(args.company_file, 'r') as company_file:
+            company = company_from_data(json.load(company_file))
+
+    input_format = args.format or (
+        batch.CSV_FORMAT if args.input.endswith('.csv') else batch.JSONL_FORMAT
+    )
+    input_file = (
+        sys.stdin if args.input == '-' else open(args.input, 'r', newline='', encoding='utf-8')
+    )
+    completed, numbered = batch.load_manifest(args.manifest)
+
+    with input_file, batch.open_manifest(args.manifest) as manifest:
+        failures = batch.run_batch(
+            backend,
+            batch.READERS[input_format](input_file),
+            manifest,
+            company,
+            completed,
+            args.output_dir,
+            args.chunk_size,
+            args.workers,
+            args.print_workers,
+            numbered=numbered,
+        )
+
+    if failures:
+        print(f'{failures} receipts failed, see {args.manifest}', file=sys.stderr)
+
+    return 1 if failures else 0
+
+
+def main_prewarm(argv):
+    args = prewarm_parser.parse_args(argv)
+    cache = prewarm_wsdl_cache(WSDLCache(args.wsdl_cache), args.production)
+
+    print('Service descriptions cached in', cache.directory)
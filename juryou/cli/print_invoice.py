@@ -4,7 +4,7 @@ import juryou
 def print_invoice(backend: juryou.AFIPBackend, identifier: str):
     if identifier.endswith('last'):
         identifier = ':'.join(identifier.split(':')[:-1])
-        receipt = backend.fetch_last(identifier)
+        receipt = backend.fetch_last(identifier)[0]
     else:
         receipt = backend.fetch(identifier)
 
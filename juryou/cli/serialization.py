@@ -0,0 +1,51 @@
+import decimal
+import juryou
+from datetime import datetime
+from typing import Optional
+
+START_OF_OPERATIONS_FORMAT = '%Y-%m-%d'
+
+
+class MissingCompanyError(Exception):
+    pass
+
+
+def company_from_data(company_data: dict) -> juryou.Company:
+    return juryou.Company(
+        company_data['name'],
+        company_data['address'],
+        company_data['cuit'],
+        company_data['brute_income'],
+        company_data['iva'],
+        datetime.strptime(company_data['start_of_operations'], START_OF_OPERATIONS_FORMAT),
+        company_data.get('short_name'),
+    )
+
+
+def receipt_from_data(
+    receipt_data: dict,
+    backend: juryou.AFIPBackend,
+    company: Optional[juryou.Company] = None,
+) -> juryou.Receipt:
+    """ Build a receipt from its json data. `company` is used when the data doesn't include one. """
+    if 'company' in receipt_data:
+        company = company_from_data(receipt_data['company'])
+
+    if company is None:
+        raise MissingCompanyError('The receipt data has no company and no default was given')
+
+    customer = juryou.Customer(
+        receipt_data['customer']['identity_document'],
+        receipt_data['customer']['name'],
+    )
+    receipt = juryou.Receipt(
+        company,
+        customer,
+        int(receipt_data['point_of_sale']),
+        backend,
+    )
+
+    for item in receipt_data['items']:
+        receipt.add_item(item['name'], int(item['amount']), decimal.Decimal(item['price']))
+
+    return receipt
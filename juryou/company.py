@@ -3,6 +3,16 @@ from typing import Optional
 
 
 class Company:
+    __slots__ = (
+        'name',
+        'short_name',
+        'address',
+        'cuit',
+        'brute_income',
+        'iva',
+        'start_of_operations',
+    )
+
     def __init__(
         self,
         name: str,
@@ -23,6 +33,8 @@ class Company:
 
 
 class DummyCompany(Company):
+    __slots__ = ()
+
     def __init__(self):
         super().__init__(
             'Dummy',
@@ -4,6 +4,8 @@ INVOICE_NATIONAL_DOCUMENT_TYPE = 96
 
 
 class Customer:
+    __slots__ = ('identity_document', 'name')
+
     def __init__(self, identity_document, name):
         self.identity_document = identity_document
         self.name = name
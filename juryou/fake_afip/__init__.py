@@ -0,0 +1,7 @@
+""" A local stand-in for the AFIP web services, to benchmark and test against.
+
+Requires the `async` extra (aiohttp).
+"""
+from .server import FakeAFIP
+
+__all__ = ['FakeAFIP']
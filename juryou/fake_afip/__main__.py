@@ -0,0 +1,28 @@
+import argparse
+
+from .server import FakeAFIP
+
+parser = argparse.ArgumentParser(description='Serve a local stand-in for WSAA and WSFEv1')
+parser.add_argument('--port', type=int, default=8080, help='HTTP port')
+parser.add_argument('--tls-port', type=int, default=8443, help='HTTPS port, used by py3afipws')
+parser.add_argument('--latency', type=float, default=0.0, help='seconds to delay every response')
+parser.add_argument('--fault-rate', type=float, default=0.0, help='fraction of requests faulted')
+parser.add_argument('--drop-rate', type=float, default=0.0, help='fraction of responses dropped')
+parser.add_argument('--seed', type=int, help='seed for the random failures')
+
+
+def main() -> None:
+    args = parser.parse_args()
+    server = FakeAFIP(args.latency, args.fault_rate, args.drop_rate, args.seed)
+    server.start(args.port, args.tls_port)
+    print(f'WSAA:   {server.wsaa_url} ({server.wsaa_wsdl_url})')
+    print(f'WSFEv1: {server.wsfev1_url} ({server.wsfev1_wsdl_url})')
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,432 @@
+import asyncio
+import collections
+import ipaddress
+import os
+import random
+import ssl
+import string
+import tempfile
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Counter, Dict, List, Optional, Tuple
+from xml.etree import ElementTree
+
+from aiohttp import web
+
+from juryou.backend import soap
+
+WSDL_DIR = os.path.join(os.path.dirname(__file__), 'wsdl')
+WSAA_PATH = '/ws/services/LoginCms'
+WSFEV1_PATH = '/wsfev1/service.asmx'
+HOST = '127.0.0.1'
+DATE_FORMAT = '%Y%m%d'
+EXPIRATION_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+TICKET_TTL = timedelta(hours=12)
+CAE_TTL = timedelta(days=10)
+ARGENTINA_TIMEZONE = timezone(timedelta(hours=-3))
+
+INVALID_TOKEN_ERROR = (600, 'ValidacionDeToken: No validaron las credenciales')
+NOT_FOUND_ERROR = (602, 'No existen datos en nuestros registros para los parametros ingresados.')
+OUT_OF_SEQUENCE_ERROR = (
+    10016,
+    'El numero o fecha del comprobante no se corresponde con el proximo a autorizar.',
+)
+
+# cuit, point of sale and receipt type
+SequenceKey = Tuple[int, int, int]
+
+
+class FakeAFIP:
+    """ Local stand-in for the WSAA and WSFEv1 testing services.
+
+    Serves the service descriptions and answers `loginCms`, `FECompUltimoAutorizado`,
+    `FECAESolicitar` and `FECompConsultar` from memory: any signed request gets a ticket, and
+    receipts are authorized as long as they're numbered in sequence. Every response is delayed by
+    `latency` seconds, and requests can randomly fail with a SOAP fault (`fault_rate`) or have
+    their connection dropped after being processed (`drop_rate`), as a timed out request would.
+
+    The server runs in a thread of its own, on an HTTP and an HTTPS port. The HTTPS URLs are meant
+    for py3afipws, which always connects through TLS, and are served with a self signed
+    certificate written to `certificate_path`.
+
+        with FakeAFIP(latency=0.05) as server:
+            backend.wsaa_url = server.wsaa_wsdl_url
+            backend.wsfev1_url = server.wsfev1_wsdl_url
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        fault_rate: float = 0.0,
+        drop_rate: float = 0.0,
+        seed: Optional[int] = None,
+    ):
+        self.latency = latency
+        self.fault_rate = fault_rate
+        self.drop_rate = drop_rate
+        self.random = random.Random(seed)
+        self.requests: Counter[str] = collections.Counter()
+        self.last_numbers: Dict[SequenceKey, int] = {}
+        self.receipts: Dict[Tuple[int, int, int, int], dict] = {}
+        self.tokens = set()
+        self.port: Optional[int] = None
+        self.tls_port: Optional[int] = None
+        self.certificate_path: Optional[str] = None
+        self._key_path: Optional[str] = None
+        self._directory: Optional[tempfile.TemporaryDirectory] = None
+        self._last_cae = 71000000000000
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._runner: Optional[web.AppRunner] = None
+        self._thread: Optional[threading.Thread] = None
+        self._templates = {
+            WSAA_PATH: _read_template('wsaa.wsdl'),
+            WSFEV1_PATH: _read_template('wsfev1.wsdl'),
+        }
+
+    def __enter__(self) -> 'FakeAFIP':
+        self.start()
+
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    @property
+    def base_url(self) -> str:
+        return f'http://{HOST}:{self.port}'
+
+    @property
+    def tls_base_url(self) -> str:
+        return f'https://{HOST}:{self.tls_port}'
+
+    @property
+    def wsaa_url(self) -> str:
+        return self.base_url + WSAA_PATH
+
+    @property
+    def wsfev1_url(self) -> str:
+        return self.base_url + WSFEV1_PATH
+
+    @property
+    def wsaa_wsdl_url(self) -> str:
+        return self.tls_base_url + WSAA_PATH + '?wsdl'
+
+    @property
+    def wsfev1_wsdl_url(self) -> str:
+        return self.tls_base_url + WSFEV1_PATH + '?WSDL'
+
+    def start(self, port: int = 0, tls_port: int = 0) -> None:
+        """ Start serving in a background thread, on random ports unless given. """
+        self._directory = tempfile.TemporaryDirectory()
+        self.certificate_path, self._key_path = _write_certificate(self._directory.name)
+        started = threading.Event()
+        errors: List[BaseException] = []
+
+        def serve() -> None:
+            self._loop = asyncio.new_event_loop()
+
+            try:
+                self._loop.run_until_complete(self._start(port, tls_port))
+            except BaseException as error:
+                errors.append(error)
+                started.set()
+                return
+
+            started.set()
+            self._loop.run_forever()
+            self._loop.run_until_complete(self._runner.cleanup())
+            self._loop.close()
+
+        self._thread = threading.Thread(target=serve, name='fake-afip', daemon=True)
+        self._thread.start()
+        started.wait()
+
+        if errors:
+            raise errors[0]
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._thread = None
+        self._directory.cleanup()
+
+    def serve_forever(self, port: int = 0, tls_port: int = 0) -> None:
+        """ Serve in the current thread until interrupted. """
+        self.start(port, tls_port)
+
+        try:
+            self._thread.join()
+        finally:
+            self.stop()
+
+    async def _start(self, port: int, tls_port: int) -> None:
+        app = web.Application()
+        app.router.add_get(WSAA_PATH, self._describe)
+        app.router.add_get(WSFEV1_PATH, self._describe)
+        app.router.add_post(WSAA_PATH, self._handle)
+        app.router.add_post(WSFEV1_PATH, self._handle)
+
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+
+        site = web.TCPSite(self._runner, HOST, port)
+        await site.start()
+        ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        ssl_context.load_cert_chain(self.certificate_path, self._key_path)
+        tls_site = web.TCPSite(self._runner, HOST, tls_port, ssl_context=ssl_context)
+        await tls_site.start()
+
+        self.port = site._server.sockets[0].getsockname()[1]
+        self.tls_port = tls_site._server.sockets[0].getsockname()[1]
+
+    async def _describe(self, request: web.Request) -> web.Response:
+        location = f'{request.scheme}://{request.host}{request.path}'
+        wsdl = self._templates[request.path].substitute(location=location)
+
+        return web.Response(body=wsdl.encode('utf-8'), content_type='text/xml')
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        body = await request.read()
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        try:
+            ((operation, arguments),) = soap.parse_envelope(body).items()
+        except (soap.SoapFault, ValueError) as error:
+            return self._fault('soap:Client', str(error))
+
+        self.requests[operation] += 1
+
+        if self.random.random() < self.fault_rate:
+            return self._fault('soap:Server', 'Servicio no disponible')
+
+        handler = getattr(self, f'_{operation}', None)
+
+        if handler is None:
+            return self._fault('soap:Client', f'Unknown operation {operation}')
+
+        namespace = soap.WSAA_NAMESPACE if request.path == WSAA_PATH else soap.WSFEV1_NAMESPACE
+        response = soap.build_envelope(namespace, f'{operation}Response', handler(arguments))
+
+        if self.random.random() < self.drop_rate:
+            # processed, but the client never gets to know
+            request.transport.close()
+
+        return web.Response(body=response, content_type='text/xml', charset='utf-8')
+
+    def _fault(self, code: str, message: str) -> web.Response:
+        return web.Response(
+            status=500,
+            body=soap.build_fault(code, message),
+            content_type='text/xml',
+            charset='utf-8',
+        )
+
+    def _loginCms(self, arguments: dict) -> dict:
+        now = datetime.now(ARGENTINA_TIMEZONE)
+        token = ''.join(self.random.choices(string.ascii_letters + string.digits, k=32))
+        self.tokens.add(token)
+
+        ticket = ElementTree.Element('loginTicketResponse', version='1.0')
+        header = ElementTree.SubElement(ticket, 'header')
+        ElementTree.SubElement(header, 'generationTime').text = _format_time(now)
+        ElementTree.SubElement(header, 'expirationTime').text = _format_time(
+            now + TICKET_TTL,
+        )
+        credentials = ElementTree.SubElement(ticket, 'credentials')
+        ElementTree.SubElement(credentials, 'token').text = token
+        ElementTree.SubElement(credentials, 'sign').text = token[::-1]
+
+        return {'loginCmsReturn': ElementTree.tostring(ticket, encoding='unicode')}
+
+    def _FECompUltimoAutorizado(self, arguments: dict) -> dict:
+        point_of_sale = int(arguments['PtoVta'])
+        receipt_type = int(arguments['CbteTipo'])
+        result = {'PtoVta': point_of_sale, 'CbteTipo': receipt_type}
+
+        if not self._is_authorized(arguments):
+            return {'FECompUltimoAutorizadoResult': {**result, 'CbteNro': 0, **_errors(
+                INVALID_TOKEN_ERROR,
+            )}}
+
+        key = (int(arguments['Auth']['Cuit']), point_of_sale, receipt_type)
+        result['CbteNro'] = self.last_numbers.get(key, 0)
+
+        return {'FECompUltimoAutorizadoResult': result}
+
+    def _FECAESolicitar(self, arguments: dict) -> dict:
+        header = arguments['FeCAEReq']['FeCabReq']
+        cuit = int(arguments['Auth']['Cuit'])
+        point_of_sale = int(header['PtoVta'])
+        receipt_type = int(header['CbteTipo'])
+        details = soap.as_list(arguments['FeCAEReq']['FeDetReq']['FECAEDetRequest'])
+
+        if not self._is_authorized(arguments):
+            return {'FECAESolicitarResult': _errors(INVALID_TOKEN_ERROR)}
+
+        key = (cuit, point_of_sale, receipt_type)
+        responses = []
+
+        for detail in details:
+            response = {
+                field: detail[field]
+                for field in ('Concepto', 'DocTipo', 'DocNro', 'CbteDesde', 'CbteHasta', 'CbteFch')
+            }
+
+            if int(detail['CbteDesde']) != self.last_numbers.get(key, 0) + 1:
+                response.update({
+                    'Resultado': 'R',
+                    'Observaciones': {'Obs': _error(OUT_OF_SEQUENCE_ERROR)},
+                    'CAE': '',
+                    'CAEFchVto': '',
+                })
+            else:
+                response.update(self._authorize(key, detail))
+
+            responses.append(response)
+
+        results = {response['Resultado'] for response in responses}
+
+        return {'FECAESolicitarResult': {
+            'FeCabResp': {
+                'Cuit': cuit,
+                'PtoVta': point_of_sale,
+                'CbteTipo': receipt_type,
+                'FchProceso': datetime.now(ARGENTINA_TIMEZONE).strftime('%Y%m%d%H%M%S'),
+                'CantReg': len(details),
+                'Resultado': results.pop() if len(results) == 1 else 'P',
+                'Reproceso': 'N',
+            },
+            'FeDetResp': {'FECAEDetResponse': responses},
+        }}
+
+    def _FECompConsultar(self, arguments: dict) -> dict:
+        query = arguments['FeCompConsReq']
+
+        if not self._is_authorized(arguments):
+            return {'FECompConsultarResult': _errors(INVALID_TOKEN_ERROR)}
+
+        key = (
+            int(arguments['Auth']['Cuit']),
+            int(query['PtoVta']),
+            int(query['CbteTipo']),
+            int(query['CbteNro']),
+        )
+        receipt = self.receipts.get(key)
+
+        if receipt is None:
+            return {'FECompConsultarResult': _errors(NOT_FOUND_ERROR)}
+
+        return {'FECompConsultarResult': {'ResultGet': receipt}}
+
+    def _authorize(self, key: SequenceKey, detail: dict) -> dict:
+        cuit, point_of_sale, receipt_type = key
+        number = int(detail['CbteDesde'])
+        self._last_cae += 1
+        self.last_numbers[key] = number
+        authorization = {
+            'Resultado': 'A',
+            'CAE': str(self._last_cae),
+            'CAEFchVto': (datetime.now(ARGENTINA_TIMEZONE) + CAE_TTL).strftime(DATE_FORMAT),
+        }
+        self.receipts[(cuit, point_of_sale, receipt_type, number)] = {
+            **{
+                field: detail.get(field)
+                for field in (
+                    'Concepto',
+                    'DocTipo',
+                    'DocNro',
+                    'CbteDesde',
+                    'CbteHasta',
+                    'CbteFch',
+                    'ImpTotal',
+                    'ImpTotConc',
+                    'ImpNeto',
+                    'ImpOpEx',
+                    'ImpTrib',
+                    'ImpIVA',
+                    'MonId',
+                    'MonCotiz',
+                )
+            },
+            'Resultado': 'A',
+            'CodAutorizacion': authorization['CAE'],
+            'EmisionTipo': 'CAE',
+            'FchVto': authorization['CAEFchVto'],
+            'FchProceso': datetime.now(ARGENTINA_TIMEZONE).strftime(DATE_FORMAT),
+            'PtoVta': point_of_sale,
+            'CbteTipo': receipt_type,
+        }
+
+        return authorization
+
+    def _is_authorized(self, arguments: dict) -> bool:
+        return (arguments.get('Auth') or {}).get('Token') in self.tokens
+
+
+def _read_template(filename: str) -> string.Template:
+    with open(os.path.join(WSDL_DIR, filename), 'r', encoding='utf-8') as wsdl_file:
+        return string.Template(wsdl_file.read())
+
+
+def _format_time(value: datetime) -> str:
+    offset = value.strftime('%z')
+
+    return f'{value.strftime(EXPIRATION_FORMAT)[:-3]}{offset[:3]}:{offset[3:]}'
+
+
+def _error(error: Tuple[int, str]) -> dict:
+    code, message = error
+
+    return {'Code': code, 'Msg': message}
+
+
+def _errors(*errors: Tuple[int, str]) -> dict:
+    return {'Errors': {'Err': [_error(error) for error in errors]}}
+
+
+def _write_certificate(directory: str) -> Tuple[str, str]:
+    """ Write a self signed certificate for the local host and its key to `directory`. """
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    from cryptography.x509.oid import NameOID
+
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, HOST)])
+    now = datetime.utcnow()
+    certificate = x509.CertificateBuilder().subject_name(
+        name,
+    ).issuer_name(
+        name,
+    ).public_key(
+        private_key.public_key(),
+    ).serial_number(
+        x509.random_serial_number(),
+    ).not_valid_before(
+        now - timedelta(minutes=1),
+    ).not_valid_after(
+        now + timedelta(days=1),
+    ).add_extension(
+        x509.SubjectAlternativeName([x509.IPAddress(ipaddress.ip_address(HOST))]),
+        critical=False,
+    ).sign(private_key, hashes.SHA256())
+
+    certificate_path = os.path.join(directory, 'certificate.pem')
+    key_path = os.path.join(directory, 'key.pem')
+
+    with open(certificate_path, 'wb') as certificate_file:
+        certificate_file.write(certificate.public_bytes(serialization.Encoding.PEM))
+
+    with open(key_path, 'wb') as key_file:
+        key_file.write(private_key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.TraditionalOpenSSL,
+            serialization.NoEncryption(),
+        ))
+
+    return certificate_path, key_path
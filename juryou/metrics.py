@@ -0,0 +1,306 @@
+""" Measurements of the phases of committing and printing receipts.
+
+Backends, printers and receipts report how long each phase took (WSAA login, WSDL connect, every
+AFIP request, template render, PDF layout...), how many receipts were authorized or rejected,
+the codes receipts were rejected with and the size of the exchanged payloads, to the collector set
+with `set_collector`:
+
+    collector = PrometheusCollector()
+    set_collector(collector)
+    collector.serve(9100)
+
+No collector is set by default, and then every measurement is skipped after a single check. Each
+process reports to its own collector, so the PDFs laid out by `Printer.print_many` workers
+aren't measured.
+"""
+import abc
+import bisect
+import contextlib
+import json
+import logging
+import re
+import threading
+import time
+from typing import Any, ContextManager, Dict, List, Optional, Sequence, Tuple
+
+from juryou import utils
+
+# only needed to serve the metrics
+http_server = utils.lazy_import('http.server')
+
+Tags = Dict[str, Any]
+MetricKey = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+OK_STATUS = 'ok'
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+logger = logging.getLogger(__name__)
+
+
+class BaseMetricsCollector(abc.ABC):
+    """ Receives the measurements, named after the phase they were taken from (`afip.request`,
+    `printer.layout`...) and tagged with their details (`operation`, `status`, `code`...).
+    """
+
+    @abc.abstractmethod
+    def timing(self, name: str, seconds: float, tags: Tags) -> None:
+        pass
+
+    @abc.abstractmethod
+    def count(self, name: str, value: int, tags: Tags) -> None:
+        pass
+
+    @abc.abstractmethod
+    def size(self, name: str, size: int, tags: Tags) -> None:
+        pass
+
+
+_collector: Optional[BaseMetricsCollector] = None
+_disabled_timer = contextlib.nullcontext()
+
+
+def set_collector(collector: Optional[BaseMetricsCollector]) -> None:
+    """ Report every measurement of this process to `collector`, or stop measuring with `None`. """
+    global _collector
+
+    _collector = collector
+
+
+def get_collector() -> Optional[BaseMetricsCollector]:
+    return _collector
+
+
+def enabled() -> bool:
+    return _collector is not None
+
+
+class Timer:
+    """ Times the block it wraps, tagging it with the name of the exception it raised, if any, as
+    `status`.
+    """
+
+    __slots__ = ('collector', 'name', 'tags', 'start')
+
+    def __init__(self, collector: BaseMetricsCollector, name: str, tags: Tags):
+        self.collector = collector
+        self.name = name
+        self.tags = tags
+        self.start = 0.0
+
+    def __enter__(self) -> 'Timer':
+        self.start = time.perf_counter()
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        elapsed = time.perf_counter() - self.start
+        status = OK_STATUS if exc_type is None else exc_type.__name__
+        self.collector.timing(self.name, elapsed, {**self.tags, 'status': status})
+
+
+def timer(name: str, **tags: Any) -> ContextManager:
+    collector = _collector
+
+    if collector is None:
+        return _disabled_timer
+
+    return Timer(collector, name, tags)
+
+
+def count(name: str, value: int = 1, **tags: Any) -> None:
+    collector = _collector
+
+    if collector is not None:
+        collector.count(name, value, tags)
+
+
+def size(name: str, size: int, **tags: Any) -> None:
+    collector = _collector
+
+    if collector is not None:
+        collector.size(name, size, tags)
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative_counts(self) -> List[int]:
+        counts = []
+        total = 0
+
+        for bucket_count in self.counts:
+            total += bucket_count
+            counts.append(total)
+
+        return counts
+
+
+class PrometheusCollector(BaseMetricsCollector):
+    """ Keeps the measurements in memory, exposed in the Prometheus text format by `expose`.
+
+    Timings and sizes are kept as histograms (`<prefix>_<name>_seconds`, `<prefix>_<name>_bytes`)
+    and counts as counters (`<prefix>_<name>_total`), with the tags as labels.
+    """
+
+    TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+    SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+    def __init__(
+        self,
+        prefix: str = 'juryou',
+        time_buckets: Sequence[float] = TIME_BUCKETS,
+        size_buckets: Sequence[float] = SIZE_BUCKETS,
+    ):
+        self.prefix = prefix
+        self.time_buckets = tuple(sorted(time_buckets))
+        self.size_buckets = tuple(sorted(size_buckets))
+        self._counters: Dict[MetricKey, float] = {}
+        self._histograms: Dict[MetricKey, Histogram] = {}
+        self._lock = threading.Lock()
+
+    def timing(self, name: str, seconds: float, tags: Tags) -> None:
+        self._observe(self._metric_name(name, 'seconds'), self.time_buckets, seconds, tags)
+
+    def count(self, name: str, value: int, tags: Tags) -> None:
+        key = (self._metric_name(name, 'total'), self._labels(tags))
+
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def size(self, name: str, size: int, tags: Tags) -> None:
+        self._observe(self._metric_name(name, 'bytes'), self.size_buckets, size, tags)
+
+    def expose(self) -> str:
+        lines = []
+
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(
+                (key, histogram.buckets, histogram.cumulative_counts(), histogram.sum)
+                for key, histogram in self._histograms.items()
+            )
+
+        declared = None
+
+        for (name, labels), value in counters:
+            if name != declared:
+                lines.append(f'# TYPE {name} counter')
+                declared = name
+
+            lines.append(f'{name}{self._format_labels(labels)} {self._format_value(value)}')
+
+        for (name, labels), buckets, counts, total in histograms:
+            if name != declared:
+                lines.append(f'# TYPE {name} histogram')
+                declared = name
+
+            for bound, bucket_count in zip(buckets + ('+Inf',), counts):
+                bucket_labels = labels + (('le', self._format_value(bound)),)
+                lines.append(f'{name}_bucket{self._format_labels(bucket_labels)} {bucket_count}')
+
+            lines.append(f'{name}_sum{self._format_labels(labels)} {self._format_value(total)}')
+            lines.append(f'{name}_count{self._format_labels(labels)} {counts[-1]}')
+
+        return ''.join(line + '\n' for line in lines)
+
+    def serve(self, port: int, host: str = '') -> 'http_server.ThreadingHTTPServer':
+        """ Answer every GET with `expose` from a background thread, for Prometheus to scrape.
+        `shutdown` the returned server to stop it.
+        """
+        collector = self
+
+        class MetricsHandler(http_server.BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                body = collector.expose().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', PROMETHEUS_CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+        server = http_server.ThreadingHTTPServer((host, port), MetricsHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        return server
+
+    def _observe(self, name: str, buckets: Sequence[float], value: float, tags: Tags) -> None:
+        key = (name, self._labels(tags))
+
+        with self._lock:
+            histogram = self._histograms.get(key)
+
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+
+            histogram.observe(value)
+
+    def _metric_name(self, name: str, unit: str) -> str:
+        return f'{self.prefix}_{self._sanitize(name)}_{unit}'
+
+    def _labels(self, tags: Tags) -> Tuple[Tuple[str, str], ...]:
+        return tuple(sorted((self._sanitize(tag), str(value)) for tag, value in tags.items()))
+
+    def _sanitize(self, name: str) -> str:
+        return re.sub(r'[^a-zA-Z0-9_]', '_', name)
+
+    def _format_labels(self, labels: Tuple[Tuple[str, str], ...]) -> str:
+        if not labels:
+            return ''
+
+        formatted = ','.join(
+            '{}="{}"'.format(
+                label,
+                value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'),
+            )
+            for label, value in labels
+        )
+
+        return '{' + formatted + '}'
+
+    def _format_value(self, value: Any) -> str:
+        if isinstance(value, str):
+            return value
+
+        return repr(float(value))
+
+
+class LogCollector(BaseMetricsCollector):
+    """ Logs every measurement as a JSON object, along with its tags:
+
+        {"metric": "afip.request", "seconds": 0.153, "operation": "FECAESolicitar", "status": "ok"}
+
+    The object is also set as the `metric` attribute of the log record, for handlers formatting
+    records themselves.
+    """
+
+    def __init__(self, log: Optional[logging.Logger] = None, level: int = logging.INFO):
+        self.logger = log if log is not None else logger
+        self.level = level
+
+    def timing(self, name: str, seconds: float, tags: Tags) -> None:
+        self._log({'metric': name, 'seconds': round(seconds, 6), **tags})
+
+    def count(self, name: str, value: int, tags: Tags) -> None:
+        self._log({'metric': name, 'count': value, **tags})
+
+    def size(self, name: str, size: int, tags: Tags) -> None:
+        self._log({'metric': name, 'bytes': size, **tags})
+
+    def _log(self, event: dict) -> None:
+        if self.logger.isEnabledFor(self.level):
+            self.logger.log(self.level, json.dumps(event, default=str), extra={'metric': event})
@@ -1,3 +1,3 @@
-from .printer import Printer
+from .printer import NothingToPrintError, Printer, PrintResult, get_printer
 
-__all__ = ['Printer']
+__all__ = ['NothingToPrintError', 'Printer', 'PrintResult', 'get_printer']
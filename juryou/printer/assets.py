@@ -0,0 +1,96 @@
+import hashlib
+import mimetypes
+import os
+from typing import Dict, Optional
+from urllib.parse import unquote, urlparse
+
+from juryou import utils
+
+weasyprint = utils.lazy_import('weasyprint')
+request = utils.lazy_import('urllib.request')
+
+REMOTE_SCHEMES = ('http', 'https')
+
+
+class RemoteAssetError(Exception):
+    pass
+
+
+class AssetFetcher:
+    """ WeasyPrint `url_fetcher` keeping the assets used by invoices (fonts, images) in memory.
+
+    Local files are read once per process. Remote assets are refused unless `allow_remote` is
+    set, and are then also kept in `cache_dir` so other processes and later runs don't download
+    them again. `data:` URLs are unique to each document, so they are never cached.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None, allow_remote: bool = False):
+        self.cache_dir = cache_dir
+        self.allow_remote = allow_remote
+        self._assets: Dict[str, dict] = {}
+
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def __call__(self, url: str, timeout: int = 10, ssl_context=None) -> dict:
+        if url.startswith('data:'):
+            return weasyprint.default_url_fetcher(url, timeout, ssl_context)
+
+        asset = self._assets.get(url)
+
+        if asset is None:
+            scheme = urlparse(url).scheme
+
+            if scheme == 'file':
+                asset = self._read_file(url)
+            elif scheme in REMOTE_SCHEMES:
+                asset = self._fetch_remote(url, timeout, ssl_context)
+            else:
+                return weasyprint.default_url_fetcher(url, timeout, ssl_context)
+
+            self._assets[url] = asset
+
+        return {**asset}
+
+    def _read_file(self, url: str) -> dict:
+        with open(request.url2pathname(unquote(urlparse(url).path)), 'rb') as asset_file:
+            return self._asset(url, asset_file.read())
+
+    def _fetch_remote(self, url: str, timeout: int, ssl_context) -> dict:
+        path = None
+
+        if self.cache_dir is not None:
+            path = os.path.join(self.cache_dir, hashlib.sha256(url.encode('utf-8')).hexdigest())
+
+            if os.path.exists(path):
+                with open(path, 'rb') as asset_file:
+                    return self._asset(url, asset_file.read())
+
+        if not self.allow_remote:
+            raise RemoteAssetError(f'Remote assets are disabled, can\'t fetch {url}')
+
+        fetched = weasyprint.default_url_fetcher(url, timeout, ssl_context)
+
+        if 'file_obj' in fetched:
+            with fetched['file_obj'] as asset_file:
+                content = asset_file.read()
+        else:
+            content = fetched['string']
+
+        if isinstance(content, str):
+            content = content.encode(fetched.get('encoding') or 'utf-8')
+
+        if path is not None:
+            with open(path + '.tmp', 'wb') as asset_file:
+                asset_file.write(content)
+
+            os.replace(path + '.tmp', path)
+
+        return self._asset(url, content, fetched.get('mime_type'))
+
+    def _asset(self, url: str, content: bytes, mime_type: Optional[str] = None) -> dict:
+        return {
+            'string': content,
+            'mime_type': mime_type or mimetypes.guess_type(url)[0] or 'application/octet-stream',
+            'redirected_url': url,
+        }
@@ -1,26 +1,304 @@
+import functools
 import io
-import weasyprint
-from typing import IO
-from jinja2 import Environment, PackageLoader, select_autoescape
+import os
+import pathlib
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from typing import Any, Callable, Dict, IO, Iterable, Iterator, Optional, Tuple
 
-from juryou import receipt
+from juryou import company, metrics, receipt, utils
+from .assets import AssetFetcher
+
+# imported when the first printer is created, importing juryou shouldn't load them
+jinja2 = utils.lazy_import('jinja2')
+weasyprint = utils.lazy_import('weasyprint')
+process = utils.lazy_import('concurrent.futures.process')
+
+Sink = Callable[['receipt.Receipt', bytes], None]
+
+
+class NothingToPrintError(Exception):
+    pass
+
+
+class PrintResult:
+    """ Outcome of printing a receipt with `Printer.print_many`.
+
+    `pdf` is only kept when the PDF wasn't written to a file or passed to a sink.
+    """
+
+    def __init__(
+        self,
+        receipt: 'receipt.Receipt',
+        path: Optional[str] = None,
+        pdf: Optional[bytes] = None,
+        error: Optional[BaseException] = None,
+    ):
+        self.receipt = receipt
+        self.path = path
+        self.pdf = pdf
+        self.error = error
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
 
 
 class Printer:
-    def __init__(self):
-        self.env = Environment(
-            loader=PackageLoader('juryou.printer', 'templates'),
-            autoescape=select_autoescape(['html']),
+    """ Renders receipts as PDF.
+
+    The template environment, the compiled template and the font configuration are created once
+    and reused for every receipt, so a single printer should be shared (see `get_printer`).
+    Compiled templates can also be cached on disk across processes with `bytecode_cache_dir`.
+
+    Fonts are shipped with the package and every asset is resolved through an `AssetFetcher`,
+    so rendering never goes to the network unless `allow_remote_assets` is set.
+
+    The stylesheet is parsed once and the header fragments depending only on the company are
+    kept for the last `company_cache_size` companies, so only the receipt specific parts of
+    each invoice are rendered.
+    """
+
+    TEMPLATE_NAME = 'invoice.html'
+    COMPANY_TEMPLATE_NAME = 'company.html'
+    STYLESHEET_NAME = 'invoice.css'
+    COMPANY_CACHE_SIZE = 128
+    COMPANY_FIELDS = (
+        'short_name',
+        'name',
+        'address',
+        'iva',
+        'cuit',
+        'brute_income',
+        'start_of_operations',
+    )
+    BASE_URL = pathlib.Path(__file__).parent.as_uri() + '/'
+    FILENAME_FORMAT = '{point_of_sale:05d}-{type:03d}-{number:08d}.pdf'
+
+    def __init__(
+        self,
+        bytecode_cache_dir: Optional[str] = None,
+        asset_cache_dir: Optional[str] = None,
+        allow_remote_assets: bool = False,
+        company_cache_size: int = COMPANY_CACHE_SIZE,
+    ):
+        # print_many builds an equal printer in each worker process
+        self._settings = {
+            'bytecode_cache_dir': bytecode_cache_dir,
+            'asset_cache_dir': asset_cache_dir,
+            'allow_remote_assets': allow_remote_assets,
+            'company_cache_size': company_cache_size,
+        }
+        self.env = jinja2.Environment(
+            loader=jinja2.PackageLoader('juryou.printer', 'templates'),
+            autoescape=jinja2.select_autoescape(['html']),
+            bytecode_cache=(
+                jinja2.FileSystemBytecodeCache(bytecode_cache_dir) if bytecode_cache_dir else None
+            ),
+        )
+        self.template = self.env.get_template(self.TEMPLATE_NAME)
+        self.company_template = self.env.get_template(self.COMPANY_TEMPLATE_NAME)
+        self.font_config = weasyprint.fonts.FontConfiguration()
+        self.url_fetcher = AssetFetcher(asset_cache_dir, allow_remote_assets)
+        # the @font-face rules are loaded into the font configuration along with the stylesheet
+        self.stylesheet = weasyprint.CSS(
+            string=self.env.loader.get_source(self.env, self.STYLESHEET_NAME)[0],
+            base_url=self.BASE_URL,
+            url_fetcher=self.url_fetcher,
+            font_config=self.font_config,
+        )
+        self._company_fragments = functools.lru_cache(company_cache_size)(
+            self._render_company_fragments,
         )
 
     def print(self, receipt: 'receipt.Receipt', buffer: IO = None) -> IO:
+        return self.write(self.render(receipt), buffer)
+
+    def render(self, receipt: 'receipt.Receipt') -> str:
+        with metrics.timer('printer.render'):
+            invoice_html = self.template.render(
+                receipt=receipt,
+                company=self.company_fragments(receipt.company),
+            )
+
+        metrics.size('printer.html', len(invoice_html))
+
+        return invoice_html
+
+    def company_fragments(self, company: 'company.Company') -> Any:
+        """ Rendered header fragments for the company, shared by every receipt it issues. """
+        return self._company_fragments(
+            tuple(getattr(company, field) for field in self.COMPANY_FIELDS),
+        )
+
+    def _render_company_fragments(self, values: tuple) -> Any:
+        return self.company_template.make_module({
+            'company': dict(zip(self.COMPANY_FIELDS, values)),
+        })
+
+    def write(self, invoice_html: str, buffer: IO = None) -> IO:
         if buffer is None:
             buffer = io.BytesIO()
 
-        invoice_template = self.env.get_template('invoice.html')
-        invoice_html = invoice_template.render(receipt=receipt)
-        invoice_pdf_font_config = weasyprint.fonts.FontConfiguration()
-        invoice_pdf_writer = weasyprint.HTML(string=invoice_html)
-        invoice_pdf_writer.write_pdf(buffer, font_config=invoice_pdf_font_config)
+        document = self.layout(invoice_html)
+
+        with metrics.timer('printer.write'):
+            document.write_pdf(buffer)
 
         return buffer
+
+    def layout(self, invoice_html: str) -> 'weasyprint.Document':
+        invoice_pdf_writer = weasyprint.HTML(
+            string=invoice_html,
+            base_url=self.BASE_URL,
+            url_fetcher=self.url_fetcher,
+        )
+
+        with metrics.timer('printer.layout'):
+            return invoice_pdf_writer.render(
+                stylesheets=[self.stylesheet],
+                font_config=self.font_config,
+            )
+
+    def print_combined(self, receipts: Iterable['receipt.Receipt'], buffer: IO = None) -> IO:
+        """ Print the given receipts as the pages of a single PDF, embedding the fonts once.
+
+        Receipts are consumed one at a time and only the laid out pages are kept until the PDF
+        is written.
+        """
+        if buffer is None:
+            buffer = io.BytesIO()
+
+        first_document = None
+        pages = []
+
+        for pending_receipt in receipts:
+            document = self.layout(self.render(pending_receipt))
+            pages.extend(document.pages)
+
+            if first_document is None:
+                first_document = document
+
+        if first_document is None:
+            raise NothingToPrintError()
+
+        first_document.copy(pages).write_pdf(buffer)
+
+        return buffer
+
+    def filename(self, receipt: 'receipt.Receipt') -> str:
+        return self.FILENAME_FORMAT.format(
+            point_of_sale=receipt.point_of_sale,
+            type=receipt.type,
+            number=receipt.number,
+        )
+
+    def print_many(
+        self,
+        receipts: Iterable['receipt.Receipt'],
+        output_dir: Optional[str] = None,
+        sink: Optional[Sink] = None,
+        workers: Optional[int] = None,
+    ) -> Iterator[PrintResult]:
+        """ Print the given receipts in a pool of processes, yielding results as they finish.
+
+        Receipts are rendered to HTML here and laid out as PDF by the workers, each keeping its
+        own printer configured as this one. PDFs are written to `output_dir` (named by
+        `filename`) or passed to `sink`. A failing receipt is reported in its result, the rest of
+        the batch goes on.
+        """
+        if output_dir is not None:
+            os.makedirs(output_dir, exist_ok=True)
+
+        workers = workers or os.cpu_count() or 1
+
+        with process.ProcessPoolExecutor(
+            workers,
+            initializer=_start_worker,
+            initargs=(type(self), self._settings),
+        ) as executor:
+            pending: Dict[Future, Tuple['receipt.Receipt', Optional[str]]] = {}
+
+            for pending_receipt in receipts:
+                try:
+                    invoice_html = self.render(pending_receipt)
+                    path = None
+
+                    if output_dir is not None:
+                        path = os.path.join(output_dir, self.filename(pending_receipt))
+                except Exception as error:
+                    yield PrintResult(pending_receipt, error=error)
+                    continue
+
+                pending[executor.submit(_write_pdf, invoice_html, path)] = (pending_receipt, path)
+
+                # only a few documents are kept in flight so memory doesn't grow with the batch
+                if len(pending) >= workers * 2:
+                    yield from self._collect(pending, sink)
+
+            while pending:
+                yield from self._collect(pending, sink)
+
+    def _collect(
+        self,
+        pending: Dict[Future, Tuple['receipt.Receipt', Optional[str]]],
+        sink: Optional[Sink],
+    ) -> Iterator[PrintResult]:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+
+        for future in done:
+            printed_receipt, path = pending.pop(future)
+            error = future.exception()
+
+            if error is not None:
+                yield PrintResult(printed_receipt, path, error=error)
+                continue
+
+            pdf = future.result()
+
+            if sink is not None and pdf is not None:
+                try:
+                    sink(printed_receipt, pdf)
+                except Exception as sink_error:
+                    yield PrintResult(printed_receipt, error=sink_error)
+                    continue
+
+                pdf = None
+
+            yield PrintResult(printed_receipt, path, pdf)
+
+
+_printer: Optional[Printer] = None
+_printer_lock = threading.Lock()
+
+
+def get_printer() -> Printer:
+    """ Return the printer shared by every receipt, creating it on first use. """
+    global _printer
+
+    if _printer is None:
+        with _printer_lock:
+            if _printer is None:
+                _printer = Printer()
+
+    return _printer
+
+
+_worker_printer: Optional[Printer] = None
+
+
+def _start_worker(printer_class: type, settings: Dict[str, Any]) -> None:
+    global _worker_printer
+
+    _worker_printer = printer_class(**settings)
+
+
+def _write_pdf(invoice_html: str, path: Optional[str]) -> Optional[bytes]:
+    """ Worker side of `Printer.print_many`. """
+    if path is not None:
+        with open(path, 'wb') as pdf_file:
+            _worker_printer.write(invoice_html, pdf_file)
+
+        return None
+
+    return _worker_printer.write(invoice_html).getvalue()
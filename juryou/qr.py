@@ -0,0 +1,449 @@
+""" QR code encoder for the AFIP receipt QR.
+
+Only byte mode is supported, which is all an URL needs. Everything that doesn't depend on the
+encoded data is computed once and reused: the Galois field tables, the Reed-Solomon divisors for
+each block size and the function patterns (finders, timing, alignment and version information)
+for each version.
+"""
+import functools
+import re
+from typing import List, Optional, Sequence, Tuple
+
+ERROR_CORRECTION_LEVELS = ('L', 'M', 'Q', 'H')
+FORMAT_BITS = {'L': 1, 'M': 0, 'Q': 3, 'H': 2}
+MIN_VERSION = 1
+MAX_VERSION = 40
+QUIET_ZONE = 4
+MODULE_SIZE = 0.4
+
+# indexed by error correction level and version, index 0 is unused
+ECC_CODEWORDS_PER_BLOCK = {
+    'L': (-1, 7, 10, 15, 20, 26, 18, 20, 24, 30, 18, 20, 24, 26, 30, 22, 24, 28, 30, 28, 28, 28,
+          28, 30, 30, 26, 28, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30),
+    'M': (-1, 10, 16, 26, 18, 24, 16, 18, 22, 22, 26, 30, 22, 22, 24, 24, 28, 28, 26, 26, 26, 26,
+          28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28),
+    'Q': (-1, 13, 22, 18, 26, 18, 24, 18, 22, 20, 24, 28, 26, 24, 20, 30, 24, 28, 28, 26, 30, 28,
+          30, 30, 30, 30, 28, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30),
+    'H': (-1, 17, 28, 22, 16, 22, 28, 26, 26, 24, 28, 24, 28, 22, 24, 24, 30, 28, 28, 26, 28, 30,
+          24, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30),
+}
+ERROR_CORRECTION_BLOCKS = {
+    'L': (-1, 1, 1, 1, 1, 1, 2, 2, 2, 2, 4, 4, 4, 4, 4, 6, 6, 6, 6, 7, 8, 8, 9, 9, 10, 12, 12,
+          12, 13, 14, 15, 16, 17, 18, 19, 19, 20, 21, 22, 24, 25),
+    'M': (-1, 1, 1, 1, 2, 2, 4, 4, 4, 5, 5, 5, 8, 9, 9, 10, 10, 11, 13, 14, 16, 17, 17, 18, 20,
+          21, 23, 25, 26, 28, 29, 31, 33, 35, 37, 38, 40, 43, 45, 47, 49),
+    'Q': (-1, 1, 1, 2, 2, 4, 4, 6, 6, 8, 8, 8, 10, 12, 16, 12, 17, 16, 18, 21, 20, 23, 23, 25,
+          27, 29, 34, 34, 35, 38, 40, 43, 45, 48, 51, 53, 56, 59, 62, 65, 68),
+    'H': (-1, 1, 1, 2, 4, 4, 4, 5, 6, 8, 8, 11, 11, 16, 16, 18, 16, 19, 21, 25, 25, 25, 34, 30,
+          32, 35, 37, 40, 42, 45, 48, 51, 54, 57, 60, 63, 66, 70, 74, 77, 81),
+}
+
+MASKS = (
+    lambda x, y: (x + y) % 2 == 0,
+    lambda x, y: y % 2 == 0,
+    lambda x, y: x % 3 == 0,
+    lambda x, y: (x + y) % 3 == 0,
+    lambda x, y: (x // 3 + y // 2) % 2 == 0,
+    lambda x, y: x * y % 2 + x * y % 3 == 0,
+    lambda x, y: (x * y % 2 + x * y % 3) % 2 == 0,
+    lambda x, y: ((x + y) % 2 + x * y % 3) % 2 == 0,
+)
+
+# GF(256) exponentials and logarithms for the 0x11D polynomial, the exponentials are repeated so
+# the sum of two logarithms can be looked up without a modulo
+EXP = [0] * 512
+LOG = [0] * 256
+_value = 1
+
+for _exponent in range(255):
+    EXP[_exponent] = EXP[_exponent + 255] = _value
+    LOG[_value] = _exponent
+    _value <<= 1
+
+    if _value & 0x100:
+        _value ^= 0x11D
+
+RUNS = re.compile(b'\x00+|\x01+')
+
+Matrix = List[bytearray]
+
+
+class DataTooLongError(Exception):
+    pass
+
+
+def _multiply(x: int, y: int) -> int:
+    if x == 0 or y == 0:
+        return 0
+
+    return EXP[LOG[x] + LOG[y]]
+
+
+@functools.lru_cache(maxsize=None)
+def _divisor(degree: int) -> Tuple[int, ...]:
+    """ Coefficients of the Reed-Solomon generator polynomial, highest degree first and without
+    the leading 1.
+    """
+    divisor = [0] * (degree - 1) + [1]
+    root = 1
+
+    for _ in range(degree):
+        for index in range(degree):
+            divisor[index] = _multiply(divisor[index], root)
+
+            if index + 1 < degree:
+                divisor[index] ^= divisor[index + 1]
+
+        root = _multiply(root, 2)
+
+    return tuple(divisor)
+
+
+@functools.lru_cache(maxsize=None)
+def _divisor_logs(degree: int) -> Tuple[int, ...]:
+    # generator polynomials have no zero coefficients, so every one of them has a logarithm
+    return tuple(LOG[coefficient] for coefficient in _divisor(degree))
+
+
+def _remainder(data: Sequence[int], degree: int) -> List[int]:
+    divisor_logs = _divisor_logs(degree)
+    remainder = [0] * degree
+
+    for value in data:
+        factor = value ^ remainder.pop(0)
+        remainder.append(0)
+
+        if factor:
+            factor_log = LOG[factor]
+
+            for index, coefficient_log in enumerate(divisor_logs):
+                remainder[index] ^= EXP[coefficient_log + factor_log]
+
+    return remainder
+
+
+def _raw_data_modules(version: int) -> int:
+    modules = (16 * version + 128) * version + 64
+
+    if version >= 2:
+        alignments = version // 7 + 2
+        modules -= (25 * alignments - 10) * alignments - 55
+
+        if version >= 7:
+            modules -= 36
+
+    return modules
+
+
+def _data_codewords(version: int, level: str) -> int:
+    return (
+        _raw_data_modules(version) // 8
+        - ECC_CODEWORDS_PER_BLOCK[level][version] * ERROR_CORRECTION_BLOCKS[level][version]
+    )
+
+
+def _alignment_positions(version: int) -> List[int]:
+    if version == 1:
+        return []
+
+    alignments = version // 7 + 2
+    size = version * 4 + 17
+    step = (version * 8 + alignments * 3 + 5) // (alignments * 4 - 4) * 2
+
+    return [6] + sorted(size - 7 - index * step for index in range(alignments - 1))
+
+
+@functools.lru_cache(maxsize=None)
+def _function_patterns(version: int) -> Tuple[Tuple[bytes, ...], Tuple[bytes, ...]]:
+    """ Modules and function module flags for everything but the data and format bits. """
+    size = version * 4 + 17
+    modules = [bytearray(size) for _ in range(size)]
+    functions = [bytearray(size) for _ in range(size)]
+
+    def set_module(x: int, y: int, dark: bool) -> None:
+        modules[y][x] = dark
+        functions[y][x] = 1
+
+    for index in range(size):
+        set_module(6, index, index % 2 == 0)
+        set_module(index, 6, index % 2 == 0)
+
+    for center_x, center_y in ((3, 3), (size - 4, 3), (3, size - 4)):
+        for dy in range(-4, 5):
+            for dx in range(-4, 5):
+                x, y = center_x + dx, center_y + dy
+
+                if 0 <= x < size and 0 <= y < size:
+                    set_module(x, y, max(abs(dx), abs(dy)) not in (2, 4))
+
+    positions = _alignment_positions(version)
+    last = len(positions) - 1
+
+    for i, center_x in enumerate(positions):
+        for j, center_y in enumerate(positions):
+            if (i, j) in ((0, 0), (0, last), (last, 0)):
+                continue
+
+            for dy in range(-2, 3):
+                for dx in range(-2, 3):
+                    set_module(center_x + dx, center_y + dy, max(abs(dx), abs(dy)) != 1)
+
+    # format bits are drawn once the mask is known, only their area is reserved here
+    _draw_format_bits(modules, 0, set_module)
+
+    if version >= 7:
+        remainder = version
+
+        for _ in range(12):
+            remainder = (remainder << 1) ^ ((remainder >> 11) * 0x1F25)
+
+        bits = version << 12 | remainder
+
+        for index in range(18):
+            dark = bool((bits >> index) & 1)
+            a, b = size - 11 + index % 3, index // 3
+            set_module(a, b, dark)
+            set_module(b, a, dark)
+
+    return tuple(bytes(row) for row in modules), tuple(bytes(row) for row in functions)
+
+
+def _draw_format_bits(modules: Matrix, data: int, set_module=None) -> None:
+    size = len(modules)
+
+    if set_module is None:
+        def set_module(x: int, y: int, dark: bool) -> None:
+            modules[y][x] = dark
+
+    remainder = data
+
+    for _ in range(10):
+        remainder = (remainder << 1) ^ ((remainder >> 9) * 0x537)
+
+    bits = (data << 10 | remainder) ^ 0x5412
+
+    def bit(index: int) -> bool:
+        return bool((bits >> index) & 1)
+
+    for index in range(6):
+        set_module(8, index, bit(index))
+
+    set_module(8, 7, bit(6))
+    set_module(8, 8, bit(7))
+    set_module(7, 8, bit(8))
+
+    for index in range(9, 15):
+        set_module(14 - index, 8, bit(index))
+
+    for index in range(8):
+        set_module(size - 1 - index, 8, bit(index))
+
+    for index in range(8, 15):
+        set_module(8, size - 15 + index, bit(index))
+
+    set_module(8, size - 8, True)
+
+
+def _codewords(data: bytes, version: int, level: str) -> List[int]:
+    """ Data and error correction codewords, split in blocks and interleaved. """
+    capacity = _data_codewords(version, level)
+    count_bits = 8 if version < 10 else 16
+    bits = (0b0100 << count_bits | len(data)) << len(data) * 8 | int.from_bytes(data, 'big')
+    length = 4 + count_bits + len(data) * 8
+    terminator = min(4, capacity * 8 - length)
+    bits <<= terminator
+    length += terminator
+    bits <<= -length % 8
+    length += -length % 8
+    codewords = list(bits.to_bytes(length // 8, 'big'))
+
+    for index in range(capacity - len(codewords)):
+        codewords.append(0xEC if index % 2 == 0 else 0x11)
+
+    blocks_count = ERROR_CORRECTION_BLOCKS[level][version]
+    ecc_length = ECC_CODEWORDS_PER_BLOCK[level][version]
+    raw_codewords = _raw_data_modules(version) // 8
+    short_blocks = blocks_count - raw_codewords % blocks_count
+    short_length = raw_codewords // blocks_count
+    blocks = []
+    start = 0
+
+    for index in range(blocks_count):
+        end = start + short_length - ecc_length + (0 if index < short_blocks else 1)
+        block = codewords[start:end]
+        ecc = _remainder(block, ecc_length)
+
+        if index < short_blocks:
+            block.append(0)
+
+        blocks.append(block + ecc)
+        start = end
+
+    return [
+        block[index]
+        for index in range(len(blocks[0]))
+        for block_index, block in enumerate(blocks)
+        if index != short_length - ecc_length or block_index >= short_blocks
+    ]
+
+
+def _draw_codewords(modules: Matrix, functions: Sequence[bytes], codewords: List[int]) -> None:
+    size = len(modules)
+    total_bits = len(codewords) * 8
+    index = 0
+    right = size - 1
+
+    while right >= 1:
+        if right == 6:
+            right = 5
+
+        upward = (right + 1) & 2 == 0
+
+        for vertical in range(size):
+            y = size - 1 - vertical if upward else vertical
+
+            for x in (right, right - 1):
+                if not functions[y][x] and index < total_bits:
+                    modules[y][x] = (codewords[index >> 3] >> (7 - (index & 7))) & 1
+                    index += 1
+
+        right -= 2
+
+
+@functools.lru_cache(maxsize=None)
+def _mask_rows(version: int, mask: int) -> Tuple[int, ...]:
+    """ Rows of the mask as integers, one byte per module, leaving function modules alone. """
+    condition = MASKS[mask]
+    _, functions = _function_patterns(version)
+
+    return tuple(
+        int.from_bytes(
+            bytes(
+                int(not function_row[x] and condition(x, y))
+                for x in range(len(function_row))
+            ),
+            'big',
+        )
+        for y, function_row in enumerate(functions)
+    )
+
+
+def _line_penalty(line: bytes, size: int) -> int:
+    lengths = list(map(len, RUNS.findall(line)))
+    penalty = sum(length - 2 for length in lengths if length >= 5)
+
+    # the line is surrounded by the light border, which also counts for finder-like patterns,
+    # after this light runs are the ones with an even index
+    if line[0]:
+        lengths.insert(0, 0)
+
+    if len(lengths) % 2 == 0:
+        lengths.append(0)
+
+    lengths[0] += size
+    lengths[-1] += size
+
+    for index in range(6, len(lengths), 2):
+        run = lengths[index - 1]
+
+        if (
+            lengths[index - 2] == lengths[index - 4] == lengths[index - 5] == run
+            and lengths[index - 3] == run * 3
+        ):
+            before, after = lengths[index - 6], lengths[index]
+            penalty += 40 * (
+                int(after >= run * 4 and before >= run) + int(before >= run * 4 and after >= run)
+            )
+
+    return penalty
+
+
+def _penalty(modules: Matrix) -> int:
+    size = len(modules)
+    penalty = sum(_line_penalty(row, size) for row in modules)
+    penalty += sum(_line_penalty(bytes(column), size) for column in zip(*modules))
+
+    # 2x2 blocks of a single color, rows are handled as integers with a byte per module so the
+    # module on the right is one byte shift away
+    rows = [int.from_bytes(row, 'big') for row in modules]
+    light = int.from_bytes(b'\x01' * size, 'big')
+
+    for row, next_row in zip(rows, rows[1:]):
+        dark_blocks = row & row << 8 & next_row & next_row << 8
+        light_row, light_next_row = row ^ light, next_row ^ light
+        light_blocks = light_row & light_row << 8 & light_next_row & light_next_row << 8
+        penalty += 3 * (bin(dark_blocks).count('1') + bin(light_blocks).count('1'))
+
+    dark = sum(bin(row).count('1') for row in rows)
+    total = size * size
+    penalty += ((abs(dark * 20 - total * 10) + total - 1) // total - 1) * 10
+
+    return penalty
+
+
+def version_for(length: int, level: str = 'M') -> int:
+    """ Smallest version able to hold `length` bytes. """
+    for version in range(MIN_VERSION, MAX_VERSION + 1):
+        count_bits = 8 if version < 10 else 16
+
+        if 4 + count_bits + length * 8 <= _data_codewords(version, level) * 8:
+            return version
+
+    raise DataTooLongError(length)
+
+
+def encode(data: bytes, level: str = 'M', mask: Optional[int] = None) -> Matrix:
+    """ Encode `data` in the smallest QR code for the error correction level, returning its rows
+    of modules (1 for dark). The mask with the lowest penalty is used unless one is given.
+    """
+    version = version_for(len(data), level)
+    patterns, functions = _function_patterns(version)
+    modules = [bytearray(row) for row in patterns]
+    _draw_codewords(modules, functions, _codewords(data, version, level))
+    rows = [int.from_bytes(row, 'big') for row in modules]
+    size = len(modules)
+    masks = range(len(MASKS)) if mask is None else [mask]
+    best = None
+
+    for candidate in masks:
+        masked = [
+            bytearray((row ^ mask_row).to_bytes(size, 'big'))
+            for row, mask_row in zip(rows, _mask_rows(version, candidate))
+        ]
+        _draw_format_bits(masked, FORMAT_BITS[level] << 3 | candidate)
+        penalty = _penalty(masked) if len(masks) > 1 else 0
+
+        if best is None or penalty < best[0]:
+            best = (penalty, masked)
+
+    return best[1]
+
+
+def svg(data: bytes, level: str = 'M', module_size: float = MODULE_SIZE) -> str:
+    """ Draw the QR code as SVG, sized in millimeters, with its dark modules in a single path. """
+    modules = encode(data, level)
+    size = len(modules) + QUIET_ZONE * 2
+    runs = []
+
+    for y, row in enumerate(modules, QUIET_ZONE):
+        x = 0
+
+        while x < len(row):
+            if row[x]:
+                start = x
+
+                while x < len(row) and row[x]:
+                    x += 1
+
+                runs.append(f'M{start + QUIET_ZONE} {y}h{x - start}v1h-{x - start}z')
+            else:
+                x += 1
+
+    return (
+        '<svg xmlns="http://www.w3.org/2000/svg" '
+        f'width="{size * module_size:g}mm" height="{size * module_size:g}mm" '
+        f'viewBox="0 0 {size} {size}" shape-rendering="crispEdges">'
+        '<rect width="100%" height="100%" fill="white"/>'
+        f'<path d="{"".join(runs)}"/>'
+        '</svg>'
+    )
@@ -1,20 +1,33 @@
-import io
-import barcode
+import json
 from base64 import b64encode
-from typing import Optional, List, IO
+from typing import TYPE_CHECKING, Optional, Dict, Iterable, List, Tuple, IO
 from datetime import datetime, timezone
 from decimal import Decimal
 
-from . import backend
+from . import metrics, utils
 from .company import Company
 from .customer import Customer
-from .printer import Printer
+from .printer import Printer, get_printer
+
+if TYPE_CHECKING:
+    from . import backend
+
+# only needed once a receipt is printed
+itf = utils.lazy_import('juryou.itf')
+qr = utils.lazy_import('juryou.qr')
 
 C_INVOICE_TYPE = 11
 PRODUCT_INVOICE_CONCEPT = 1
+QR_URL = 'https://www.afip.gob.ar/fe/qr/?p='
+QR_VERSION = 1
+QR_CURRENCY = 'PES'
+CAE_AUTHORIZATION_TYPE = 'E'
+CAEA_AUTHORIZATION_TYPE = 'A'
 
 
 class Item:
+    __slots__ = ('name', 'amount', 'price')
+
     def __init__(self, name: str, amount: int, price: Decimal):
         self.name = name
         self.amount = amount
@@ -26,6 +39,34 @@ class Item:
 
 
 class Receipt:
+    """ A receipt issued by `company` to `customer`.
+
+    The total is cached, it's recomputed only after items are added, cleared or replaced, so
+    items shouldn't be modified in place.
+    """
+
+    __slots__ = (
+        'company',
+        'customer',
+        'backend',
+        'date',
+        'point_of_sale',
+        'type',
+        'concept',
+        'number',
+        'cae',
+        'cae_expiration',
+        'authorization_type',
+        'confirmation_code',
+        'errors',
+        '_items',
+        '_total',
+        '_printer',
+        '_code',
+        '_barcode',
+        '_qr',
+    )
+
     def __init__(
         self,
         company: Company,
@@ -35,6 +76,7 @@ class Receipt:
         date: Optional[datetime] = None,
         type: int = C_INVOICE_TYPE,
         concept: int = PRODUCT_INVOICE_CONCEPT,
+        printer: Optional[Printer] = None,
     ):
         self.company = company
         self.customer = customer
@@ -43,30 +85,74 @@ class Receipt:
         self.point_of_sale = point_of_sale
         self.type = type
         self.concept = concept
-        self.items: List[Item] = []
+        self._items: List[Item] = []
+        self._total: Optional[Decimal] = None
         self.number: Optional[int] = None
         self.cae: Optional[str] = None
         self.cae_expiration: Optional[datetime] = None
+        # whether `cae` is a CAE or a CAEA
+        self.authorization_type = CAE_AUTHORIZATION_TYPE
         self.confirmation_code: Optional[str] = None
-        self.printer = Printer()
+        self.errors: List[str] = []
+        self._printer = printer
+        self._code: Optional[Tuple[tuple, str]] = None
+        self._barcode: Optional[Tuple[str, str]] = None
+        self._qr: Optional[Tuple[str, str]] = None
+
+    @property
+    def printer(self) -> Printer:
+        """ The printer given to the receipt, or the shared one. """
+        return self._printer if self._printer is not None else get_printer()
+
+    @printer.setter
+    def printer(self, printer: Printer) -> None:
+        self._printer = printer
 
     def commit(self) -> 'Receipt':
         return self.backend.commit(self)
 
+    @staticmethod
+    def commit_many(receipts: Iterable['Receipt']) -> List['Receipt']:
+        """ Commit the given receipts, batching together the ones sharing a backend. """
+        receipts = list(receipts)
+        groups: Dict[int, Tuple['backend.BaseBackend', List['Receipt']]] = {}
+
+        for receipt in receipts:
+            groups.setdefault(id(receipt.backend), (receipt.backend, []))[1].append(receipt)
+
+        for receipt_backend, group in groups.values():
+            receipt_backend.commit_many(group)
+
+        return receipts
+
     def generate_pdf(self, buffer: IO = None) -> IO:
         return self.printer.print(self, buffer)
 
+    @property
+    def items(self) -> List[Item]:
+        return self._items
+
+    @items.setter
+    def items(self, items: Iterable[Item]) -> None:
+        self._items = list(items)
+        self._total = None
+
     def add_item(self, name: str, amount: int, price: Decimal) -> 'Receipt':
-        self.items.append(Item(name, amount, price))
+        self._items.append(Item(name, amount, price))
+        self._total = None
 
         return self
 
     def clear_items(self):
-        self.items.clear()
+        self._items.clear()
+        self._total = None
 
     @property
     def total(self) -> Decimal:
-        return Decimal(sum(item.total for item in self.items))
+        if self._total is None:
+            self._total = Decimal(sum(item.total for item in self._items))
+
+        return self._total
 
     @property
     def type_letter(self) -> str:
@@ -78,33 +164,83 @@ class Receipt:
         return type_letter
 
     def _generate_verification_number(self, code: str) -> int:
-        odd = sum(int(code[index]) for index in range(1, len(code), 2)) * 3
-        even = sum(int(code[index]) for index in range(0, len(code), 2))
+        odd = sum(map(int, code[1::2])) * 3
+        even = sum(map(int, code[0::2]))
         total = odd + even
 
         return 10 - total % 10
 
     @property
     def code(self) -> str:
-        code = '{}{:03d}{:05d}{}{}'.format(
-            self.company.cuit,
-            self.type,
-            self.point_of_sale,
-            self.cae,
-            self.date.strftime(self.backend.WSFEV1_DATE_FORMAT),
-        )
+        # cached until any of the values it's built from changes
+        key = (self.company.cuit, self.type, self.point_of_sale, self.cae, self.date)
+
+        if self._code is None or self._code[0] != key:
+            code = '{}{:03d}{:05d}{}{}'.format(
+                self.company.cuit,
+                self.type,
+                self.point_of_sale,
+                self.cae,
+                self.date.strftime(self.backend.WSFEV1_DATE_FORMAT),
+            )
 
-        verification_code = self._generate_verification_number(code)
-        code += str(verification_code)
+            verification_code = self._generate_verification_number(code)
+            code += str(verification_code)
+            self._code = (key, code)
 
-        return code
+        return self._code[1]
 
     @property
     def barcode(self) -> str:
-        output = io.BytesIO()
-        ITF = barcode.get_barcode_class('itf')
-        itf = ITF(self.code)
-        itf.write(output, options={'module_width': 0.16})
-        svg = output.getvalue()
+        code = self.code
+
+        if self._barcode is None or self._barcode[0] != code:
+            with metrics.timer('receipt.barcode'):
+                svg = itf.svg(code).encode('utf-8')
+
+            self._barcode = (
+                code,
+                'data:image/svg+xml;charset=utf-8;base64,' + b64encode(svg).decode('utf-8'),
+            )
+
+        return self._barcode[1]
+
+    @property
+    def qr_data(self) -> dict:
+        """ Receipt data encoded in the QR required by AFIP. """
+        return {
+            'ver': QR_VERSION,
+            'fecha': self.date.strftime('%Y-%m-%d'),
+            'cuit': int(self.company.cuit),
+            'ptoVta': self.point_of_sale,
+            'tipoCmp': self.type,
+            'nroCmp': self.number,
+            'importe': float(utils.quantize_decimal(self.total)),
+            'moneda': QR_CURRENCY,
+            'ctz': 1,
+            'tipoDocRec': self.customer.identity_document_type,
+            'nroDocRec': int(self.customer.identity_document),
+            'tipoCodAut': self.authorization_type,
+            'codAut': int(self.cae),
+        }
+
+    @property
+    def qr_url(self) -> str:
+        payload = json.dumps(self.qr_data, separators=(',', ':')).encode('utf-8')
+
+        return QR_URL + b64encode(payload).decode('utf-8')
+
+    @property
+    def qr(self) -> str:
+        url = self.qr_url
+
+        if self._qr is None or self._qr[0] != url:
+            with metrics.timer('receipt.qr'):
+                svg = qr.svg(url.encode('utf-8')).encode('utf-8')
+
+            self._qr = (
+                url,
+                'data:image/svg+xml;charset=utf-8;base64,' + b64encode(svg).decode('utf-8'),
+            )
 
-        return 'data:image/svg+xml;charset=utf-8;base64,' + b64encode(svg).decode('utf-8')
+        return self._qr[1]
@@ -1,11 +1,15 @@
 import faker
+import gc
+import socket
+import tempfile
+import threading
 import freezegun
 from unittest import mock, TestCase
 from datetime import datetime, timedelta, timezone
 
 from juryou import utils
-from juryou.tests import factories
-from juryou.backend import afip
+from juryou.tests import factories, test_metrics
+from juryou.backend import afip, cache, credentials, resilience, soap, wsdl
 
 fake = faker.Faker()
 
@@ -17,7 +21,18 @@ class AfipGetClientTestCase(TestCase):
         certificate = fake.paragraph()
         private_key = fake.paragraph()
         cuit = fake.numerify(text='###########')
-        self.afip = afip.AFIPBackend(certificate, private_key, cuit)
+        wsdl_cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(wsdl_cache_dir.cleanup)
+        self.afip = afip.AFIPBackend(
+            certificate,
+            private_key,
+            cuit,
+            cache=wsdl.WSDLCache(wsdl_cache_dir.name),
+        )
+        self.addCleanup(self.afip.close)
+        signer_patcher = mock.patch('juryou.backend.afip.TRASigner')
+        self.signer = signer_patcher.start().return_value
+        self.addCleanup(signer_patcher.stop)
 
     def test_should_store_token_and_sign_internally(self, wsaa, wsfev1):
         # arrange
@@ -25,6 +40,7 @@ class AfipGetClientTestCase(TestCase):
         sign = fake.lexify(text='?????????')
         expiration = fake.date_time_between(
             start_date='now',
+            tzinfo=timezone.utc,
         ).strftime(self.afip.EXPIRATION_DATE_FORMAT)
         wsaa.WSAA.return_value.Token = token
         wsaa.WSAA.return_value.Sign = sign
@@ -78,6 +94,7 @@ class AfipGetClientTestCase(TestCase):
         new_sign = fake.lexify(text='?????????')
         new_expiration = fake.date_time_between(
             start_date='now',
+            tzinfo=timezone.utc,
         ).strftime(self.afip.EXPIRATION_DATE_FORMAT)
         wsaa.WSAA.return_value.Token = new_token
         wsaa.WSAA.return_value.Sign = new_sign
@@ -93,6 +110,215 @@ class AfipGetClientTestCase(TestCase):
         self.assertEqual(self.afip.credentials[self.afip.SIGN_CACHE_KEY], new_sign)
         self.assertEqual(self.afip.credentials[self.afip.EXPIRATION_CACHE_KEY], new_expiration)
 
+    def test_should_reuse_client_while_credentials_are_valid(self, wsaa, wsfev1):
+        # arrange
+        self.afip.credentials = {
+            self.afip.TOKEN_CACHE_KEY: fake.lexify(text='?????????'),
+            self.afip.SIGN_CACHE_KEY: fake.lexify(text='?????????'),
+        }
+
+        # act
+        first_client = self.afip._get_client()
+        second_client = self.afip._get_client()
+
+        # assert
+        self.assertIs(first_client, second_client)
+        wsfev1.WSFEv1.assert_called_once()
+        wsfev1.WSFEv1.return_value.Conectar.assert_called_once()
+
+    def test_should_rebuild_client_when_credentials_rotate(self, wsaa, wsfev1):
+        # arrange
+        self.afip.credentials = {
+            self.afip.TOKEN_CACHE_KEY: fake.lexify(text='?????????'),
+            self.afip.SIGN_CACHE_KEY: fake.lexify(text='?????????'),
+        }
+        self.afip._get_client()
+        new_token = fake.lexify(text='?????????')
+        self.afip.credentials = {
+            self.afip.TOKEN_CACHE_KEY: new_token,
+            self.afip.SIGN_CACHE_KEY: fake.lexify(text='?????????'),
+        }
+        wsfev1.WSFEv1.side_effect = lambda: mock.MagicMock()
+
+        # act
+        client = self.afip._get_client()
+
+        # assert
+        self.assertEqual(wsfev1.WSFEv1.call_count, 2)
+        self.assertEqual(client.Token, new_token.encode('utf-8'))
+
+    def test_should_use_one_client_per_thread(self, wsaa, wsfev1):
+        # arrange
+        self.afip.credentials = {
+            self.afip.TOKEN_CACHE_KEY: fake.lexify(text='?????????'),
+            self.afip.SIGN_CACHE_KEY: fake.lexify(text='?????????'),
+        }
+        wsfev1.WSFEv1.side_effect = lambda: mock.MagicMock()
+        clients = []
+        thread = threading.Thread(target=lambda: clients.append(self.afip._get_client()))
+
+        # act
+        clients.append(self.afip._get_client())
+        thread.start()
+        thread.join()
+
+        # assert
+        self.assertEqual(len(clients), 2)
+        self.assertIsNot(clients[0], clients[1])
+
+    def test_should_share_credentials_between_backends(self, wsaa, wsfev1):
+        # arrange
+        store = credentials.MemoryCredentialStore()
+        self.afip.credential_store = store
+        other_afip = afip.AFIPBackend(
+            self.afip.certificate,
+            self.afip.private_key,
+            self.afip.cuit,
+            cache=self.afip.cache,
+            credential_store=store,
+        )
+        self.addCleanup(other_afip.close)
+        wsaa.WSAA.return_value.Token = fake.lexify(text='?????????')
+        wsaa.WSAA.return_value.Sign = fake.lexify(text='?????????')
+        wsaa.WSAA.return_value.ObtenerTagXml.return_value = (
+            datetime.now(timezone.utc) + timedelta(hours=1)
+        ).strftime(self.afip.EXPIRATION_DATE_FORMAT)
+
+        # act
+        self.afip._get_client()
+        other_afip._get_client()
+
+        # assert
+        wsaa.WSAA.return_value.LoginCMS.assert_called_once()
+
+    def test_should_refresh_credentials_after_they_expire(self, wsaa, wsfev1):
+        # arrange
+        self.afip.refresh_credentials = True
+        expiration = datetime.now(timezone.utc) + timedelta(hours=1)
+        wsaa.WSAA.return_value.Token = fake.lexify(text='?????????')
+        wsaa.WSAA.return_value.Sign = fake.lexify(text='?????????')
+        wsaa.WSAA.return_value.ObtenerTagXml.return_value = expiration.strftime(
+            self.afip.EXPIRATION_DATE_FORMAT,
+        )
+
+        # act
+        with mock.patch('juryou.backend.afip.threading.Timer') as timer:
+            self.afip._get_client()
+
+        # assert
+        (delay, callback, (reference,)), _ = timer.call_args
+        self.assertAlmostEqual(delay, 3600 + self.afip.REFRESH_DELAY, delta=5)
+        self.assertEqual(callback, afip._refresh_backend)
+        self.assertIs(reference(), self.afip)
+        timer.return_value.start.assert_called_once()
+
+    def test_should_not_refresh_credentials_by_default(self, wsaa, wsfev1):
+        # arrange
+        wsaa.WSAA.return_value.ObtenerTagXml.return_value = (
+            datetime.now(timezone.utc) + timedelta(hours=1)
+        ).strftime(self.afip.EXPIRATION_DATE_FORMAT)
+
+        # act
+        with mock.patch('juryou.backend.afip.threading.Timer') as timer:
+            self.afip._get_client()
+
+        # assert
+        timer.assert_not_called()
+
+    def test_should_stop_refreshing_credentials_once_collected(self, wsaa, wsfev1):
+        # arrange
+        backend = afip.AFIPBackend('', '', '', refresh_credentials=True)
+        backend._schedule_refresh(credentials.Ticket(
+            fake.lexify(text='?????????'),
+            fake.lexify(text='?????????'),
+            datetime.now(timezone.utc) + timedelta(hours=1),
+        ))
+        timer = backend._refresh_timer
+
+        # act
+        del backend
+        gc.collect()
+
+        # assert
+        self.assertTrue(timer.finished.wait(5))
+
+    def test_should_stop_refreshing_credentials_once_closed(self, wsaa, wsfev1):
+        # arrange
+        self.afip.refresh_credentials = True
+        expiration = datetime.now(timezone.utc) + timedelta(hours=1)
+        wsaa.WSAA.return_value.ObtenerTagXml.return_value = expiration.strftime(
+            self.afip.EXPIRATION_DATE_FORMAT,
+        )
+
+        with mock.patch('juryou.backend.afip.threading.Timer') as timer:
+            self.afip._get_client()
+
+        # act
+        self.afip.close()
+        self.afip._get_client()
+
+        # assert
+        timer.return_value.cancel.assert_called_once()
+        self.assertEqual(wsfev1.WSFEv1.call_count, 2)
+
+    def test_should_not_refresh_credentials_again_once_closed(self, wsaa, wsfev1):
+        # arrange
+        self.afip.refresh_credentials = True
+        self.afip.close()
+
+        # act
+        with mock.patch('juryou.backend.afip.threading.Timer') as timer:
+            self.afip._schedule_refresh(credentials.Ticket(
+                fake.lexify(text='?????????'),
+                fake.lexify(text='?????????'),
+                datetime.now(timezone.utc) + timedelta(hours=1),
+            ))
+
+        # assert
+        timer.assert_not_called()
+
+    def test_should_sign_with_loaded_certificate_only_once(self, wsaa, wsfev1):
+        # arrange
+        self.afip.credentials = {
+            self.afip.TOKEN_CACHE_KEY: fake.lexify(text='?????????'),
+            self.afip.SIGN_CACHE_KEY: fake.lexify(text='?????????'),
+            self.afip.EXPIRATION_CACHE_KEY: fake.date_time_between(
+                end_date='now',
+                tzinfo=timezone.utc,
+            ).strftime(self.afip.EXPIRATION_DATE_FORMAT),
+        }
+        wsaa.WSAA.return_value.ObtenerTagXml.return_value = fake.date_time_between(
+            end_date='now',
+            tzinfo=timezone.utc,
+        ).strftime(self.afip.EXPIRATION_DATE_FORMAT)
+
+        # act
+        self.afip._get_client()
+        self.afip._get_client()
+
+        # assert
+        afip.TRASigner.assert_called_once_with(self.afip.certificate, self.afip.private_key)
+        self.assertEqual(self.signer.sign.call_count, 2)
+        wsaa.WSAA.return_value.SignTRA.assert_not_called()
+
+    def test_should_not_read_the_store_while_the_ticket_is_valid(self, wsaa, wsfev1):
+        # arrange
+        self.afip.credentials = {
+            self.afip.TOKEN_CACHE_KEY: fake.lexify(text='?????????'),
+            self.afip.SIGN_CACHE_KEY: fake.lexify(text='?????????'),
+            self.afip.EXPIRATION_CACHE_KEY: (
+                datetime.now(timezone.utc) + timedelta(hours=1)
+            ).strftime(self.afip.EXPIRATION_DATE_FORMAT),
+        }
+        self.afip._get_client()
+        self.afip.credential_store = mock.MagicMock()
+
+        # act
+        self.afip._get_client()
+
+        # assert
+        self.afip.credential_store.get.assert_not_called()
+
 
 class AfipGenerateInvoiceTestCase(TestCase):
     def setUp(self):
@@ -100,6 +326,7 @@ class AfipGenerateInvoiceTestCase(TestCase):
         private_key = fake.paragraph()
         cuit = fake.numerify(text='###########')
         self.afip = afip.AFIPBackend(certificate, private_key, cuit)
+        self.addCleanup(self.afip.close)
         self.afip._get_client = mock.MagicMock()
         self.receipt = factories.ReceiptFactory(backend=self.afip)
 
@@ -119,7 +346,7 @@ class AfipGenerateInvoiceTestCase(TestCase):
         expected_invoice = {
             'concepto': self.receipt.concept,
             'tipo_doc': self.receipt.customer.identity_document_type,
-            'nro_doc': self.receipt.customer.identity_document,
+            'nro_doc': int(self.receipt.customer.identity_document),
             'tipo_cbte': self.receipt.type,
             'punto_vta': self.receipt.point_of_sale,
             'cbt_desde': invoice_number,
@@ -138,3 +365,524 @@ class AfipGenerateInvoiceTestCase(TestCase):
         self.assertEqual(receipt.number, invoice_number)
         self.assertEqual(receipt.cae, afip_client.CAE)
         self.assertEqual(receipt.cae_expiration, cae_expiration)
+
+    def test_should_only_ask_for_the_last_number_once(self):
+        # arrange
+        afip_client = self.afip._get_client.return_value
+        afip_client.CompUltimoAutorizado.return_value = 4
+        afip_client.Vencimiento = '20200309'
+        other_receipt = factories.ReceiptFactory(
+            backend=self.afip,
+            point_of_sale=self.receipt.point_of_sale,
+        )
+
+        # act
+        self.afip.commit(self.receipt)
+        self.afip.commit(other_receipt)
+
+        # assert
+        afip_client.CompUltimoAutorizado.assert_called_once()
+        self.assertEqual((self.receipt.number, other_receipt.number), (5, 6))
+
+    def test_should_resync_number_when_out_of_sequence(self):
+        # arrange
+        afip_client = self.afip._get_client.return_value
+        afip_client.CompUltimoAutorizado.side_effect = [4, 7]
+        afip_client.Vencimiento = '20200309'
+        afip_client.Errores = []
+        afip_client.Observaciones = ['10016: El numero no se corresponde con el proximo']
+        results = iter(['R', 'A'])
+        afip_client.CAESolicitar.side_effect = lambda: setattr(
+            afip_client,
+            'Resultado',
+            next(results),
+        )
+
+        # act
+        receipt = self.afip.commit(self.receipt)
+
+        # assert
+        self.assertEqual(afip_client.CAESolicitar.call_count, 2)
+        self.assertEqual(afip_client.CrearFactura.call_args[1]['cbt_desde'], 8)
+        self.assertEqual(receipt.number, 8)
+        self.assertEqual(receipt.errors, [])
+
+    def test_should_tell_the_number_before_requesting_the_cae(self):
+        # arrange
+        afip_client = self.afip._get_client.return_value
+        afip_client.CompUltimoAutorizado.return_value = 4
+        afip_client.Vencimiento = '20200309'
+        on_number = mock.MagicMock()
+        afip_client.CAESolicitar.side_effect = lambda: on_number.assert_called_once_with(5)
+
+        # act
+        receipt = self.afip.commit(self.receipt, on_number)
+
+        # assert
+        afip_client.CAESolicitar.assert_called_once()
+        self.assertEqual(receipt.number, 5)
+
+    def test_should_keep_errors_when_rejected(self):
+        # arrange
+        afip_client = self.afip._get_client.return_value
+        afip_client.CompUltimoAutorizado.return_value = 4
+        afip_client.Resultado = 'R'
+        afip_client.Errores = ['10015: Documento invalido']
+        afip_client.Observaciones = []
+
+        # act
+        receipt = self.afip.commit(self.receipt)
+
+        # assert
+        afip_client.CAESolicitar.assert_called_once()
+        self.assertIsNone(receipt.number)
+        self.assertIsNone(receipt.cae)
+        self.assertEqual(receipt.errors, ['10015: Documento invalido'])
+
+    def test_should_report_requests_and_rejections_to_the_collector(self):
+        # arrange
+        collector = test_metrics.RecordingCollector()
+        test_metrics.collect(self, collector)
+        afip_client = self.afip._get_client.return_value
+        afip_client.CompUltimoAutorizado.return_value = 4
+        afip_client.Resultado = 'R'
+        afip_client.Errores = ['10015: Documento invalido']
+        afip_client.Observaciones = []
+
+        # act
+        self.afip.commit(self.receipt)
+
+        # assert
+        requests = [event[3] for event in collector.events if event[1] == 'afip.request']
+        counts = [event[1:] for event in collector.events if event[0] == 'count']
+        self.assertEqual(requests, [
+            {'operation': 'FECompUltimoAutorizado', 'status': 'ok'},
+            {'operation': 'FECAESolicitar', 'status': 'ok'},
+        ])
+        self.assertEqual(counts, [
+            ('afip.errors', 1, {'operation': 'FECAESolicitar', 'code': '10015'}),
+            ('afip.receipts', 1, {'result': 'rejected'}),
+        ])
+
+
+class AfipRecoveryTestCase(TestCase):
+    def setUp(self):
+        certificate = fake.paragraph()
+        private_key = fake.paragraph()
+        cuit = fake.numerify(text='###########')
+        self.afip = afip.AFIPBackend(
+            certificate,
+            private_key,
+            cuit,
+            retry_policy=resilience.RetryPolicy(base_delay=0),
+        )
+        self.addCleanup(self.afip.close)
+        self.afip._get_client = mock.MagicMock()
+        self.receipt = factories.ReceiptFactory(backend=self.afip)
+        self.client = self.afip._get_client.return_value
+        self.client.CompUltimoAutorizado.return_value = 4
+        self.client.CAESolicitar.side_effect = socket.timeout()
+        self.client.Errores = []
+
+    def _found(self, total=None):
+        def consult(invoice_type, point_of_sale, invoice_number):
+            self.client.Errores = []
+            self.client.factura = {
+                'nro_doc': self.receipt.customer.identity_document,
+                'fecha_cbte': self.receipt.date.strftime('%Y%m%d'),
+                'tipo_cbte': invoice_type,
+                'concepto': self.receipt.concept,
+                'imp_total': total or str(utils.quantize_decimal(self.receipt.total)),
+                'cae': '71000000000001',
+                'fch_venc_cae': '20200309',
+            }
+
+        return consult
+
+    def _not_found(self, *args):
+        self.client.Errores = ['602: Sin resultados']
+
+    def test_should_recover_the_cae_of_a_timed_out_request(self):
+        # arrange
+        self.client.CompConsultar.side_effect = self._found()
+
+        # act
+        receipt = self.afip.commit(self.receipt)
+
+        # assert
+        self.client.CAESolicitar.assert_called_once()
+        self.client.CompConsultar.assert_called_once_with(
+            self.receipt.type,
+            self.receipt.point_of_sale,
+            5,
+        )
+        self.assertEqual(receipt.number, 5)
+        self.assertEqual(receipt.cae, '71000000000001')
+        self.assertEqual(receipt.cae_expiration, datetime(2020, 3, 9))
+
+    def test_should_recover_the_cae_when_py3afipws_hides_the_error(self):
+        # arrange
+        # py3afipws catches the timeout, then fails reading the response it didn't get
+        self.client.CAESolicitar.side_effect = UnboundLocalError()
+        self.client.CompConsultar.side_effect = self._found()
+
+        # act
+        receipt = self.afip.commit(self.receipt)
+
+        # assert
+        self.client.CAESolicitar.assert_called_once()
+        self.assertEqual(receipt.cae, '71000000000001')
+
+    def test_should_raise_the_fault_py3afipws_hides(self):
+        # arrange
+        def fault():
+            self.client.client.xml_response = soap.build_fault(
+                'soap:Server',
+                'Error interno de base de datos',
+            )
+
+            raise UnboundLocalError()
+
+        self.client.CAESolicitar.side_effect = fault
+
+        # act & assert
+        with self.assertRaisesRegex(afip.AFIPServiceError, 'Error interno de base de datos'):
+            self.afip.commit(self.receipt)
+
+        self.client.CAESolicitar.assert_called_once()
+        self.client.CompConsultar.assert_not_called()
+
+    def test_should_retry_connection_errors_hidden_by_py3simplesoap(self):
+        # arrange
+        try:
+            try:
+                raise socket.timeout()
+            except socket.timeout:
+                # how py3simplesoap fails while handling connection errors with httplib2 >= 0.16
+                raise AttributeError("module 'httplib2' has no attribute 'SSLHandshakeError'")
+        except AttributeError as error:
+            hidden_error = error
+
+        self._found()(self.receipt.type, self.receipt.point_of_sale, 5)
+        self.client.CompConsultar.side_effect = [hidden_error, None]
+
+        # act
+        receipt = self.afip.commit(self.receipt)
+
+        # assert
+        self.assertEqual(self.client.CompConsultar.call_count, 2)
+        self.assertEqual(receipt.cae, '71000000000001')
+
+    def test_should_request_again_when_the_timed_out_request_was_not_authorized(self):
+        # arrange
+        self.client.CompConsultar.side_effect = self._not_found
+        self.client.CAESolicitar.side_effect = [socket.timeout(), None]
+        self.client.Resultado = 'A'
+        self.client.CAE = '71000000000002'
+        self.client.Vencimiento = '20200309'
+
+        # act
+        receipt = self.afip.commit(self.receipt)
+
+        # assert
+        self.assertEqual(self.client.CAESolicitar.call_count, 2)
+        self.assertEqual(receipt.number, 5)
+        self.assertEqual(receipt.cae, '71000000000002')
+
+    def test_should_fail_when_the_number_was_taken_by_another_receipt(self):
+        # arrange
+        self.client.CompConsultar.side_effect = self._found(total='1.00')
+
+        # act
+        with self.assertRaises(afip.AmbiguousCommitError):
+            self.afip.commit(self.receipt)
+
+        self.client.CAESolicitar.side_effect = None
+        self.client.Resultado = 'A'
+        self.client.Vencimiento = '20200309'
+        self.client.CompUltimoAutorizado.return_value = 5
+        self.afip.commit(self.receipt)
+
+        # assert
+        self.assertEqual(self.client.CompUltimoAutorizado.call_count, 2)
+        self.assertEqual(self.receipt.number, 6)
+
+    def test_should_stop_calling_afip_once_the_circuit_opens(self):
+        # arrange
+        self.afip.circuit_breaker = resilience.CircuitBreaker(threshold=2)
+        self.client.CompUltimoAutorizado.side_effect = socket.timeout()
+
+        # act
+        for _ in range(2):
+            with self.assertRaises(resilience.CircuitOpenError):
+                self.afip.commit(self.receipt)
+
+        # assert
+        self.assertEqual(self.client.CompUltimoAutorizado.call_count, 2)
+        self.assertEqual(self.afip.circuit_breaker.state, resilience.CircuitBreaker.OPEN)
+
+
+class AfipCommitManyTestCase(TestCase):
+    def setUp(self):
+        certificate = fake.paragraph()
+        private_key = fake.paragraph()
+        cuit = fake.numerify(text='###########')
+        self.afip = afip.AFIPBackend(certificate, private_key, cuit)
+        self.addCleanup(self.afip.close)
+        self.afip._get_client = mock.MagicMock()
+        self.client = self.afip._get_client.return_value
+        self.client.Errores = []
+        self.client.IniciarFacturasX.side_effect = self._start_invoices
+        self.client.CrearFactura.side_effect = self._create_invoice
+        self.client.AgregarFacturaX.side_effect = self._add_invoice
+        self.client.CAESolicitarX.side_effect = self._request_caes
+        self.cae_expiration = datetime(2020, 3, 9)
+        self.rejected_numbers = set()
+
+    def _start_invoices(self):
+        self.client.facturas = []
+
+    def _create_invoice(self, **invoice):
+        self.client.factura = invoice
+
+    def _add_invoice(self):
+        self.client.facturas.append(self.client.factura)
+
+    def _request_caes(self):
+        for invoice in self.client.facturas:
+            if invoice['cbt_desde'] in self.rejected_numbers:
+                invoice['resultado'] = 'R'
+                invoice['obs'] = [{'code': 10015, 'msg': 'Documento invalido'}]
+            else:
+                invoice['resultado'] = 'A'
+                invoice['cae'] = str(invoice['cbt_desde'] * 1000)
+                invoice['fch_venc_cae'] = self.cae_expiration.strftime('%Y%m%d')
+
+    def test_should_authorize_receipts_in_chunks_with_a_single_number_lookup(self):
+        # arrange
+        self.afip.MAX_RECEIPTS_PER_REQUEST = 2
+        receipts = factories.ReceiptFactory.create_batch(3, backend=self.afip, point_of_sale=1)
+        self.client.CompUltimoAutorizado.return_value = 9
+
+        # act
+        self.afip.commit_many(receipts)
+
+        # assert
+        self.client.CompUltimoAutorizado.assert_called_once_with(receipts[0].type, 1)
+        self.assertEqual(self.client.CAESolicitarX.call_count, 2)
+        self.assertEqual([receipt.number for receipt in receipts], [10, 11, 12])
+        self.assertEqual([receipt.cae for receipt in receipts], ['10000', '11000', '12000'])
+        self.assertTrue(all(receipt.cae_expiration == self.cae_expiration for receipt in receipts))
+
+    def test_should_group_receipts_by_point_of_sale(self):
+        # arrange
+        first = factories.ReceiptFactory(backend=self.afip, point_of_sale=1)
+        second = factories.ReceiptFactory(backend=self.afip, point_of_sale=2)
+        self.client.CompUltimoAutorizado.return_value = 4
+
+        # act
+        self.afip.commit_many([first, second])
+
+        # assert
+        self.assertEqual(self.client.CompUltimoAutorizado.call_count, 2)
+        self.assertEqual(self.client.CAESolicitarX.call_count, 2)
+        self.assertEqual((first.number, second.number), (5, 5))
+
+    def test_should_only_request_again_receipts_not_authorized_before_a_timeout(self):
+        # arrange
+        self.afip.retry_policy = resilience.RetryPolicy(base_delay=0)
+        receipts = factories.ReceiptFactory.create_batch(3, backend=self.afip, point_of_sale=1)
+        self.client.CompUltimoAutorizado.return_value = 9
+        authorized = {}
+
+        def time_out_after_the_first():
+            invoice = self.client.facturas[0]
+            invoice.update(cae='10000', fch_venc_cae='20200309')
+            authorized[invoice['cbt_desde']] = invoice
+            self.client.CAESolicitarX.side_effect = self._request_caes
+            raise socket.timeout()
+
+        def consult(invoice_type, point_of_sale, invoice_number):
+            self.client.Errores = [] if invoice_number in authorized else ['602: Sin resultados']
+            self.client.factura = authorized.get(invoice_number, {})
+
+        self.client.CAESolicitarX.side_effect = time_out_after_the_first
+        self.client.CompConsultar.side_effect = consult
+
+        # act
+        self.afip.commit_many(receipts)
+
+        # assert
+        self.assertEqual([receipt.number for receipt in receipts], [10, 11, 12])
+        self.assertEqual([receipt.cae for receipt in receipts], ['10000', '11000', '12000'])
+        self.assertEqual(
+            [invoice['cbt_desde'] for invoice in self.client.facturas],
+            [11, 12],
+        )
+
+    def test_should_map_rejections_to_their_receipts(self):
+        # arrange
+        receipts = factories.ReceiptFactory.create_batch(2, backend=self.afip, point_of_sale=1)
+        self.client.CompUltimoAutorizado.return_value = 0
+        self.rejected_numbers = {2}
+
+        # act
+        self.afip.commit_many(receipts)
+
+        # assert
+        self.assertEqual(receipts[0].number, 1)
+        self.assertEqual(receipts[0].errors, [])
+        self.assertIsNone(receipts[1].number)
+        self.assertIsNone(receipts[1].cae)
+        self.assertEqual(receipts[1].errors, ['10015: Documento invalido'])
+
+
+class AfipFetchLastTestCase(TestCase):
+    def setUp(self):
+        certificate = fake.paragraph()
+        private_key = fake.paragraph()
+        cuit = fake.numerify(text='###########')
+        self.afip = afip.AFIPBackend(certificate, private_key, cuit)
+        self.addCleanup(self.afip.close)
+        self.afip._get_client = mock.MagicMock()
+        self.client = self.afip._get_client.return_value
+        self.client.factura = {
+            'nro_doc': fake.numerify(text='########'),
+            'fecha_cbte': '20200301',
+            'tipo_cbte': 11,
+            'concepto': 1,
+            'imp_total': 100,
+            'cae': fake.numerify(text='##############'),
+            'fch_venc_cae': '20200311',
+        }
+
+    def test_should_return_the_last_receipts_from_the_newest(self):
+        # arrange
+        self.client.CompUltimoAutorizado.return_value = '12'
+
+        # act
+        receipts = self.afip.fetch_last('1:11', 3)
+
+        # assert
+        self.assertEqual([receipt.number for receipt in receipts], [12, 11, 10])
+        self.assertEqual(self.client.CompConsultar.call_count, 3)
+
+    def test_should_not_fetch_past_the_first_receipt(self):
+        # arrange
+        self.client.CompUltimoAutorizado.return_value = '2'
+
+        # act
+        receipts = self.afip.fetch_last('1:11', 5)
+
+        # assert
+        self.assertEqual([receipt.number for receipt in receipts], [2, 1])
+
+
+class AfipFetchTestCase(TestCase):
+    def setUp(self):
+        certificate = fake.paragraph()
+        private_key = fake.paragraph()
+        cuit = fake.numerify(text='###########')
+        self.receipt_cache = cache.MemoryReceiptCache()
+        self.afip = afip.AFIPBackend(
+            certificate,
+            private_key,
+            cuit,
+            receipt_cache=self.receipt_cache,
+        )
+        self.addCleanup(self.afip.close)
+        self.afip._get_client = mock.MagicMock()
+        self.client = self.afip._get_client.return_value
+        self.client.CompConsultar.side_effect = lambda invoice_type, point_of_sale, number: (
+            setattr(self.client, 'factura', {
+                'nro_doc': fake.numerify(text='########'),
+                'fecha_cbte': '20200301',
+                'tipo_cbte': invoice_type,
+                'concepto': 1,
+                'imp_total': 100,
+                'cae': str(number * 1000),
+                'fch_venc_cae': '20200311',
+            })
+        )
+
+    def test_should_not_query_afip_for_cached_receipts(self):
+        # arrange
+        first_receipt = self.afip.fetch('1:11:5')
+
+        # act
+        second_receipt = self.afip.fetch('1:11:5')
+
+        # assert
+        self.client.CompConsultar.assert_called_once_with(11, 1, 5)
+        self.assertEqual(first_receipt.cae, second_receipt.cae)
+        self.assertEqual(second_receipt.total, 100)
+
+    def test_should_not_return_the_previous_receipt_for_a_missing_number(self):
+        # arrange
+        self.afip.fetch('1:11:1')
+        self.client.CompConsultar.side_effect = lambda *args: setattr(
+            self.client,
+            'Errores',
+            ['602: No existen datos en nuestros registros para los parametros ingresados.'],
+        )
+
+        # act
+        with self.assertRaises(afip.ReceiptNotFoundError):
+            self.afip.fetch('1:11:5')
+
+        # assert
+        self.assertIsNone(self.receipt_cache.get((self.afip.cuit, 1, 11, 5)))
+
+    def test_should_raise_the_errors_of_a_failed_lookup(self):
+        # arrange
+        self.client.CompConsultar.side_effect = lambda *args: setattr(
+            self.client,
+            'Errores',
+            ['600: ValidacionDeToken'],
+        )
+
+        # act & assert
+        with self.assertRaisesRegex(afip.AFIPServiceError, '600'):
+            self.afip.fetch('1:11:5')
+
+        self.assertIsNone(self.receipt_cache.get((self.afip.cuit, 1, 11, 5)))
+
+    def test_should_only_fetch_missing_numbers_of_a_range(self):
+        # arrange
+        self.afip.fetch('1:11:2')
+
+        # act
+        receipts = self.afip.fetch_range('1:11', 1, 3)
+
+        # assert
+        self.assertEqual([receipt.number for receipt in receipts], [1, 2, 3])
+        self.assertEqual(self.client.CompConsultar.call_count, 3)
+        self.assertEqual(
+            sorted(call[0][2] for call in self.client.CompConsultar.call_args_list),
+            [1, 2, 3],
+        )
+
+    def test_should_keep_identifiers_order_when_fetching_many(self):
+        # act
+        receipts = self.afip.fetch_many(['1:11:9', '2:11:3', '1:11:4'])
+
+        # assert
+        self.assertEqual(
+            [(receipt.point_of_sale, receipt.number) for receipt in receipts],
+            [(1, 9), (2, 3), (1, 4)],
+        )
+
+    def test_should_fetch_on_the_same_threads_every_time(self):
+        # arrange
+        threads = set()
+        self.afip._get_client.side_effect = lambda: threads.add(threading.current_thread()) or (
+            self.client
+        )
+        workers = self.afip.FETCH_WORKERS
+
+        # act
+        self.afip.fetch_range('1:11', 1, workers * 2)
+        self.afip.fetch_range('1:11', workers * 2 + 1, workers * 4)
+
+        # assert
+        self.assertLessEqual(len(threads), workers)
@@ -0,0 +1,294 @@
+import asyncio
+import faker
+from unittest import mock, TestCase
+from datetime import datetime, timedelta, timezone
+
+from juryou import utils
+from juryou.tests import factories
+from juryou.backend import afip, afip_async, credentials, resilience, sequencer, soap
+
+fake = faker.Faker()
+
+
+def run(coroutine):
+    return asyncio.get_event_loop().run_until_complete(coroutine)
+
+
+class AsyncAfipTestCase(TestCase):
+    def setUp(self):
+        certificate = fake.paragraph()
+        private_key = fake.paragraph()
+        cuit = fake.numerify(text='###########')
+        self.afip = afip_async.AsyncAFIPBackend(
+            certificate,
+            private_key,
+            cuit,
+            credential_store=credentials.MemoryCredentialStore(),
+            retry_policy=resilience.RetryPolicy(base_delay=0),
+        )
+        self.afip._signer = mock.MagicMock()
+        self.calls = []
+        self.responses = {}
+        self.afip._call = self._call
+
+    async def _call(self, url, namespace, operation, arguments, action):
+        self.calls.append((operation, arguments))
+        # let other coroutines run, as a real request would
+        await asyncio.sleep(0)
+        response = self.responses[operation]
+
+        return response(arguments) if callable(response) else response
+
+    def _login_response(self, token='token'):
+        expiration = (datetime.now(timezone.utc) + timedelta(hours=12)).strftime(
+            self.afip.EXPIRATION_DATE_FORMAT,
+        )
+
+        return {
+            'loginCmsReturn': (
+                '<loginTicketResponse><header>'
+                f'<expirationTime>{expiration}</expirationTime>'
+                '</header><credentials>'
+                f'<token>{token}</token><sign>sign</sign>'
+                '</credentials></loginTicketResponse>'
+            ),
+        }
+
+    def _approve(self, arguments):
+        detail = arguments['FeCAEReq']['FeDetReq']['FECAEDetRequest']
+
+        return {
+            'FECAESolicitarResult': {
+                'FeDetResp': {
+                    'FECAEDetResponse': {
+                        'CbteDesde': str(detail['CbteDesde']),
+                        'Resultado': 'A',
+                        'CAE': '71000000000001',
+                        'CAEFchVto': '20200309',
+                    },
+                },
+            },
+        }
+
+    def _operations(self, name):
+        return [arguments for operation, arguments in self.calls if operation == name]
+
+    def test_should_login_once_for_concurrent_calls(self):
+        # arrange
+        self.responses['loginCms'] = self._login_response()
+
+        # act
+        async def authenticate():
+            return await asyncio.gather(*(self.afip.authenticate() for _ in range(10)))
+
+        tickets = run(authenticate())
+
+        # assert
+        self.assertEqual(len(self._operations('loginCms')), 1)
+        self.assertEqual(set(tickets), {('token', 'sign')})
+        self.assertEqual(self.afip.credentials[self.afip.TOKEN_CACHE_KEY], 'token')
+
+    def test_should_reuse_stored_ticket_when_already_authenticated(self):
+        # arrange
+        store = self.afip.credential_store
+        expiration = (datetime.now(timezone.utc) + timedelta(hours=12)).strftime(
+            self.afip.EXPIRATION_DATE_FORMAT,
+        )
+
+        async def login():
+            # another process logs in between the store read and the request
+            store.set(self.afip.credentials_key, {
+                self.afip.TOKEN_CACHE_KEY: 'stored',
+                self.afip.SIGN_CACHE_KEY: 'sign',
+                self.afip.EXPIRATION_CACHE_KEY: expiration,
+            })
+            raise soap.SoapFault('ns1:coe.alreadyAuthenticated', '')
+
+        self.afip._login = login
+
+        # act
+        token, _ = run(self.afip.authenticate())
+
+        # assert
+        self.assertEqual(token, 'stored')
+
+    def test_should_commit_concurrent_receipts_with_consecutive_numbers(self):
+        # arrange
+        self.responses['loginCms'] = self._login_response()
+        self.responses['FECompUltimoAutorizado'] = {
+            'FECompUltimoAutorizadoResult': {'CbteNro': '4'},
+        }
+        self.responses['FECAESolicitar'] = self._approve
+        receipts = [
+            factories.ReceiptFactory(backend=self.afip, point_of_sale=1) for _ in range(5)
+        ]
+
+        # act
+        async def commit():
+            return await asyncio.gather(*(receipt.commit() for receipt in receipts))
+
+        run(commit())
+
+        # assert
+        self.assertEqual(sorted(receipt.number for receipt in receipts), [5, 6, 7, 8, 9])
+        self.assertEqual(len(self._operations('FECompUltimoAutorizado')), 1)
+        self.assertEqual(receipts[0].cae, '71000000000001')
+        self.assertEqual(receipts[0].cae_expiration, datetime(2020, 3, 9))
+
+    def test_should_share_a_sequencer_between_backends(self):
+        # arrange
+        self.responses['loginCms'] = self._login_response()
+        self.responses['FECompUltimoAutorizado'] = {
+            'FECompUltimoAutorizadoResult': {'CbteNro': '4'},
+        }
+        self.responses['FECAESolicitar'] = self._approve
+        shared_sequencer = sequencer.MemorySequencer()
+        self.afip.sequencer = shared_sequencer
+        other_afip = afip_async.AsyncAFIPBackend(
+            fake.paragraph(),
+            fake.paragraph(),
+            self.afip.cuit,
+            credential_store=credentials.MemoryCredentialStore(),
+            sequencer=shared_sequencer,
+        )
+        other_afip._signer = mock.MagicMock()
+        other_afip._call = self._call
+        receipts = [
+            factories.ReceiptFactory(backend=backend, point_of_sale=1)
+            for backend in (self.afip, other_afip) * 3
+        ]
+
+        # act
+        async def commit():
+            return await asyncio.gather(*(receipt.commit() for receipt in receipts))
+
+        run(commit())
+
+        # assert
+        self.assertEqual(sorted(receipt.number for receipt in receipts), [5, 6, 7, 8, 9, 10])
+
+    def test_should_keep_rejection_errors(self):
+        # arrange
+        self.responses['loginCms'] = self._login_response()
+        self.responses['FECompUltimoAutorizado'] = {
+            'FECompUltimoAutorizadoResult': {'CbteNro': '4'},
+        }
+        self.responses['FECAESolicitar'] = {
+            'FECAESolicitarResult': {
+                'FeDetResp': {
+                    'FECAEDetResponse': {
+                        'Resultado': 'R',
+                        'Observaciones': {'Obs': {'Code': '10015', 'Msg': 'Invalid document'}},
+                    },
+                },
+            },
+        }
+        receipt = factories.ReceiptFactory(backend=self.afip)
+
+        # act
+        run(self.afip.commit(receipt))
+
+        # assert
+        self.assertIsNone(receipt.number)
+        self.assertEqual(receipt.errors, ['10015: Invalid document'])
+
+    def test_should_fetch_last_receipts_from_the_newest(self):
+        # arrange
+        self.responses['loginCms'] = self._login_response()
+        self.responses['FECompUltimoAutorizado'] = {
+            'FECompUltimoAutorizadoResult': {'CbteNro': '7'},
+        }
+        self.responses['FECompConsultar'] = lambda arguments: {
+            'FECompConsultarResult': {
+                'ResultGet': {
+                    'DocNro': '20123456789',
+                    'CbteFch': '20200301',
+                    'CbteTipo': '11',
+                    'Concepto': '2',
+                    'ImpTotal': arguments['FeCompConsReq']['CbteNro'],
+                    'CodAutorizacion': '71000000000001',
+                    'FchVto': '20200311',
+                },
+            },
+        }
+
+        # act
+        receipts = run(self.afip.fetch_last('1:11', 3))
+
+        # assert
+        self.assertEqual([receipt.number for receipt in receipts], [7, 6, 5])
+        self.assertEqual([str(receipt.total) for receipt in receipts], ['7', '6', '5'])
+        self.assertEqual(receipts[0].cae, '71000000000001')
+
+    def test_should_raise_service_errors(self):
+        # arrange
+        self.responses['loginCms'] = self._login_response()
+        self.responses['FECompConsultar'] = {
+            'FECompConsultarResult': {
+                'Errors': {'Err': {'Code': '602', 'Msg': 'No results'}},
+            },
+        }
+
+        # act
+        with self.assertRaises(afip_async.AFIPServiceError) as context:
+            run(self.afip.fetch('1:11:5'))
+
+        # assert
+        self.assertEqual(context.exception.errors, ['602: No results'])
+
+    def test_should_recover_the_cae_of_a_timed_out_request(self):
+        # arrange
+        receipt = factories.ReceiptFactory(backend=self.afip, point_of_sale=1)
+        self.responses['loginCms'] = self._login_response()
+        self.responses['FECompUltimoAutorizado'] = {
+            'FECompUltimoAutorizadoResult': {'CbteNro': '4'},
+        }
+
+        def time_out(arguments):
+            raise asyncio.TimeoutError()
+
+        self.responses['FECAESolicitar'] = time_out
+        self.responses['FECompConsultar'] = {
+            'FECompConsultarResult': {
+                'ResultGet': {
+                    'DocNro': receipt.customer.identity_document,
+                    'CbteFch': '20200301',
+                    'CbteTipo': '11',
+                    'Concepto': '1',
+                    'ImpTotal': str(utils.quantize_decimal(receipt.total)),
+                    'CodAutorizacion': '71000000000001',
+                    'FchVto': '20200311',
+                },
+            },
+        }
+
+        # act
+        run(self.afip.commit(receipt))
+
+        # assert
+        self.assertEqual(len(self._operations('FECAESolicitar')), 1)
+        self.assertEqual(receipt.number, 5)
+        self.assertEqual(receipt.cae, '71000000000001')
+        self.assertEqual(receipt.cae_expiration, datetime(2020, 3, 11))
+
+    def test_should_fail_when_a_timed_out_request_cant_be_checked(self):
+        # arrange
+        receipt = factories.ReceiptFactory(backend=self.afip, point_of_sale=1)
+        self.responses['loginCms'] = self._login_response()
+        self.responses['FECompUltimoAutorizado'] = {
+            'FECompUltimoAutorizadoResult': {'CbteNro': '4'},
+        }
+
+        def time_out(arguments):
+            raise asyncio.TimeoutError()
+
+        self.responses['FECAESolicitar'] = time_out
+        self.responses['FECompConsultar'] = time_out
+
+        # act
+        with self.assertRaises(afip.AmbiguousCommitError):
+            run(self.afip.commit(receipt))
+
+        # assert
+        self.assertEqual(len(self._operations('FECAESolicitar')), 1)
+        self.assertEqual(len(self._operations('FECompConsultar')), 3)
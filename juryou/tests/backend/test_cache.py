@@ -0,0 +1,39 @@
+import os
+import tempfile
+from decimal import Decimal
+from unittest import TestCase
+
+from juryou.backend import cache
+
+KEY = ('20123456789', 1, 11, 5)
+
+
+class SQLiteReceiptCacheTestCase(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'receipts.sqlite')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_should_persist_receipts_between_instances(self):
+        # arrange
+        receipt_cache = cache.SQLiteReceiptCache(self.path)
+        receipt_cache.set(KEY, {'cae': '123', 'imp_total': Decimal('10.50')})
+        receipt_cache.close()
+
+        # act
+        receipt_data = cache.SQLiteReceiptCache(self.path).get(KEY)
+
+        # assert
+        self.assertEqual(receipt_data, {'cae': '123', 'imp_total': '10.50'})
+
+    def test_should_return_none_for_missing_receipts(self):
+        # arrange
+        receipt_cache = cache.SQLiteReceiptCache(self.path)
+
+        # act
+        receipt_data = receipt_cache.get(KEY)
+
+        # assert
+        self.assertIsNone(receipt_data)
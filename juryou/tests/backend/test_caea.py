@@ -0,0 +1,252 @@
+import faker
+import os
+import tempfile
+from datetime import date, datetime
+from unittest import mock, TestCase
+
+from juryou import utils
+from juryou.backend import afip, caea
+from juryou.tests import factories
+
+fake = faker.Faker()
+
+
+class FortnightTestCase(TestCase):
+    def test_should_split_months_in_halves(self):
+        self.assertEqual(caea.fortnight(date(2020, 3, 15)), (202003, 1))
+        self.assertEqual(caea.fortnight(date(2020, 3, 16)), (202003, 2))
+
+    def test_should_move_to_the_next_year(self):
+        self.assertEqual(caea.next_fortnight((202012, 2)), (202101, 1))
+        self.assertEqual(caea.fortnight_start((202101, 1)), date(2021, 1, 1))
+
+
+class CAEABackendTestCase(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'caea.db')
+        self.journal = caea.CAEAJournal(self.path)
+        self.addCleanup(self.journal.close)
+        self.caea = caea.CAEA(
+            fake.numerify(text='##############'),
+            202003,
+            1,
+            datetime(2020, 3, 1),
+            datetime(2020, 3, 15),
+            datetime(2020, 3, 23),
+        )
+        self.afip = caea.CAEABackend(
+            fake.paragraph(),
+            fake.paragraph(),
+            fake.numerify(text='###########'),
+            self.journal,
+            points_of_sale=[1, 2],
+        )
+        self.afip._get_client = mock.MagicMock()
+        self.client = self.afip._get_client.return_value
+        self.client.CompUltimoAutorizado.return_value = 4
+        self.client.Errores = []
+        self.client.EmisionTipo = ''
+
+    def _receipts(self, count, **kwargs):
+        return factories.ReceiptFactory.create_batch(
+            count,
+            backend=self.afip,
+            point_of_sale=1,
+            date=datetime(2020, 3, 9),
+            **kwargs,
+        )
+
+    def test_should_issue_receipts_without_requesting_a_cae(self):
+        # arrange
+        self.journal.add_caea(self.afip.journal_key, self.caea)
+        receipts = self._receipts(2)
+
+        # act
+        self.afip.commit_many(receipts)
+
+        # assert
+        self.client.CAESolicitar.assert_not_called()
+        self.client.CompUltimoAutorizado.assert_called_once()
+        self.assertEqual([receipt.number for receipt in receipts], [5, 6])
+        self.assertEqual({receipt.cae for receipt in receipts}, {self.caea.code})
+        self.assertEqual({receipt.authorization_type for receipt in receipts}, {'A'})
+        self.assertEqual(receipts[0].cae_expiration, self.caea.valid_to)
+
+    def test_should_keep_numbering_after_a_restart(self):
+        # arrange
+        self.journal.add_caea(self.afip.journal_key, self.caea)
+        self.afip.commit(self._receipts(1)[0])
+        self.journal.close()
+        journal = caea.CAEAJournal(self.path)
+        self.addCleanup(journal.close)
+        self.afip.journal = journal
+
+        # act
+        receipt = self.afip.commit(self._receipts(1)[0])
+
+        # assert
+        self.client.CompUltimoAutorizado.assert_called_once()
+        self.assertEqual(receipt.number, 6)
+        self.assertEqual(len(journal.entries(self.afip.journal_key)), 2)
+
+    def test_should_report_the_number_before_recording_the_receipt(self):
+        # arrange
+        self.journal.add_caea(self.afip.journal_key, self.caea)
+        numbers = []
+
+        # act
+        receipt = self.afip.commit(self._receipts(1)[0], numbers.append)
+
+        # assert
+        self.assertEqual(numbers, [5])
+        self.assertEqual(receipt.number, 5)
+
+    def test_should_recover_receipts_from_the_journal(self):
+        # arrange
+        self.journal.add_caea(self.afip.journal_key, self.caea)
+        pending, other = self._receipts(2)
+        self.afip.commit(pending)
+        # as if the process stopped before the outbox knew
+        pending.number = pending.cae = pending.authorization_type = None
+
+        # act
+        recovered = self.afip.recover(pending, 5)
+
+        # assert
+        self.assertTrue(recovered)
+        self.assertEqual(pending.number, 5)
+        self.assertEqual(pending.cae, self.caea.code)
+        self.assertEqual(pending.authorization_type, 'A')
+        self.assertFalse(self.afip.recover(other, 6))
+        self.client.CompConsultar.assert_not_called()
+
+        with self.assertRaises(afip.NumberTakenError):
+            self.afip.recover(other, 5)
+
+    def test_should_request_the_caea_of_a_fortnight_once(self):
+        # arrange
+        self.client.CAEAConsultar.return_value = ''
+        self.client.CAEASolicitar.return_value = self.caea.code
+        self.client.FchVigDesde = '20200301'
+        self.client.FchVigHasta = '20200315'
+        self.client.FchTopeInf = '20200323'
+
+        # act
+        self.afip.commit_many(self._receipts(2))
+
+        # assert
+        self.client.CAEAConsultar.assert_called_once_with(202003, 1)
+        self.client.CAEASolicitar.assert_called_once_with(202003, 1)
+        stored = self.journal.get_caea(self.afip.journal_key, 202003, 1)
+        self.assertEqual(stored.code, self.caea.code)
+        self.assertEqual(stored.report_deadline, datetime(2020, 3, 23))
+
+    def test_should_fail_when_afip_does_not_grant_the_caea(self):
+        # arrange
+        self.client.CAEAConsultar.return_value = ''
+        self.client.CAEASolicitar.return_value = ''
+        self.client.Errores = ['15008: Periodo no habilitado']
+
+        # act & assert
+        with self.assertRaisesRegex(caea.CAEAUnavailableError, '15008'):
+            self.afip.commit(self._receipts(1)[0])
+
+    def test_should_fetch_issued_receipts_from_the_journal(self):
+        # arrange
+        self.journal.add_caea(self.afip.journal_key, self.caea)
+        receipt = self.afip.commit(self._receipts(1)[0])
+
+        # act
+        fetched = self.afip.fetch(f'1:{receipt.type}:{receipt.number}')
+
+        # assert
+        self.client.CompConsultar.assert_not_called()
+        self.assertEqual(fetched.cae, self.caea.code)
+        self.assertEqual(fetched.authorization_type, 'A')
+        self.assertEqual(fetched.total, utils.quantize_decimal(receipt.total))
+
+    def test_should_report_receipts_in_a_single_request(self):
+        # arrange
+        self.journal.add_caea(self.afip.journal_key, self.caea)
+        receipts = self.afip.commit_many(self._receipts(2))
+        self.client.client.FECAEARegInformativo.return_value = {
+            'FECAEARegInformativoResult': {
+                'FeDetResp': [
+                    {'FECAEADetResponse': {'CbteDesde': 5, 'Resultado': 'A'}},
+                    {'FECAEADetResponse': {
+                        'CbteDesde': 6,
+                        'Resultado': 'R',
+                        'Observaciones': [{'Obs': {'Code': 10015, 'Msg': 'Documento invalido'}}],
+                    }},
+                ],
+            },
+        }
+
+        # act
+        with self.assertLogs('juryou.backend.caea', 'ERROR'):
+            self.afip.report(date(2020, 3, 10))
+
+        # assert
+        request = self.client.client.FECAEARegInformativo.call_args[1]['FeCAEARegInfReq']
+        self.assertEqual(request['FeCabReq']['CantReg'], 2)
+        self.assertEqual(
+            [detail['FECAEADetRequest']['CAEA'] for detail in request['FeDetReq']],
+            [self.caea.code] * 2,
+        )
+        self.assertEqual(self.journal.entries(self.afip.journal_key), [])
+        reported = self.journal.get(self.afip.journal_key, 1, receipts[0].type, 5)
+        rejected = self.journal.get(self.afip.journal_key, 1, receipts[1].type, 6)
+        self.assertEqual(reported.status, caea.REPORTED_STATUS)
+        self.assertEqual(rejected.status, caea.REJECTED_STATUS)
+        self.assertEqual(rejected.errors, ['10015: Documento invalido'])
+
+    def test_should_keep_receipts_pending_when_the_report_fails(self):
+        # arrange
+        self.journal.add_caea(self.afip.journal_key, self.caea)
+        self.afip.commit(self._receipts(1)[0])
+        self.client.client.FECAEARegInformativo.side_effect = ConnectionResetError()
+
+        # act
+        with self.assertLogs('juryou.backend.caea', 'WARNING'):
+            self.afip.report(date(2020, 3, 10))
+
+        # assert
+        self.client.CompConsultar.assert_called_once()
+        self.assertEqual(len(self.journal.entries(self.afip.journal_key)), 1)
+
+    def test_should_inform_points_of_sale_without_receipts_once_the_caea_ends(self):
+        # arrange
+        self.journal.add_caea(self.afip.journal_key, self.caea)
+        self.afip.commit(self._receipts(1)[0])
+        self.client.client.FECAEARegInformativo.return_value = {
+            'FECAEARegInformativoResult': {
+                'FeDetResp': [{'FECAEADetResponse': {'CbteDesde': 5, 'Resultado': 'A'}}],
+            },
+        }
+        self.client.CAEASinMovimientoInformar.return_value = 'A'
+
+        # act
+        self.afip.report(date(2020, 3, 16))
+
+        # assert
+        self.client.CAEASinMovimientoInformar.assert_called_once_with(2, self.caea.code)
+        self.assertEqual(self.journal.finished_caeas(self.afip.journal_key, date(2020, 3, 16)), [])
+
+
+class CAEAReporterTestCase(TestCase):
+    def test_should_report_after_a_failed_preparation(self):
+        # arrange
+        backend = mock.MagicMock()
+        backend.prepare.side_effect = caea.CAEAUnavailableError()
+        backend.prepare.__name__ = 'prepare'
+        backend.report.__name__ = 'report'
+        reporter = caea.CAEAReporter(backend)
+
+        # act
+        with self.assertLogs('juryou.backend.caea', 'ERROR'):
+            reporter.run_once()
+
+        # assert
+        backend.report.assert_called_once_with()
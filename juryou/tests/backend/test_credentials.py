@@ -0,0 +1,69 @@
+import json
+import os
+import tempfile
+from unittest import mock, TestCase
+
+from juryou.backend import credentials
+
+KEY = ('20123456789', 'wsfe', False)
+TICKET = {'TOKEN': 'token', 'SIGN': 'sign', 'EXPIRATION': '2020-03-10T03:11:21.597-03:00'}
+
+
+class FileCredentialStoreTestCase(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'credentials.json')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_should_share_tickets_between_instances(self):
+        # arrange
+        with credentials.FileCredentialStore(self.path).lock(KEY):
+            credentials.FileCredentialStore(self.path).set(KEY, TICKET)
+
+        # act
+        ticket = credentials.FileCredentialStore(self.path).get(KEY)
+
+        # assert
+        self.assertEqual(ticket, TICKET)
+
+    def test_should_ignore_single_ticket_files(self):
+        # arrange
+        with open(self.path, 'w') as credentials_file:
+            json.dump(TICKET, credentials_file)
+
+        # act
+        ticket = credentials.FileCredentialStore(self.path).get(KEY)
+
+        # assert
+        self.assertIsNone(ticket)
+
+    def test_should_refuse_to_work_without_fcntl(self):
+        # act & assert
+        with mock.patch.object(credentials, 'fcntl', None), self.assertRaises(NotImplementedError):
+            credentials.FileCredentialStore(self.path)
+
+
+class SQLiteCredentialStoreTestCase(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'credentials.sqlite')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_should_share_tickets_between_instances(self):
+        # arrange
+        store = credentials.SQLiteCredentialStore(self.path)
+
+        with store.lock(KEY):
+            store.set(KEY, TICKET)
+
+        store.close()
+
+        # act
+        ticket = credentials.SQLiteCredentialStore(self.path).get(KEY)
+
+        # assert
+        self.assertEqual(ticket, TICKET)
@@ -0,0 +1,239 @@
+import faker
+import os
+import tempfile
+import threading
+from datetime import datetime
+from unittest import mock, TestCase
+
+from juryou import utils
+from juryou.backend import afip, outbox, resilience
+from juryou.tests import factories
+
+fake = faker.Faker()
+
+TIMEOUT = 5
+
+
+class OutboxTestCase(TestCase):
+    def setUp(self):
+        certificate = fake.paragraph()
+        private_key = fake.paragraph()
+        cuit = fake.numerify(text='###########')
+        self.afip = afip.AFIPBackend(
+            certificate,
+            private_key,
+            cuit,
+            retry_policy=resilience.RetryPolicy(attempts=1),
+        )
+        self.afip._get_client = mock.MagicMock()
+        self.client = self.afip._get_client.return_value
+        self.client.CompUltimoAutorizado.return_value = 4
+        self.client.Errores = []
+        self.client.CAE = '71000000000001'
+        self.client.Vencimiento = '20200309'
+        self.store = outbox.MemoryOutboxStore()
+        self.receipt = factories.ReceiptFactory(backend=self.afip, date=datetime(2020, 3, 1))
+        self.futures = []
+        self.done = threading.Event()
+
+    def _outbox(self, **kwargs):
+        pending_outbox = outbox.Outbox(self.afip, self.store, workers=2, **kwargs)
+        self.addCleanup(pending_outbox.close)
+
+        return pending_outbox
+
+    def _collect(self, future):
+        self.futures.append(future)
+        self.done.set()
+
+    def _numbered_entry(self, number):
+        entry = self.store.add(outbox.dump_receipt(self.receipt))
+        entry.state = outbox.NUMBERED_STATE
+        entry.number = number
+        self.store.update(entry)
+
+        return entry
+
+    def _found(self, invoice_type, point_of_sale, invoice_number):
+        self.client.Errores = []
+        self.client.factura = {
+            'nro_doc': self.receipt.customer.identity_document,
+            'fecha_cbte': '20200301',
+            'tipo_cbte': invoice_type,
+            'concepto': self.receipt.concept,
+            'imp_total': str(utils.quantize_decimal(self.receipt.total)),
+            'cae': '71000000000002',
+            'fch_venc_cae': '20200309',
+        }
+
+    def test_should_commit_enqueued_receipts_in_the_background(self):
+        # arrange
+        pending_outbox = self._outbox().start()
+
+        # act
+        future = pending_outbox.enqueue(self.receipt)
+        committed = future.result(TIMEOUT)
+
+        # assert
+        self.assertIs(committed, self.receipt)
+        self.assertEqual(committed.number, 5)
+        self.assertEqual(committed.cae, '71000000000001')
+        entry = self.store.get(future.entry_id)
+        self.assertEqual(entry.state, outbox.AUTHORIZED_STATE)
+        self.assertEqual(entry.number, 5)
+        self.assertEqual(entry.receipt['cae'], '71000000000001')
+
+    def test_should_record_the_number_before_requesting_the_cae(self):
+        # arrange
+        states = []
+        self.client.CAESolicitar.side_effect = lambda: states.extend(
+            (entry.state, entry.number) for entry in self.store.unfinished()
+        )
+        pending_outbox = self._outbox().start()
+
+        # act
+        pending_outbox.enqueue(self.receipt).result(TIMEOUT)
+
+        # assert
+        self.assertEqual(states, [(outbox.NUMBERED_STATE, 5)])
+
+    def test_should_keep_rejected_receipts_with_their_errors(self):
+        # arrange
+        self.client.Resultado = 'R'
+        self.client.Errores = ['10015: Documento invalido']
+        self.client.Observaciones = []
+        pending_outbox = self._outbox().start()
+
+        # act
+        future = pending_outbox.enqueue(self.receipt)
+
+        # assert
+        self.assertEqual(future.result(TIMEOUT).errors, ['10015: Documento invalido'])
+        entry = self.store.get(future.entry_id)
+        self.assertEqual(entry.state, outbox.REJECTED_STATE)
+        self.assertEqual(entry.receipt['errors'], ['10015: Documento invalido'])
+
+    def test_should_retry_while_afip_is_unreachable(self):
+        # arrange
+        self.client.CompUltimoAutorizado.side_effect = [ConnectionRefusedError()] * 3 + [4]
+        pending_outbox = self._outbox(retry_delay=0)
+
+        # act
+        with self.assertLogs('juryou.backend.outbox', 'ERROR'):
+            future = pending_outbox.start().enqueue(self.receipt)
+            committed = future.result(TIMEOUT)
+
+        # assert
+        self.assertEqual(committed.number, 5)
+
+    def test_should_recover_the_cae_of_a_numbered_entry_on_start(self):
+        # arrange
+        entry = self._numbered_entry(5)
+        self.client.CompConsultar.side_effect = self._found
+
+        # act
+        self._outbox(callback=self._collect).start()
+        self.done.wait(TIMEOUT)
+
+        # assert
+        self.client.CAESolicitar.assert_not_called()
+        self.assertEqual(self.futures[0].entry_id, entry.id)
+        self.assertEqual(self.futures[0].result().cae, '71000000000002')
+        self.assertEqual(self.futures[0].result().number, 5)
+        self.assertEqual(self.store.get(entry.id).state, outbox.AUTHORIZED_STATE)
+
+    def test_should_commit_again_a_numbered_entry_not_authorized(self):
+        # arrange
+        entry = self._numbered_entry(5)
+        self.client.CompConsultar.side_effect = lambda *args: setattr(
+            self.client,
+            'Errores',
+            ['602: Sin resultados'],
+        )
+
+        # act
+        self._outbox(callback=self._collect).start()
+        self.done.wait(TIMEOUT)
+
+        # assert
+        self.client.CAESolicitar.assert_called_once()
+        self.assertEqual(self.store.get(entry.id).state, outbox.AUTHORIZED_STATE)
+        self.assertEqual(self.store.get(entry.id).receipt['cae'], '71000000000001')
+
+    def test_should_keep_a_numbered_entry_while_afip_can_not_tell(self):
+        # arrange
+        entry = self._numbered_entry(5)
+        lookups = iter([
+            lambda *args: setattr(self.client, 'Errores', ['600: ValidacionDeToken']),
+            self._found,
+        ])
+        self.client.CompConsultar.side_effect = lambda *args: next(lookups)(*args)
+
+        # act
+        with self.assertLogs('juryou.backend.outbox', 'ERROR'):
+            self._outbox(retry_delay=0, callback=self._collect).start()
+            self.done.wait(TIMEOUT)
+
+        # assert
+        self.client.CAESolicitar.assert_not_called()
+        self.assertEqual(self.client.CompConsultar.call_count, 2)
+        self.assertEqual(self.futures[0].result().number, 5)
+        self.assertEqual(self.store.get(entry.id).number, 5)
+
+    def test_should_drop_receipts_cancelled_before_their_request(self):
+        # arrange
+        pending_outbox = self._outbox()
+        future = pending_outbox.enqueue(self.receipt)
+
+        # act
+        cancelled = future.cancel()
+        pending_outbox.start().close(TIMEOUT)
+
+        # assert
+        self.assertTrue(cancelled)
+        self.assertIsNone(self.store.get(future.entry_id))
+        self.client.CAESolicitar.assert_not_called()
+
+    def test_should_validate_receipts_when_enqueued(self):
+        # arrange
+        self.receipt.customer.name = ''
+
+        # act & assert
+        with self.assertRaises(afip.MissingCustomerDataError):
+            self._outbox().enqueue(self.receipt)
+
+        self.assertEqual(self.store.unfinished(), [])
+
+
+class SQLiteOutboxStoreTestCase(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'outbox.db')
+
+    def test_should_keep_unfinished_entries_across_restarts(self):
+        # arrange
+        receipt = factories.ReceiptFactory(backend=None, date=datetime(2020, 3, 1))
+        store = outbox.SQLiteOutboxStore(self.path)
+        numbered = store.add(outbox.dump_receipt(receipt))
+        finished = store.add(outbox.dump_receipt(receipt))
+        numbered.state, numbered.number = outbox.NUMBERED_STATE, 7
+        finished.state = outbox.AUTHORIZED_STATE
+        store.update(numbered)
+        store.update(finished)
+        store.close()
+
+        # act
+        store = outbox.SQLiteOutboxStore(self.path)
+        self.addCleanup(store.close)
+        entries = store.unfinished()
+
+        # assert
+        self.assertEqual(
+            [(entry.id, entry.state, entry.number) for entry in entries],
+            [(numbered.id, outbox.NUMBERED_STATE, 7)],
+        )
+        loaded = outbox.load_receipt(entries[0].receipt, None)
+        self.assertEqual(loaded.total, receipt.total)
+        self.assertEqual(loaded.date, receipt.date)
+        self.assertEqual(loaded.customer.identity_document, receipt.customer.identity_document)
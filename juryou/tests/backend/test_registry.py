@@ -0,0 +1,142 @@
+import faker
+import threading
+import time
+from unittest import mock, TestCase
+
+from juryou.backend import registry
+from juryou.tests.backend.test_resilience import FakeClock
+
+fake = faker.Faker()
+
+
+class BackendRegistryTestCase(TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.loader = mock.MagicMock(return_value=(fake.paragraph(), fake.paragraph()))
+        self.backend_class = mock.MagicMock(side_effect=lambda *args, **kwargs: mock.MagicMock())
+        self.registry = registry.BackendRegistry(
+            self.loader,
+            max_size=2,
+            ttl=60,
+            backends={'wsfe': self.backend_class},
+            clock=self.clock,
+        )
+
+    def test_should_reuse_the_backend_of_a_company(self):
+        # arrange
+        cuit = fake.numerify(text='###########')
+
+        # act
+        backends = [self.registry.get(cuit) for _ in range(3)]
+
+        # assert
+        self.assertEqual({id(backend) for backend in backends}, {id(backends[0])})
+        self.loader.assert_called_once_with(cuit, False)
+        self.backend_class.assert_called_once_with(
+            *self.loader.return_value,
+            cuit,
+            production=False,
+            cache=self.registry.options['cache'],
+        )
+
+    def test_should_keep_a_backend_for_each_environment(self):
+        # arrange
+        cuit = fake.numerify(text='###########')
+
+        # act
+        testing_backend = self.registry.get(cuit)
+        production_backend = self.registry.get(cuit, production=True)
+
+        # assert
+        self.assertIsNot(testing_backend, production_backend)
+        self.assertEqual(
+            self.loader.call_args_list,
+            [mock.call(cuit, False), mock.call(cuit, True)],
+        )
+
+    def test_should_drop_the_least_recently_used_backend(self):
+        # arrange
+        first = self.registry.get('20111111112')
+        second = self.registry.get('20222222223')
+        self.registry.get('20111111112')
+
+        # act
+        self.registry.get('20333333334')
+
+        # assert
+        self.assertEqual(len(self.registry), 2)
+        self.assertNotIn(('20222222223', False, 'wsfe'), self.registry)
+        self.assertIs(self.registry.get('20111111112'), first)
+        # another thread may still be using it
+        second.close.assert_not_called()
+
+    def test_should_drop_backends_left_unused_for_the_ttl(self):
+        # arrange
+        backend = self.registry.get('20111111112')
+        self.clock.now += 60
+
+        # act
+        new_backend = self.registry.get('20111111112')
+
+        # assert
+        self.assertIsNot(new_backend, backend)
+        backend.close.assert_not_called()
+        self.assertEqual(self.loader.call_count, 2)
+
+    def test_should_drop_expired_backends_while_others_are_used(self):
+        # arrange
+        self.registry.get('20111111112')
+        self.registry.get('20222222223')
+        self.clock.now += 30
+        self.registry.get('20222222223')
+        self.clock.now += 30
+
+        # act
+        self.registry.get('20222222223')
+
+        # assert
+        self.assertNotIn(('20111111112', False, 'wsfe'), self.registry)
+        self.assertEqual(len(self.registry), 1)
+
+    def test_should_refuse_unknown_services(self):
+        # act
+        with self.assertRaises(registry.UnknownServiceError):
+            self.registry.get('20111111112', service='wsmtxca')
+
+    def test_should_load_a_company_once_for_concurrent_calls(self):
+        # arrange
+        def load(cuit, production):
+            time.sleep(0.05)
+
+            return 'certificate', 'private key'
+
+        self.loader.side_effect = load
+        backends = []
+        threads = [
+            threading.Thread(target=lambda: backends.append(self.registry.get('20111111112')))
+            for _ in range(5)
+        ]
+
+        # act
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        # assert
+        self.loader.assert_called_once()
+        self.assertEqual({id(backend) for backend in backends}, {id(backends[0])})
+
+    def test_should_close_every_backend_when_cleared(self):
+        # arrange
+        backends = [self.registry.get('20111111112'), self.registry.get('20222222223')]
+
+        # act
+        self.registry.clear()
+
+        # assert
+        self.assertEqual(len(self.registry), 0)
+
+        for backend in backends:
+            backend.close.assert_called_once()
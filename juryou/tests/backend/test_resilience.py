@@ -0,0 +1,120 @@
+import socket
+from unittest import mock, TestCase
+
+from juryou.backend import resilience
+
+
+def is_transient(error):
+    return isinstance(error, OSError)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class RetryTestCase(TestCase):
+    def setUp(self):
+        self.policy = resilience.RetryPolicy(attempts=3, base_delay=0)
+
+    def test_should_retry_transient_errors(self):
+        # arrange
+        function = mock.MagicMock(side_effect=[socket.timeout(), ConnectionResetError(), 'done'])
+
+        # act
+        result = resilience.call(function, self.policy, None, is_transient)
+
+        # assert
+        self.assertEqual(result, 'done')
+        self.assertEqual(function.call_count, 3)
+
+    def test_should_not_retry_other_errors(self):
+        # arrange
+        function = mock.MagicMock(side_effect=ValueError())
+
+        # act
+        with self.assertRaises(ValueError):
+            resilience.call(function, self.policy, None, is_transient)
+
+        # assert
+        function.assert_called_once()
+
+    def test_should_give_up_after_the_last_attempt(self):
+        # arrange
+        function = mock.MagicMock(side_effect=socket.timeout())
+
+        # act
+        with self.assertRaises(socket.timeout):
+            resilience.call(function, self.policy, None, is_transient)
+
+        # assert
+        self.assertEqual(function.call_count, 3)
+
+    def test_should_cap_delays(self):
+        # arrange
+        policy = resilience.RetryPolicy(base_delay=1, max_delay=4)
+
+        # act
+        delays = [policy.delay(attempt) for attempt in range(1, 10) for _ in range(20)]
+
+        # assert
+        self.assertTrue(all(0 <= delay <= 4 for delay in delays))
+
+
+class CircuitBreakerTestCase(TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.breaker = resilience.CircuitBreaker(threshold=2, reset_timeout=10, clock=self.clock)
+        self.failing = mock.MagicMock(side_effect=socket.timeout())
+
+    def _fail(self):
+        with self.assertRaises(socket.timeout):
+            resilience.guard(self.failing, self.breaker, is_transient)
+
+    def test_should_open_after_consecutive_failures(self):
+        # act
+        self._fail()
+        self._fail()
+
+        # assert
+        self.assertEqual(self.breaker.state, self.breaker.OPEN)
+
+        with self.assertRaises(resilience.CircuitOpenError):
+            resilience.guard(self.failing, self.breaker, is_transient)
+
+        self.assertEqual(self.failing.call_count, 2)
+
+    def test_should_not_count_answered_calls_as_failures(self):
+        # arrange
+        rejected = mock.MagicMock(side_effect=ValueError())
+
+        # act
+        self._fail()
+
+        with self.assertRaises(ValueError):
+            resilience.guard(rejected, self.breaker, is_transient)
+
+        self._fail()
+
+        # assert
+        self.assertEqual(self.breaker.state, self.breaker.CLOSED)
+
+    def test_should_let_a_single_trial_call_through_after_the_timeout(self):
+        # arrange
+        self._fail()
+        self._fail()
+        self.clock.now = 10
+
+        # act
+        self.assertEqual(self.breaker.state, self.breaker.HALF_OPEN)
+        self._fail()
+
+        # assert
+        self.assertEqual(self.breaker.state, self.breaker.OPEN)
+
+        self.clock.now = 20
+        resilience.guard(lambda: 'done', self.breaker, is_transient)
+        self.assertEqual(self.breaker.state, self.breaker.CLOSED)
@@ -0,0 +1,95 @@
+import tempfile
+import threading
+from unittest import mock, TestCase
+
+from juryou.backend import sequencer
+
+KEY = ('20123456789', 1, 11)
+
+
+class MemorySequencerTestCase(TestCase):
+    def setUp(self):
+        self.sequencer = sequencer.MemorySequencer()
+
+    def test_should_seed_only_once(self):
+        # arrange
+        seed = mock.MagicMock(return_value=10)
+
+        # act
+        with self.sequencer.reserve(KEY, seed) as sequence:
+            first_number = sequence.next
+            sequence.advance()
+
+        with self.sequencer.reserve(KEY, seed) as sequence:
+            second_number = sequence.next
+
+        # assert
+        seed.assert_called_once()
+        self.assertEqual((first_number, second_number), (11, 12))
+
+    def test_should_forget_sequence_on_error(self):
+        # arrange
+        seed = mock.MagicMock(return_value=10)
+
+        # act
+        with self.assertRaises(RuntimeError):
+            with self.sequencer.reserve(KEY, seed) as sequence:
+                sequence.advance()
+                raise RuntimeError()
+
+        with self.sequencer.reserve(KEY, seed) as sequence:
+            number = sequence.next
+
+        # assert
+        self.assertEqual(seed.call_count, 2)
+        self.assertEqual(number, 11)
+
+    def test_should_hand_out_unique_numbers_across_threads(self):
+        # arrange
+        numbers = []
+
+        def take_numbers():
+            for _ in range(50):
+                with self.sequencer.reserve(KEY, lambda: 0) as sequence:
+                    numbers.append(sequence.next)
+                    sequence.advance()
+
+        threads = [threading.Thread(target=take_numbers) for _ in range(4)]
+
+        # act
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        # assert
+        self.assertEqual(sorted(numbers), list(range(1, 201)))
+
+
+class FileSequencerTestCase(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_should_share_sequence_between_instances(self):
+        # arrange
+        seed = mock.MagicMock(return_value=10)
+
+        # act
+        with sequencer.FileSequencer(self.directory.name).reserve(KEY, seed) as sequence:
+            sequence.advance(3)
+
+        with sequencer.FileSequencer(self.directory.name).reserve(KEY, seed) as sequence:
+            number = sequence.next
+
+        # assert
+        seed.assert_called_once()
+        self.assertEqual(number, 14)
+
+    def test_should_refuse_to_work_without_fcntl(self):
+        # act & assert
+        with mock.patch.object(sequencer, 'fcntl', None), self.assertRaises(NotImplementedError):
+            sequencer.FileSequencer(self.directory.name)
@@ -0,0 +1,47 @@
+from base64 import b64decode
+from datetime import datetime, timedelta
+from unittest import TestCase
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+
+from juryou.backend import signer
+
+
+class TRASignerTestCase(TestCase):
+    def setUp(self):
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'juryou')])
+        certificate = x509.CertificateBuilder().subject_name(
+            name,
+        ).issuer_name(
+            name,
+        ).public_key(
+            private_key.public_key(),
+        ).serial_number(
+            x509.random_serial_number(),
+        ).not_valid_before(
+            datetime.utcnow(),
+        ).not_valid_after(
+            datetime.utcnow() + timedelta(days=1),
+        ).sign(private_key, hashes.SHA256())
+
+        self.certificate = certificate.public_bytes(serialization.Encoding.PEM).decode('latin1')
+        self.private_key = private_key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.TraditionalOpenSSL,
+            serialization.NoEncryption(),
+        ).decode('latin1')
+
+    def test_should_embed_the_tra_in_the_signed_cms(self):
+        # arrange
+        tra = '<loginTicketRequest version="1.0"><service>wsfe</service></loginTicketRequest>'
+        tra_signer = signer.TRASigner(self.certificate, self.private_key)
+
+        # act
+        cms = tra_signer.sign(tra)
+
+        # assert
+        self.assertIn(tra.encode('utf-8'), b64decode(cms))
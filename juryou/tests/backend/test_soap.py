@@ -0,0 +1,58 @@
+from unittest import TestCase
+
+from juryou.backend import soap
+
+FAULT = b'''<?xml version="1.0" encoding="utf-8"?>
+<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/">
+  <soapenv:Body>
+    <soapenv:Fault>
+      <faultcode>ns1:coe.alreadyAuthenticated</faultcode>
+      <faultstring>El CEE ya posee un TA valido para el acceso al WSN solicitado</faultstring>
+    </soapenv:Fault>
+  </soapenv:Body>
+</soapenv:Envelope>'''
+
+
+class SoapTestCase(TestCase):
+    def test_should_parse_built_envelopes(self):
+        # arrange
+        arguments = {
+            'Auth': {'Token': 'token', 'Sign': 'sign', 'Cuit': 20123456789},
+            'Items': {'Item': [1, 2]},
+            'Missing': None,
+        }
+
+        # act
+        envelope = soap.build_envelope(soap.WSFEV1_NAMESPACE, 'Operation', arguments)
+
+        # assert
+        self.assertEqual(soap.parse_envelope(envelope), {
+            'Operation': {
+                'Auth': {'Token': 'token', 'Sign': 'sign', 'Cuit': '20123456789'},
+                'Items': {'Item': ['1', '2']},
+            },
+        })
+
+    def test_should_raise_faults(self):
+        # act
+        with self.assertRaises(soap.SoapFault) as context:
+            soap.parse_envelope(FAULT)
+
+        # assert
+        self.assertEqual(context.exception.code, 'ns1:coe.alreadyAuthenticated')
+
+    def test_should_parse_built_faults(self):
+        # act
+        with self.assertRaises(soap.SoapFault) as context:
+            soap.parse_envelope(soap.build_fault('soap:Server', 'Servicio no disponible'))
+
+        # assert
+        self.assertEqual(context.exception.code, 'soap:Server')
+        self.assertEqual(context.exception.message, 'Servicio no disponible')
+
+    def test_should_wrap_single_values_as_lists(self):
+        # assert
+        self.assertEqual(soap.as_list(None), [])
+        self.assertEqual(soap.as_list(''), [])
+        self.assertEqual(soap.as_list({'Code': '1'}), [{'Code': '1'}])
+        self.assertEqual(soap.as_list(['1', '2']), ['1', '2'])
@@ -0,0 +1,100 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+from unittest import mock, TestCase
+
+from juryou.backend import wsdl
+
+URL = 'https://wswhomo.afip.gov.ar/wsfev1/service.asmx?WSDL'
+
+
+class WSDLCacheTestCase(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = wsdl.WSDLCache(self.directory.name)
+        self.client = mock.MagicMock()
+        self.client.Conectar.side_effect = self._conectar
+        self.found = []
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _conectar(self, wsdl, cache):
+        self.found.append(os.path.exists(self._path('.pkl')))
+
+        with open(self._path('.pkl'), 'wb') as pickled:
+            pickled.write(b'parsed')
+
+    def _path(self, extension, url=URL):
+        filename = hashlib.md5(url.encode('utf8')).hexdigest() + extension
+
+        return os.path.join(self.directory.name, filename)
+
+    def _age(self, path, seconds):
+        modified = time.time() - seconds
+        os.utime(path, (modified, modified))
+
+    def test_should_connect_through_the_cache_directory(self):
+        # act
+        self.cache.connect(self.client, URL)
+
+        # assert
+        self.client.Conectar.assert_called_once_with(wsdl=URL, cache=self.directory.name)
+        version_path = os.path.join(self.directory.name, wsdl.VERSION_FILENAME)
+
+        with open(version_path, 'r') as version_file:
+            self.assertEqual(json.load(version_file), self.cache._version())
+
+    def test_should_keep_fresh_descriptions(self):
+        # arrange
+        self.cache.connect(self.client, URL)
+
+        # act
+        self.cache.connect(self.client, URL)
+
+        # assert
+        self.assertEqual(self.found, [False, True])
+
+    def test_should_remove_expired_descriptions(self):
+        # arrange
+        self.cache.connect(self.client, URL)
+        schema = self._path('.xml', 'https://example.com/schema.xsd')
+
+        with open(schema, 'w') as schema_file:
+            schema_file.write('<schema/>')
+
+        self._age(self._path('.pkl'), self.cache.ttl.total_seconds() + 1)
+        self._age(schema, self.cache.ttl.total_seconds() + 1)
+
+        # act
+        self.cache.connect(self.client, URL)
+
+        # assert
+        self.assertEqual(self.found, [False, False])
+        self.assertFalse(os.path.exists(schema))
+
+    def test_should_clear_descriptions_from_other_versions(self):
+        # arrange
+        with open(self._path('.pkl'), 'wb') as pickled:
+            pickled.write(b'parsed')
+
+        with open(os.path.join(self.directory.name, wsdl.VERSION_FILENAME), 'w') as version_file:
+            json.dump({'pysimplesoap': '0.1', 'python': '3.7'}, version_file)
+
+        # act
+        self.cache.connect(self.client, URL)
+
+        # assert
+        self.assertEqual(self.found, [False])
+
+    def test_should_download_again_when_refreshing(self):
+        # arrange
+        self.cache.connect(self.client, URL)
+
+        # act
+        self.cache.connect(self.client, URL, refresh=True)
+
+        # assert
+        self.assertEqual(self.found, [False, False])
@@ -0,0 +1,202 @@
+import io
+import json
+import os
+import tempfile
+from datetime import datetime
+from unittest import mock, TestCase
+
+from juryou.backend import afip, credentials, resilience, wsdl
+from juryou.cli import batch
+from juryou.fake_afip import FakeAFIP
+from juryou.tests import factories
+from juryou.tests.test_fake_afip import create_credentials
+
+CSV_INPUT = '''reference,point_of_sale,identity_document,name,item_name,item_amount,item_price
+a,1,35525905,Agustin Carrasco,Item,3,150.5
+a,1,35525905,Agustin Carrasco,Other,1,10
+b,1,20123456,Juan Perez,Item,1,99.99
+'''
+
+
+class BatchTestCase(TestCase):
+    def setUp(self):
+        self.backend = afip.AFIPBackend('', '', '')
+        self.company = factories.CompanyFactory()
+        self.numbers = iter(range(1, 100))
+        self.manifest = io.StringIO()
+
+    def _approve(self, receipts, on_number=None):
+        for receipt in receipts:
+            if receipt.customer.name == 'Rejected':
+                receipt.errors = ['10015: Invalid document']
+            else:
+                receipt.number = next(self.numbers)
+                receipt.cae = '71000000000001'
+                receipt.cae_expiration = datetime(2020, 3, 19)
+
+        return receipts
+
+    def _entries(self):
+        return [json.loads(line) for line in self.manifest.getvalue().splitlines()]
+
+    def _record(self, reference, name='Name'):
+        return reference, {
+            'point_of_sale': 1,
+            'customer': {'identity_document': '35525905', 'name': name},
+            'items': [{'name': 'Item', 'amount': 1, 'price': '10'}],
+        }
+
+    def test_should_group_csv_rows_by_reference(self):
+        # act
+        records = list(batch.read_csv(io.StringIO(CSV_INPUT)))
+
+        # assert
+        self.assertEqual([reference for reference, _ in records], ['a', 'b'])
+        self.assertEqual(len(records[0][1]['items']), 2)
+        self.assertEqual(records[1][1]['customer']['name'], 'Juan Perez')
+
+    def test_should_write_an_entry_for_every_receipt(self):
+        # arrange
+        records = [
+            self._record('1'),
+            self._record('2', 'Rejected'),
+            ('3', {'point_of_sale': 1, 'items': []}),
+        ]
+
+        # act
+        with mock.patch.object(self.backend, 'commit_many', side_effect=self._approve):
+            failures = batch.run_batch(
+                self.backend,
+                records,
+                self.manifest,
+                self.company,
+                chunk_size=2,
+            )
+
+        # assert
+        entries = {entry['reference']: entry for entry in self._entries()}
+        self.assertEqual(failures, 2)
+        self.assertEqual(entries['1']['identifier'], '1:11:1')
+        self.assertEqual(entries['1']['cae'], '71000000000001')
+        self.assertEqual(entries['1']['cae_expiration'], '2020-03-19')
+        self.assertEqual(entries['2']['error'], '10015: Invalid document')
+        self.assertTrue(entries['3']['error'].startswith('Invalid receipt data'))
+
+    def test_should_skip_completed_receipts_when_resuming(self):
+        # arrange
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'manifest.jsonl')
+
+            with open(path, 'w') as manifest:
+                manifest.write(json.dumps({'reference': '1', 'cae': '71000000000001'}) + '\n')
+                manifest.write(json.dumps({'reference': '2', 'cae': None}) + '\n')
+                manifest.write('{"reference": "3", "ca')
+
+            # act
+            completed, numbered = batch.load_manifest(path)
+
+            with batch.open_manifest(path) as manifest, \
+                    mock.patch.object(self.backend, 'commit_many', side_effect=self._approve):
+                batch.run_batch(
+                    self.backend,
+                    [self._record('1'), self._record('2'), self._record('3')],
+                    manifest,
+                    self.company,
+                    completed,
+                )
+
+            with open(path, 'r') as manifest:
+                lines = manifest.read().splitlines()
+
+        # assert
+        self.assertEqual(completed, {'1'})
+        self.assertEqual(numbered, {})
+        self.assertEqual(
+            [json.loads(line)['reference'] for line in lines[3:]],
+            ['2', '3'],
+        )
+
+
+class BatchResumeTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.certificate, cls.private_key = create_credentials()
+
+    def setUp(self):
+        self.server = FakeAFIP(seed=0)
+        self.server.start()
+        self.addCleanup(self.server.stop)
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, 'manifest.jsonl')
+        patcher = mock.patch('httplib2.CA_CERTS', self.server.certificate_path)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.company = factories.CompanyFactory()
+        self.records = [
+            (str(reference), {
+                'point_of_sale': 1,
+                'customer': {'identity_document': '35525905', 'name': 'Name'},
+                'items': [{'name': 'Item', 'amount': 1, 'price': str(reference)}],
+            })
+            for reference in range(1, 5)
+        ]
+
+    def _backend(self):
+        backend = afip.AFIPBackend(
+            self.certificate,
+            self.private_key,
+            '20111111112',
+            cache=wsdl.WSDLCache(os.path.join(self.directory.name, 'wsdl')),
+            credential_store=credentials.MemoryCredentialStore(),
+            retry_policy=resilience.RetryPolicy(attempts=2, base_delay=0),
+        )
+        self.addCleanup(backend.close)
+        backend.wsaa_url = self.server.wsaa_wsdl_url
+        backend.wsfev1_url = self.server.wsfev1_wsdl_url
+
+        return backend
+
+    def _run(self, backend):
+        completed, numbered = batch.load_manifest(self.path)
+
+        with batch.open_manifest(self.path) as manifest:
+            return batch.run_batch(
+                backend,
+                self.records,
+                manifest,
+                self.company,
+                completed,
+                chunk_size=2,
+                workers=1,
+                numbered=numbered,
+            )
+
+    def test_should_not_authorize_a_receipt_twice_when_resuming(self):
+        # arrange
+        backend = self._backend()
+        create_invoice = backend._create_invoice
+
+        def drop_responses(*args):
+            # AFIP processes the request, but the answer never comes back
+            self.server.drop_rate = 1
+            return create_invoice(*args)
+
+        backend._create_invoice = drop_responses
+        interrupted_failures = self._run(backend)
+        self.server.drop_rate = 0
+
+        # act
+        failures = self._run(self._backend())
+
+        # assert
+        completed, numbered = batch.load_manifest(self.path)
+        self.assertEqual(interrupted_failures, 4)
+        self.assertEqual(failures, 0)
+        self.assertEqual(completed, {'1', '2', '3', '4'})
+        self.assertEqual(numbered, {})
+        self.assertEqual(len(self.server.receipts), 4)
+        self.assertEqual(
+            sorted(receipt['ImpTotal'] for receipt in self.server.receipts.values()),
+            ['1.00', '2.00', '3.00', '4.00'],
+        )
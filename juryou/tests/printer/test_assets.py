@@ -0,0 +1,59 @@
+import os
+import pathlib
+import tempfile
+from unittest import mock, TestCase
+
+from juryou.printer import assets, printer
+
+FONT_URL = printer.Printer.BASE_URL + 'fonts/Roboto-Regular.ttf'
+REMOTE_URL = 'http://example.com/logo.png'
+
+
+@mock.patch('juryou.printer.assets.weasyprint')
+class AssetFetcherTestCase(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def test_should_read_shipped_fonts_once(self, weasyprint):
+        # arrange
+        fetcher = assets.AssetFetcher()
+        font_path = pathlib.Path(printer.__file__).parent / 'fonts' / 'Roboto-Regular.ttf'
+
+        # act
+        with mock.patch('builtins.open', mock.mock_open(read_data=b'font')) as open_mock:
+            first = fetcher(FONT_URL)
+            second = fetcher(FONT_URL)
+
+        # assert
+        open_mock.assert_called_once_with(str(font_path), 'rb')
+        self.assertEqual(first['string'], b'font')
+        self.assertEqual(second, first)
+        weasyprint.default_url_fetcher.assert_not_called()
+
+    def test_should_refuse_remote_assets_by_default(self, weasyprint):
+        # arrange
+        fetcher = assets.AssetFetcher(self.directory.name)
+
+        # act
+        with self.assertRaises(assets.RemoteAssetError):
+            fetcher(REMOTE_URL)
+
+        # assert
+        weasyprint.default_url_fetcher.assert_not_called()
+
+    def test_should_keep_remote_assets_on_disk(self, weasyprint):
+        # arrange
+        weasyprint.default_url_fetcher.return_value = {
+            'string': b'image',
+            'mime_type': 'image/png',
+        }
+        assets.AssetFetcher(self.directory.name, allow_remote=True)(REMOTE_URL)
+
+        # act
+        asset = assets.AssetFetcher(self.directory.name)(REMOTE_URL)
+
+        # assert
+        weasyprint.default_url_fetcher.assert_called_once()
+        self.assertEqual(asset['string'], b'image')
+        self.assertEqual(len(os.listdir(self.directory.name)), 1)
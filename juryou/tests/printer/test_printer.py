@@ -0,0 +1,181 @@
+import faker
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from unittest import mock, TestCase
+
+from juryou import printer
+from juryou.backend import afip
+from juryou.tests import factories, test_metrics
+
+fake = faker.Faker()
+
+
+@mock.patch('juryou.printer.printer.weasyprint')
+class PrinterTestCase(TestCase):
+    def test_should_share_the_printer_between_receipts(self, weasyprint):
+        # act
+        receipts = factories.ReceiptFactory.build_batch(3, backend=mock.MagicMock())
+
+        # assert
+        self.assertIs(receipts[0].printer, printer.get_printer())
+        self.assertEqual({id(receipt.printer) for receipt in receipts}, {id(receipts[0].printer)})
+
+    def test_should_reuse_the_template_and_font_configuration(self, weasyprint):
+        # arrange
+        receipt_printer = printer.Printer()
+        receipt_printer.env.get_template = mock.MagicMock()
+        receipts = factories.ReceiptFactory.build_batch(3, backend=afip.AFIPBackend('', '', ''))
+
+        for receipt in receipts:
+            receipt.number = 1
+            receipt.cae = fake.numerify(text='##############')
+            receipt.cae_expiration = datetime.now()
+
+        # act
+        for receipt in receipts:
+            receipt_printer.print(receipt)
+
+        # assert
+        receipt_printer.env.get_template.assert_not_called()
+        weasyprint.fonts.FontConfiguration.assert_called_once()
+        render = weasyprint.HTML.return_value.render
+        self.assertEqual(
+            {call[1]['font_config'] for call in render.call_args_list},
+            {receipt_printer.font_config},
+        )
+
+    def test_should_render_company_fragments_once_per_company(self, weasyprint):
+        # arrange
+        receipt_printer = printer.Printer()
+        receipt_printer.company_template = mock.MagicMock(wraps=receipt_printer.company_template)
+        company = factories.CompanyFactory(name='Codear SRL')
+        receipts = factories.ReceiptFactory.build_batch(
+            3,
+            company=company,
+            backend=afip.AFIPBackend('', '', ''),
+        )
+
+        for receipt in receipts:
+            receipt.number = 1
+            receipt.cae = fake.numerify(text='##############')
+            receipt.cae_expiration = datetime.now()
+
+        # act
+        invoices = [receipt_printer.render(receipt) for receipt in receipts]
+
+        # assert
+        receipt_printer.company_template.make_module.assert_called_once()
+        self.assertTrue(all(company.name in invoice for invoice in invoices))
+        weasyprint.CSS.assert_called_once()
+
+    def test_should_print_receipts_as_pages_of_one_document(self, weasyprint):
+        # arrange
+        receipt_printer = printer.Printer()
+        documents = [mock.MagicMock(pages=[mock.sentinel.first, mock.sentinel.second])]
+        documents.append(mock.MagicMock(pages=[mock.sentinel.third]))
+        weasyprint.HTML.return_value.render.side_effect = documents
+        receipts = factories.ReceiptFactory.build_batch(2, backend=afip.AFIPBackend('', '', ''))
+
+        for receipt in receipts:
+            receipt.number = 1
+            receipt.cae = fake.numerify(text='##############')
+            receipt.cae_expiration = datetime.now()
+
+        # act
+        buffer = receipt_printer.print_combined(iter(receipts))
+
+        # assert
+        documents[0].copy.assert_called_once_with(
+            [mock.sentinel.first, mock.sentinel.second, mock.sentinel.third],
+        )
+        documents[0].copy.return_value.write_pdf.assert_called_once_with(buffer)
+
+    def test_should_report_each_printing_phase_to_the_collector(self, weasyprint):
+        # arrange
+        collector = test_metrics.RecordingCollector()
+        test_metrics.collect(self, collector)
+        receipt_printer = printer.Printer()
+        receipt = factories.ReceiptFactory(backend=afip.AFIPBackend('', '', ''))
+        receipt.number = 1
+        receipt.cae = fake.numerify(text='##############')
+        receipt.cae_expiration = datetime.now()
+
+        # act
+        receipt_printer.print(receipt)
+
+        # assert
+        self.assertEqual([event[:2] for event in collector.events], [
+            ('timing', 'receipt.qr'),
+            ('timing', 'receipt.barcode'),
+            ('timing', 'printer.render'),
+            ('size', 'printer.html'),
+            ('timing', 'printer.layout'),
+            ('timing', 'printer.write'),
+        ])
+
+    def test_should_not_print_empty_documents(self, weasyprint):
+        # act
+        with self.assertRaises(printer.NothingToPrintError):
+            printer.Printer().print_combined([])
+
+
+class PrinterPrintManyTestCase(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.printer = printer.Printer()
+        self.receipts = factories.ReceiptFactory.build_batch(
+            3,
+            backend=afip.AFIPBackend('', '', ''),
+        )
+
+        for number, receipt in enumerate(self.receipts, 1):
+            receipt.number = number
+            receipt.cae = fake.numerify(text='##############')
+            receipt.cae_expiration = datetime.now()
+
+    def test_should_write_each_receipt_to_the_output_dir(self):
+        # act
+        results = list(self.printer.print_many(self.receipts, self.directory.name, workers=2))
+
+        # assert
+        self.assertTrue(all(result.ok for result in results))
+        self.assertEqual(
+            sorted(os.listdir(self.directory.name)),
+            sorted(self.printer.filename(receipt) for receipt in self.receipts),
+        )
+
+    def test_should_report_errors_without_stopping_the_batch(self):
+        # arrange
+        self.receipts[1].number = None
+        sink = mock.MagicMock()
+
+        # act
+        results = list(self.printer.print_many(self.receipts, sink=sink, workers=2))
+
+        # assert
+        failed = [result.receipt for result in results if not result.ok]
+        self.assertEqual(failed, [self.receipts[1]])
+        self.assertEqual(sink.call_count, 2)
+
+    def test_should_print_with_the_configuration_of_the_printer(self):
+        # arrange
+        configured_printer = printer.Printer(
+            asset_cache_dir=self.directory.name,
+            allow_remote_assets=True,
+        )
+        self.addCleanup(setattr, printer.printer, '_worker_printer', None)
+
+        # act
+        # workers run in this process, so the printer they build can be checked
+        with mock.patch.object(printer.printer.process, 'ProcessPoolExecutor', ThreadPoolExecutor):
+            results = list(configured_printer.print_many(self.receipts, workers=1))
+
+        # assert
+        self.assertTrue(all(result.ok for result in results))
+        worker_printer = printer.printer._worker_printer
+        self.assertIsNot(worker_printer, configured_printer)
+        self.assertEqual(worker_printer.url_fetcher.cache_dir, self.directory.name)
+        self.assertTrue(worker_printer.url_fetcher.allow_remote)
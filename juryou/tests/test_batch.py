@@ -0,0 +1,62 @@
+from datetime import datetime
+from decimal import Decimal
+from unittest import mock, TestCase
+
+from juryou import batch
+from juryou.customer import Customer
+from juryou.tests import factories
+
+
+class ReceiptBatchTestCase(TestCase):
+    def setUp(self):
+        self.backend = mock.MagicMock()
+        self.batch = batch.ReceiptBatch(factories.CompanyFactory(), self.backend)
+
+    def test_should_build_receipts_from_columns(self):
+        # arrange
+        receipt = factories.ReceiptFactory(
+            company=self.batch.company,
+            backend=self.backend,
+            items=[{'name': 'Item', 'amount': 3, 'price': Decimal('150.5')}],
+        )
+        receipt.date = datetime(2020, 3, 9)
+        receipt.number = 5
+        receipt.cae = '71000000000001'
+        receipt.cae_expiration = datetime(2020, 3, 19)
+
+        # act
+        index = self.batch.add(receipt)
+        stored = self.batch.receipt(index)
+
+        # assert
+        self.assertEqual(stored.total, Decimal('451.5'))
+        self.assertEqual(
+            int(stored.customer.identity_document),
+            int(receipt.customer.identity_document),
+        )
+        self.assertEqual(stored.point_of_sale, receipt.point_of_sale)
+        self.assertEqual(stored.date, datetime(2020, 3, 9))
+        self.assertEqual(stored.number, 5)
+        self.assertEqual(stored.cae, '71000000000001')
+        self.assertEqual(stored.cae_expiration, datetime(2020, 3, 19))
+
+    def test_should_commit_pending_receipts_in_chunks(self):
+        # arrange
+        for document in range(5):
+            self.batch.append(Customer(str(20000000 + document), 'Name'), Decimal('10'), 1)
+
+        def commit_many(receipts):
+            for number, receipt in enumerate(receipts, 1):
+                receipt.number = number
+                receipt.cae = '71000000000001'
+                receipt.cae_expiration = datetime(2020, 3, 19)
+
+        self.backend.commit_many.side_effect = commit_many
+
+        # act
+        self.batch.commit(chunk_size=2)
+
+        # assert
+        self.assertEqual(self.backend.commit_many.call_count, 3)
+        self.assertEqual(list(self.batch.pending()), [])
+        self.assertEqual(list(self.batch.numbers), [1, 2, 1, 2, 1])
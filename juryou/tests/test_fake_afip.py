@@ -0,0 +1,239 @@
+import asyncio
+import tempfile
+from datetime import datetime, timedelta
+from unittest import mock, TestCase
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+
+from juryou.backend import afip, afip_async, credentials, resilience, wsdl
+from juryou.fake_afip import FakeAFIP
+from juryou.tests import factories, test_metrics
+
+
+def create_credentials():
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'juryou')])
+    certificate = x509.CertificateBuilder().subject_name(
+        name,
+    ).issuer_name(
+        name,
+    ).public_key(
+        private_key.public_key(),
+    ).serial_number(
+        x509.random_serial_number(),
+    ).not_valid_before(
+        datetime.utcnow(),
+    ).not_valid_after(
+        datetime.utcnow() + timedelta(days=1),
+    ).sign(private_key, hashes.SHA256())
+
+    return (
+        certificate.public_bytes(serialization.Encoding.PEM).decode('latin1'),
+        private_key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.TraditionalOpenSSL,
+            serialization.NoEncryption(),
+        ).decode('latin1'),
+    )
+
+
+def run(coroutine):
+    return asyncio.get_event_loop().run_until_complete(coroutine)
+
+
+class FakeAFIPTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.certificate, cls.private_key = create_credentials()
+
+    def setUp(self):
+        self.server = FakeAFIP(seed=0)
+        self.server.start()
+        self.addCleanup(self.server.stop)
+
+    def _async_backend(self):
+        backend = afip_async.AsyncAFIPBackend(
+            self.certificate,
+            self.private_key,
+            '20111111112',
+            credential_store=credentials.MemoryCredentialStore(),
+            retry_policy=resilience.RetryPolicy(attempts=5, base_delay=0),
+        )
+        backend.wsaa_url = self.server.wsaa_url
+        backend.wsfev1_url = self.server.wsfev1_url
+        self.addCleanup(run, backend.close())
+
+        return backend
+
+    def _sync_backend(self):
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        backend = afip.AFIPBackend(
+            self.certificate,
+            self.private_key,
+            '20111111112',
+            cache=wsdl.WSDLCache(cache_dir.name),
+            credential_store=credentials.MemoryCredentialStore(),
+            refresh_credentials=False,
+            retry_policy=resilience.RetryPolicy(attempts=5, base_delay=0),
+        )
+        backend.wsaa_url = self.server.wsaa_wsdl_url
+        backend.wsfev1_url = self.server.wsfev1_wsdl_url
+        # py3simplesoap verifies certificates against httplib2's bundle, whatever it's told
+        patcher = mock.patch('httplib2.CA_CERTS', self.server.certificate_path)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        return backend
+
+    def test_should_commit_and_fetch_through_the_sync_backend(self):
+        # arrange
+        backend = self._sync_backend()
+        receipt = factories.ReceiptFactory(backend=backend, point_of_sale=1)
+        receipts = [factories.ReceiptFactory(backend=backend, point_of_sale=1) for _ in range(3)]
+
+        # act
+        backend.commit(receipt)
+        backend.commit_many(receipts)
+        fetched_receipt = backend.fetch(f'1:{receipt.type}:1')
+
+        # assert
+        self.assertEqual(receipt.number, 1)
+        self.assertEqual([pending.number for pending in receipts], [2, 3, 4])
+        self.assertTrue(all(pending.cae for pending in [receipt, *receipts]))
+        self.assertEqual(fetched_receipt.cae, receipt.cae)
+        self.assertEqual(
+            int(fetched_receipt.customer.identity_document),
+            int(receipt.customer.identity_document),
+        )
+        self.assertEqual(self.server.requests['loginCms'], 1)
+
+    def test_should_authorize_documents_with_leading_zeros(self):
+        # arrange
+        backend = self._sync_backend()
+        receipts = [
+            factories.ReceiptFactory(
+                backend=backend,
+                point_of_sale=1,
+                customer=factories.CustomerFactory(identity_document='01234567'),
+            )
+            for _ in range(2)
+        ]
+
+        # act
+        backend.commit(receipts[0])
+        backend.commit_many(receipts[1:])
+
+        # assert
+        self.assertEqual([receipt.number for receipt in receipts], [1, 2])
+        self.assertTrue(all(receipt.cae for receipt in receipts))
+
+    def test_should_commit_and_fetch_through_the_async_backend(self):
+        # arrange
+        backend = self._async_backend()
+        receipts = [factories.ReceiptFactory(backend=backend, point_of_sale=1) for _ in range(3)]
+
+        # act
+        run(backend.commit_many(receipts))
+        fetched_receipts = run(backend.fetch_last(f'1:{receipts[0].type}', 3))
+
+        # assert
+        self.assertEqual([receipt.number for receipt in receipts], [1, 2, 3])
+        self.assertEqual(
+            [receipt.cae for receipt in fetched_receipts],
+            [receipt.cae for receipt in reversed(receipts)],
+        )
+
+    def _phases(self, collector):
+        return [
+            (name, tags.get('service') or tags.get('operation'))
+            for kind, name, _, tags in collector.events
+            if kind == 'timing'
+        ]
+
+    def _payload_operations(self, collector):
+        return {
+            tags['operation']
+            for kind, name, size, tags in collector.events
+            if name == 'afip.payload' and size > 0
+        }
+
+    def test_should_measure_each_phase_of_a_sync_commit(self):
+        # arrange
+        collector = test_metrics.RecordingCollector()
+        test_metrics.collect(self, collector)
+        backend = self._sync_backend()
+
+        # act
+        backend.commit(factories.ReceiptFactory(backend=backend, point_of_sale=1))
+
+        # assert
+        self.assertEqual(self._phases(collector), [
+            ('afip.sign', None),
+            ('afip.connect', 'wsaa'),
+            ('afip.request', 'loginCms'),
+            ('afip.login', None),
+            ('afip.connect', 'wsfev1'),
+            ('afip.request', 'FECompUltimoAutorizado'),
+            ('afip.request', 'FECAESolicitar'),
+        ])
+        self.assertEqual(
+            self._payload_operations(collector),
+            {'loginCms', 'FECompUltimoAutorizado', 'FECAESolicitar'},
+        )
+
+    def test_should_measure_each_phase_of_an_async_commit(self):
+        # arrange
+        collector = test_metrics.RecordingCollector()
+        test_metrics.collect(self, collector)
+        backend = self._async_backend()
+
+        # act
+        run(backend.commit(factories.ReceiptFactory(backend=backend, point_of_sale=1)))
+
+        # assert
+        self.assertEqual(self._phases(collector), [
+            ('afip.sign', None),
+            ('afip.request', 'loginCms'),
+            ('afip.login', None),
+            ('afip.request', 'FECompUltimoAutorizado'),
+            ('afip.request', 'FECAESolicitar'),
+        ])
+        self.assertEqual(
+            self._payload_operations(collector),
+            {'loginCms', 'FECompUltimoAutorizado', 'FECAESolicitar'},
+        )
+
+    def test_should_authorize_each_receipt_once_when_sync_responses_are_lost(self):
+        # arrange
+        backend = self._sync_backend()
+        backend.commit(factories.ReceiptFactory(backend=backend, point_of_sale=1))
+        self.server.drop_rate = 0.3
+        receipts = [factories.ReceiptFactory(backend=backend, point_of_sale=1) for _ in range(10)]
+
+        # act
+        for receipt in receipts:
+            backend.commit(receipt)
+
+        # assert
+        self.assertEqual([receipt.number for receipt in receipts], list(range(2, 12)))
+        self.assertTrue(all(receipt.cae for receipt in receipts))
+        self.assertEqual(len(self.server.receipts), 11)
+
+    def test_should_authorize_each_receipt_once_when_responses_are_lost(self):
+        # arrange
+        self.server.drop_rate = 0.3
+        backend = self._async_backend()
+        receipts = [factories.ReceiptFactory(backend=backend, point_of_sale=1) for _ in range(10)]
+
+        # act
+        run(backend.commit_many(receipts))
+
+        # assert
+        self.assertEqual([receipt.number for receipt in receipts], list(range(1, 11)))
+        self.assertTrue(all(receipt.cae for receipt in receipts))
+        self.assertEqual(self.server.requests['FECAESolicitar'], 10)
+        self.assertEqual(len(self.server.receipts), 10)
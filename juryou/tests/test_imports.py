@@ -0,0 +1,58 @@
+import subprocess
+import sys
+from unittest import TestCase
+
+HEAVY_MODULES = ('weasyprint', 'jinja2', 'py3afipws', 'cryptography', 'asyncio')
+
+
+class LazyImportsTestCase(TestCase):
+    def _imported(self, code):
+        result = subprocess.run(
+            [sys.executable, '-c', f'{code}; import sys; print(" ".join(sys.modules))'],
+            stdout=subprocess.PIPE,
+            universal_newlines=True,
+            check=True,
+        )
+
+        return set(result.stdout.split())
+
+    def test_should_not_import_dependencies_with_the_package(self):
+        # act
+        imported = self._imported('import juryou; juryou.Receipt; juryou.AFIPBackend')
+
+        # assert
+        self.assertEqual(imported & set(HEAVY_MODULES), set())
+
+    def test_should_not_import_dependencies_with_the_backends(self):
+        # act
+        imported = self._imported('import juryou.backend; juryou.backend.AFIPBackend')
+
+        # assert
+        self.assertEqual(imported & set(HEAVY_MODULES), set())
+
+    def test_should_import_the_backends_without_fcntl(self):
+        # act
+        # as on Windows, which doesn't have it
+        imported = self._imported(
+            'import sys; sys.modules["fcntl"] = None; '
+            'import juryou.backend; juryou.backend.MemorySequencer()',
+        )
+
+        # assert
+        self.assertIn('juryou.backend.sequencer', imported)
+
+    def test_should_import_exported_names_on_first_use(self):
+        # act
+        imported = self._imported('from juryou import Company')
+
+        # assert
+        self.assertIn('juryou.company', imported)
+        self.assertNotIn('juryou.receipt', imported)
+
+    def test_should_raise_attribute_error_for_unknown_names(self):
+        # arrange
+        import juryou
+
+        # act
+        with self.assertRaises(AttributeError):
+            juryou.Unknown
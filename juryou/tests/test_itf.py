@@ -0,0 +1,30 @@
+from unittest import TestCase
+
+from juryou import itf
+
+
+class ITFTestCase(TestCase):
+    def test_should_interleave_bars_and_spaces(self):
+        # act
+        widths = itf.encode('12')
+
+        # assert
+        # 1 is wnnnw in the bars, 2 is nwnnw in the spaces
+        self.assertEqual(widths, [2, 2, 2, 2, 5, 2, 2, 5, 2, 2, 2, 2, 5, 5, 5, 2, 2])
+
+    def test_should_pad_odd_codes(self):
+        # assert
+        self.assertEqual(itf.encode('5'), itf.encode('05'))
+
+    def test_should_reject_non_numeric_codes(self):
+        # act
+        with self.assertRaises(itf.InvalidCodeError):
+            itf.encode('12a4')
+
+    def test_should_draw_every_bar(self):
+        # act
+        svg = itf.svg('1234')
+
+        # assert
+        self.assertEqual(svg.count('z"') + svg.count('zM'), 14)
+        self.assertIn('>1234</text>', svg)
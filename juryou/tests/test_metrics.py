@@ -0,0 +1,163 @@
+import faker
+import json
+import urllib.request
+from unittest import mock, TestCase
+
+from juryou import metrics
+
+fake = faker.Faker()
+
+
+class RecordingCollector(metrics.BaseMetricsCollector):
+    def __init__(self):
+        self.events = []
+
+    def timing(self, name, seconds, tags):
+        self.events.append(('timing', name, seconds, tags))
+
+    def count(self, name, value, tags):
+        self.events.append(('count', name, value, tags))
+
+    def size(self, name, size, tags):
+        self.events.append(('size', name, size, tags))
+
+
+def collect(test_case: TestCase, collector: metrics.BaseMetricsCollector) -> None:
+    """ Report the measurements to `collector` until the test case ends. """
+    metrics.set_collector(collector)
+    test_case.addCleanup(metrics.set_collector, None)
+
+
+class MetricsTestCase(TestCase):
+    def test_should_not_measure_without_a_collector(self):
+        # arrange
+        perf_counter = mock.MagicMock()
+
+        # act
+        with mock.patch('juryou.metrics.time.perf_counter', perf_counter):
+            with metrics.timer('printer.render'):
+                pass
+
+        metrics.count('afip.receipts')
+
+        # assert
+        self.assertFalse(metrics.enabled())
+        perf_counter.assert_not_called()
+
+    def test_should_report_timings_with_their_status(self):
+        # arrange
+        collector = RecordingCollector()
+        collect(self, collector)
+
+        # act
+        with metrics.timer('afip.request', operation='FECAESolicitar'):
+            pass
+
+        with self.assertRaises(TimeoutError):
+            with metrics.timer('afip.request', operation='FECAESolicitar'):
+                raise TimeoutError()
+
+        # assert
+        self.assertEqual(
+            [(event[1], event[3]) for event in collector.events],
+            [
+                ('afip.request', {'operation': 'FECAESolicitar', 'status': 'ok'}),
+                ('afip.request', {'operation': 'FECAESolicitar', 'status': 'TimeoutError'}),
+            ],
+        )
+        self.assertTrue(all(event[2] >= 0 for event in collector.events))
+
+    def test_should_report_counts_and_sizes(self):
+        # arrange
+        collector = RecordingCollector()
+        collect(self, collector)
+        payload_size = fake.pyint()
+
+        # act
+        metrics.count('afip.errors', code='10016')
+        metrics.size('afip.payload', payload_size, direction='request')
+
+        # assert
+        self.assertEqual(collector.events, [
+            ('count', 'afip.errors', 1, {'code': '10016'}),
+            ('size', 'afip.payload', payload_size, {'direction': 'request'}),
+        ])
+
+
+class PrometheusCollectorTestCase(TestCase):
+    def test_should_expose_counters(self):
+        # arrange
+        collector = metrics.PrometheusCollector()
+
+        # act
+        collector.count('afip.errors', 1, {'code': '10016', 'operation': 'FECAESolicitar'})
+        collector.count('afip.errors', 2, {'code': '10016', 'operation': 'FECAESolicitar'})
+
+        # assert
+        self.assertEqual(collector.expose(), (
+            '# TYPE juryou_afip_errors_total counter\n'
+            'juryou_afip_errors_total{code="10016",operation="FECAESolicitar"} 3.0\n'
+        ))
+
+    def test_should_expose_histograms_with_cumulative_buckets(self):
+        # arrange
+        collector = metrics.PrometheusCollector(time_buckets=(0.1, 1))
+
+        # act
+        for seconds in (0.05, 0.1, 0.5, 2):
+            collector.timing('printer.layout', seconds, {'status': 'ok'})
+
+        # assert
+        self.assertEqual(collector.expose(), (
+            '# TYPE juryou_printer_layout_seconds histogram\n'
+            'juryou_printer_layout_seconds_bucket{status="ok",le="0.1"} 2\n'
+            'juryou_printer_layout_seconds_bucket{status="ok",le="1.0"} 3\n'
+            'juryou_printer_layout_seconds_bucket{status="ok",le="+Inf"} 4\n'
+            'juryou_printer_layout_seconds_sum{status="ok"} 2.65\n'
+            'juryou_printer_layout_seconds_count{status="ok"} 4\n'
+        ))
+
+    def test_should_escape_label_values(self):
+        # arrange
+        collector = metrics.PrometheusCollector()
+
+        # act
+        collector.count('afip.errors', 1, {'code': 'a "quoted"\\code\n'})
+
+        # assert
+        self.assertIn('{code="a \\"quoted\\"\\\\code\\n"}', collector.expose())
+
+    def test_should_serve_the_metrics_over_http(self):
+        # arrange
+        collector = metrics.PrometheusCollector()
+        collector.size('afip.payload', 512, {})
+        server = collector.serve(0, 'localhost')
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        # act
+        with urllib.request.urlopen(f'http://localhost:{server.server_port}/metrics') as response:
+            content_type = response.headers['Content-Type']
+            body = response.read().decode('utf-8')
+
+        # assert
+        self.assertEqual(content_type, metrics.PROMETHEUS_CONTENT_TYPE)
+        self.assertEqual(body, collector.expose())
+
+
+class LogCollectorTestCase(TestCase):
+    def test_should_log_each_measurement_as_json(self):
+        # arrange
+        collector = metrics.LogCollector()
+
+        # act
+        with self.assertLogs('juryou.metrics') as logs:
+            collector.timing('afip.login', 0.25, {'status': 'ok'})
+            collector.count('afip.receipts', 1, {'result': 'authorized'})
+
+        # assert
+        self.assertEqual([json.loads(record.getMessage()) for record in logs.records], [
+            {'metric': 'afip.login', 'seconds': 0.25, 'status': 'ok'},
+            {'metric': 'afip.receipts', 'count': 1, 'result': 'authorized'},
+        ])
+        self.assertEqual(logs.records[1].metric['result'], 'authorized')
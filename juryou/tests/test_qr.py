@@ -0,0 +1,46 @@
+from unittest import TestCase
+
+from juryou import qr
+
+FINDER_ROW = bytearray([1, 1, 1, 1, 1, 1, 1])
+
+
+class QRTestCase(TestCase):
+    def test_should_use_the_smallest_version(self):
+        # assert
+        self.assertEqual(qr.version_for(14, 'M'), 1)
+        self.assertEqual(qr.version_for(15, 'M'), 2)
+        self.assertEqual(qr.version_for(331, 'M'), 13)
+        self.assertEqual(qr.version_for(2953, 'L'), 40)
+
+    def test_should_reject_data_over_the_capacity(self):
+        # act
+        with self.assertRaises(qr.DataTooLongError):
+            qr.version_for(2332, 'M')
+
+    def test_should_draw_finder_patterns(self):
+        # act
+        modules = qr.encode(b'https://www.afip.gob.ar/fe/qr/')
+
+        # assert
+        size = len(modules)
+        self.assertEqual(size, 29)
+        self.assertEqual(modules[0][:7], FINDER_ROW)
+        self.assertEqual(modules[0][size - 7:], FINDER_ROW)
+        self.assertEqual(modules[size - 1][:7], FINDER_ROW)
+        self.assertEqual(modules[3][:7], bytearray([1, 0, 1, 1, 1, 0, 1]))
+
+    def test_should_draw_timing_patterns(self):
+        # act
+        modules = qr.encode(b'juryou')
+
+        # assert
+        self.assertEqual(modules[6][8:13], bytearray([1, 0, 1, 0, 1]))
+
+    def test_should_draw_dark_modules_as_a_single_path(self):
+        # act
+        svg = qr.svg(b'juryou')
+
+        # assert
+        self.assertEqual(svg.count('<path'), 1)
+        self.assertIn('viewBox="0 0 29 29"', svg)
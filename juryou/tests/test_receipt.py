@@ -0,0 +1,131 @@
+import faker
+import json
+from base64 import b64decode
+from decimal import Decimal
+from datetime import datetime
+from unittest import mock, TestCase
+
+from juryou.backend import afip
+from juryou.tests import factories
+
+fake = faker.Faker()
+
+
+class ReceiptCodeTestCase(TestCase):
+    def setUp(self):
+        self.receipt = factories.ReceiptFactory(backend=afip.AFIPBackend('', '', ''))
+        self.receipt.company.cuit = fake.numerify(text='###########')
+        self.receipt.cae = fake.numerify(text='##############')
+        self.receipt.date = datetime(2020, 3, 9)
+
+    def test_should_cache_the_barcode(self):
+        # arrange
+        with mock.patch('juryou.receipt.itf') as itf:
+            itf.svg.return_value = '<svg/>'
+
+            # act
+            first = self.receipt.barcode
+            second = self.receipt.barcode
+
+        # assert
+        itf.svg.assert_called_once_with(self.receipt.code)
+        self.assertEqual(first, second)
+
+    def test_should_refresh_the_code_when_the_cae_changes(self):
+        # arrange
+        code = self.receipt.code
+        barcode = self.receipt.barcode
+
+        # act
+        self.receipt.cae = fake.numerify(text='7#############')
+
+        # assert
+        self.assertNotEqual(self.receipt.code, code)
+        self.assertIn(self.receipt.cae, self.receipt.code)
+        self.assertNotEqual(self.receipt.barcode, barcode)
+
+
+class ReceiptQRTestCase(TestCase):
+    def setUp(self):
+        self.receipt = factories.ReceiptFactory(
+            backend=afip.AFIPBackend('', '', ''),
+            items=[{'name': 'Item', 'amount': 2, 'price': Decimal('10.25')}],
+        )
+        self.receipt.company.cuit = '30000000007'
+        self.receipt.customer.identity_document = '20000000001'
+        self.receipt.point_of_sale = 10
+        self.receipt.number = 94
+        self.receipt.cae = '70417054367476'
+        self.receipt.date = datetime(2020, 10, 13)
+
+    def test_should_encode_the_afip_payload(self):
+        # act
+        url = self.receipt.qr_url
+
+        # assert
+        prefix, payload = url.split('?p=')
+        self.assertEqual(prefix, 'https://www.afip.gob.ar/fe/qr/')
+        self.assertEqual(json.loads(b64decode(payload)), {
+            'ver': 1,
+            'fecha': '2020-10-13',
+            'cuit': 30000000007,
+            'ptoVta': 10,
+            'tipoCmp': 11,
+            'nroCmp': 94,
+            'importe': 20.5,
+            'moneda': 'PES',
+            'ctz': 1,
+            'tipoDocRec': 80,
+            'nroDocRec': 20000000001,
+            'tipoCodAut': 'E',
+            'codAut': 70417054367476,
+        })
+
+    def test_should_tell_caea_authorizations_apart(self):
+        # arrange
+        self.receipt.authorization_type = 'A'
+
+        # act
+        payload = json.loads(b64decode(self.receipt.qr_url.split('?p=')[1]))
+
+        # assert
+        self.assertEqual(payload['tipoCodAut'], 'A')
+
+    def test_should_cache_the_qr_until_the_receipt_changes(self):
+        # arrange
+        with mock.patch('juryou.receipt.qr') as qr:
+            qr.svg.return_value = '<svg/>'
+
+            # act
+            self.receipt.qr
+            self.receipt.qr
+            self.receipt.number = 95
+            self.receipt.qr
+
+        # assert
+        self.assertEqual(qr.svg.call_count, 2)
+
+
+class ReceiptTotalTestCase(TestCase):
+    def setUp(self):
+        self.receipt = factories.ReceiptFactory(
+            backend=afip.AFIPBackend('', '', ''),
+            items=[{'name': 'Item', 'amount': 2, 'price': Decimal('10.25')}],
+        )
+
+    def test_should_update_the_total_when_items_change(self):
+        # act
+        first = self.receipt.total
+        self.receipt.add_item('Other', 1, Decimal('1'))
+        second = self.receipt.total
+        self.receipt.clear_items()
+
+        # assert
+        self.assertEqual(first, Decimal('20.5'))
+        self.assertEqual(second, Decimal('21.5'))
+        self.assertEqual(self.receipt.total, Decimal('0'))
+
+    def test_should_not_accept_unknown_attributes(self):
+        # act
+        with self.assertRaises(AttributeError):
+            self.receipt.unknown = True
@@ -1,5 +1,93 @@
+import collections
+import contextlib
 import decimal
+import importlib
+import threading
+from concurrent.futures import Executor, ThreadPoolExecutor
+from types import ModuleType
+from typing import Any, Callable, Deque, Iterable, Iterator, List, Optional, Sequence, TypeVar
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+
+class LazyModule:
+    """ Stands for a module which is only imported when one of its attributes is first used.
+
+    Heavy dependencies (WeasyPrint, py3afipws) are bound to module globals through `lazy_import`,
+    so importing juryou doesn't import them, while they can still be patched as usual.
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module: Optional[ModuleType] = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, attribute: str) -> Any:
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+
+        return getattr(self._module, attribute)
+
+    def __repr__(self) -> str:
+        return f'<lazy module {self._name!r}>'
+
+
+def lazy_import(name: str) -> Any:
+    return LazyModule(name)
 
 
 def quantize_decimal(value, precision='0.01'):
     return value.quantize(decimal.Decimal(precision))
+
+
+def chunks(values: Sequence[T], size: int) -> Iterator[Sequence[T]]:
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def map_ordered(
+    function: Callable[[T], R],
+    values: Iterable[T],
+    workers: int,
+    executor: Optional[Executor] = None,
+) -> Iterator[R]:
+    """ Like `map`, but running `function` in a pool of `workers` threads.
+
+    Results are yielded in the same order as `values`, and at most `workers * 2` of them are
+    computed ahead of the consumer. A given `executor` is used instead of a new pool, and left
+    running.
+    """
+    if executor is None:
+        pool = ThreadPoolExecutor(max_workers=workers)
+    else:
+        pool = contextlib.nullcontext(executor)
+
+    with pool as executor:
+        pending: Deque = collections.deque()
+
+        for value in values:
+            pending.append(executor.submit(function, value))
+
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+
+
+def batched(values: Iterable[T], size: int) -> Iterator[List[T]]:
+    """ Like `chunks`, for iterables which are consumed lazily. """
+    batch: List[T] = []
+
+    for value in values:
+        batch.append(value)
+
+        if len(batch) >= size:
+            yield batch
+            batch = []
+
+    if batch:
+        yield batch
@@ -28,6 +28,9 @@ setup(
     packages=find_packages(),
     python_requires='>=3.7',
     install_requires=install_requires,
+    extras_require={
+        'async': ['aiohttp'],
+    },
     entry_points={
         'console_scripts': [
             'juryou=juryou.cli:main',